@@ -1,4 +1,4 @@
-from typing import Union, cast
+from typing import Optional, TextIO, Union, cast
 
 from directives import Org, Label, Directive, Equ, MemoryDirective, AddressDirective
 from expression import ExprContext, Expression
@@ -90,37 +90,49 @@ def second_pass(instructions: list[Union[Instruction, Directive]]) -> None:
                     params[element.param_name()] = params[element.param_name()] - (instruction.address + instruction.size())
 
 
-def assembler_output(instructions: list[Instruction]) -> None:
+# Listing of assembled instructions; with executed (Coverage.executed) every line starts with
+# '+' if instruction on it was executed, '-' if it was not and a space if it is not an instruction
+def assembler_output(instructions: list[Instruction], executed: Optional[bytes] = None, file: Optional[TextIO] = None) -> None:
+    def mark(i: int) -> str:
+        if executed is None:
+            return ""
+        instruction = instructions[i]
+        if isinstance(instruction, Label) and i + 1 < len(instructions):
+            instruction = instructions[i + 1]
+        if isinstance(instruction, Instruction):
+            return "+ " if executed[instruction.address & 0xffff] else "- "
+        return "  "
+
     has_label = False
-    for instruction in instructions:
+    for i, instruction in enumerate(instructions):
         if isinstance(instruction, Label):
             label = cast(Label, instruction)
-            print(f"0x{instruction.address:04x} {label.label:12} ", end="")
+            print(f"{mark(i)}0x{instruction.address:04x} {label.label:12} ", end="", file=file)
             has_label = True
         elif isinstance(instruction, Instruction):
             if has_label:
-                print(f"{instruction.to_str(2).strip()}")
+                print(f"{instruction.to_str(2).strip()}", file=file)
                 has_label = False
             else:
-                print(f"0x{instruction.address:04x}              {instruction.to_str(2).strip()}")
+                print(f"{mark(i)}0x{instruction.address:04x}              {instruction.to_str(2).strip()}", file=file)
         elif isinstance(instruction, MemoryDirective):
             if has_label:
-                print(f"{instruction.to_str(2).strip()}")
+                print(f"{instruction.to_str(2).strip()}", file=file)
                 has_label = False
             else:
-                print(f"0x{instruction.address:04x}              {instruction.to_str(2).strip()}")
+                print(f"{mark(i)}0x{instruction.address:04x}              {instruction.to_str(2).strip()}", file=file)
         elif isinstance(instruction, Equ):
             equ = cast(Equ, instruction)
-            print(f"       {equ.label:12} {equ.to_str(2)}")
+            print(f"{mark(i)}       {equ.label:12} {equ.to_str(2)}", file=file)
         elif isinstance(instruction, AddressDirective):
             if has_label:
-                print(f"{instruction.to_str(2)}")
+                print(f"{instruction.to_str(2)}", file=file)
                 has_label = False
             else:
-                print(f"0x{instruction.address:04x}              {instruction.to_str(2)}")
+                print(f"{mark(i)}0x{instruction.address:04x}              {instruction.to_str(2)}", file=file)
         else:
-            print(f"                    {instruction.to_str(2)}")
-    print()
+            print(f"{mark(i)}                    {instruction.to_str(2)}", file=file)
+    print(file=file)
 
 
 def populate_memory(instructions: list[Instruction], memory: bytes) -> tuple[int, int]:
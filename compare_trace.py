@@ -0,0 +1,40 @@
+import argparse
+import contextlib
+import os
+import sys
+
+# Keep standard output for the comparison only
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from spectrum.spectrum import Spectrum
+from utils.trace_compare import FIELDS, compare, file_chunks, live_chunks
+
+
+parser = argparse.ArgumentParser(description="Finds the first instruction where a run differs from a reference trace")
+parser.add_argument("trace", help="snapshot (.sna, .z80 or .szx) to run, or recorded trace (.npy)")
+parser.add_argument("reference", help="reference trace: .npy from record_trace.py or text log (Fuse, JSpeccy)")
+parser.add_argument("-f", "--frames", type=int, help="run at most this many frames")
+parser.add_argument("--fields", help=f"comma separated fields to compare (default all of the reference's: {','.join(FIELDS)})")
+parser.add_argument("-c", "--context", type=int, default=10, help="instructions shown before and after the difference")
+args = parser.parse_args()
+
+reference, fields = file_chunks(args.reference)
+if args.fields:
+    fields = tuple(name for name in args.fields.split(",") if name in fields)
+
+if args.trace.endswith(".npy"):
+    trace, _ = file_chunks(args.trace)
+else:
+    spectrum = Spectrum()
+    with contextlib.redirect_stdout(sys.stderr):
+        spectrum.init()
+    spectrum.rendering = False
+    spectrum.load_snapshot(args.trace)
+    trace = live_chunks(spectrum, args.frames)
+
+divergence = compare(trace, reference, fields, args.context)
+if divergence is None:
+    print(f"No difference in {', '.join(fields)}")
+else:
+    print(divergence)
+    sys.exit(1)
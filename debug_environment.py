@@ -2,15 +2,15 @@ import os.path
 
 from typing import Optional, Callable
 
-import time
-
 import pygame
 from pygame import Surface, Rect
 
 from emulator_state import EmulatorState
+from gui.frame_budget_component import FrameBudgetComponent
 from gui.help_modal import HelpModal
 from gui.hexdump import HexDumpComponent
 from gui.internal_debug_component import InternalDebugComponent
+from gui.memory_heatmap_component import MemoryHeatmapComponent
 from gui.modal import Modal
 from gui.profile_component import ProfileComponent
 from gui.registers_component import RegistersComponent
@@ -21,7 +21,12 @@ from gui.components import UIAdapter
 from spectrum.keyboard import Keyboard
 from spectrum.spectrum import Spectrum
 from spectrum.video import COLORS, TSTATES_PER_INTERRUPT, FULL_SCREEN_WIDTH, FULL_SCREEN_HEIGHT, Video
+from utils.debugger import Debugger
+from utils.frame_budget import FrameBudget
+from utils.frame_pacer import FramePacer, UNLIMITED
+from utils.memory_heatmap import MemoryHeatmap
 from utils.playback import Playback
+from utils.write_journal import WriteJournal
 
 CAPTION = "ZX Spectrum 48k Emulator"
 KEY_REPEAT_INITIAL_DELAY = 10
@@ -32,8 +37,8 @@ class DebugEnvironment:
     def __init__(self, spectrum: Spectrum, show_fps: bool = True) -> None:
         self.show_fps = show_fps
 
-        self.fast = False
-        self.max_fps = False
+        self._fast = False
+        self._max_fps = False
 
         self._ratio = 2
 
@@ -42,8 +47,13 @@ class DebugEnvironment:
         self.keyboard: Keyboard = spectrum.keyboard
 
         self.playback = Playback(self.spectrum)
+        self.journal = WriteJournal(self.spectrum)
+        self.debugger = Debugger(self.spectrum)
+        self.budget = FrameBudget(self.spectrum)
+        self.heatmap = MemoryHeatmap(self.spectrum)
+        self._show_heatmap = False
 
-        self.video_clock = pygame.time.Clock()
+        self.pacer = FramePacer()
 
         self.screen: Optional[Surface] = None
         self.pre_screen: Optional[Surface] = None
@@ -128,6 +138,13 @@ class DebugEnvironment:
         )
         self.top_component.add_component(self.stack_pointer_dump)
 
+        self.budget_component = FrameBudgetComponent(Rect(
+                self.internal_debug_component.rect.x, self.internal_debug_component.rect.y + 25, self.central_column_width, 60
+            ),
+            self.budget
+        )
+        self.top_component.add_component(self.budget_component)
+
         self.profile_component = ProfileComponent(Rect(
                 self.memory_dump.rect.right + 10, self.memory_dump.rect.top,
                 self.screen_size[0] - self.memory_dump.rect.right - 15, self.screen_size[1] - self.memory_dump.rect.top - 5
@@ -137,6 +154,14 @@ class DebugEnvironment:
         )
         self.top_component.add_component(self.profile_component)
 
+        # Shown over profile (which is drawn only while paused) while running
+        self.heatmap_component = MemoryHeatmapComponent(
+            Rect(self.profile_component.rect.x + 10, self.profile_component.rect.y + 10, 256, 256),
+            self.ui_factory,
+            self.heatmap,
+            self.spectrum.z80
+        )
+
         def close_modal(*_) -> None: self.top_component.hide_modal()
 
         self._help_modal = HelpModal(self.top_component.rect, ui_factory=self.ui_factory, close_modal=close_modal)
@@ -151,15 +176,14 @@ class DebugEnvironment:
         self._show_trace = True
 
         self._fast_counter = 0
-        self._last_frame = 0
-        self._last_tstates = 0
-        self._last_time = time.time()
-        self.spare_time = [0] * 50
 
         self.key_down_methods: dict[int, Callable[[int, int], bool]] = {
             pygame.K_F1: self.key_help,
             pygame.K_F2: self.key_pause,
             pygame.K_F6: self.key_profile,
+            pygame.K_F7: self.key_heatmap,
+            pygame.K_F8: self.key_budget,
+            pygame.K_F9: self.key_breakpoint,
             pygame.K_SLASH: self.key_help,
             pygame.K_LEFT: self.key_left,
             pygame.K_RIGHT: self.key_right
@@ -189,6 +213,29 @@ class DebugEnvironment:
         pygame.display.set_icon(icon)
         pygame.display.flip()
 
+    @property
+    def fast(self) -> bool: return self._fast
+
+    @fast.setter
+    def fast(self, fast: bool) -> None:
+        self._fast = fast
+        self._fast_counter = 0
+        self._update_pacer_speed()
+
+    @property
+    def max_fps(self) -> bool: return self._max_fps
+
+    @max_fps.setter
+    def max_fps(self, max_fps: bool) -> None:
+        self._max_fps = max_fps
+        self._update_pacer_speed()
+
+    def _update_pacer_speed(self) -> None:
+        if self._fast:
+            self.pacer.speed = UNLIMITED
+        else:
+            self.pacer.speed = 4 if self._max_fps else 1
+
     @property
     def ratio(self) -> int: return self._ratio
 
@@ -205,6 +252,28 @@ class DebugEnvironment:
         self._show_trace = show_trace
         self.spectrum_screen_component.show_trace = show_trace
 
+    @property
+    def show_heatmap(self) -> bool: return self._show_heatmap
+
+    @show_heatmap.setter
+    def show_heatmap(self, show_heatmap: bool) -> None:
+        # Accesses are counted only while heatmap is shown
+        self._show_heatmap = show_heatmap
+        self.heatmap.clear()
+        self.spectrum.heatmap = show_heatmap
+
+    @property
+    def show_budget(self) -> bool: return self.budget.active
+
+    @show_budget.setter
+    def show_budget(self, show_budget: bool) -> None:
+        # Budget hooks opcodes and turns accounting bus on, so it runs only while shown
+        if show_budget:
+            self.budget.clear()
+            self.budget.start()
+        else:
+            self.budget.stop()
+
     @property
     def state(self) -> EmulatorState: return self._state
 
@@ -214,56 +283,49 @@ class DebugEnvironment:
         self.state_label.text = state.value
         self.spectrum_screen_component.state = state
 
-    def update(self, frames: int, tstates: int) -> None:
-        pygame.transform.scale(self.spectrum.video.zx_screen_with_border, self.scaled_spectrum_screen_size(), self.pre_screen)
+    def update(self) -> None:
+        self.pacer.cpu_done()
 
-        if self.state == EmulatorState.RUNNING:
-            self.spectrum_screen_component.draw(self.screen)
-            self.state_label.draw(self.screen)
-
-        video_frame = False
+        # In fast mode emulation is not paced and only every 200th frame is presented
+        video_frame = True
         if self.fast:
-            if self._fast_counter <= 0:
-                self.video_clock.tick(50)
-                pygame.display.flip()
+            video_frame = self._fast_counter <= 0
+            if video_frame:
                 self._fast_counter = 200
-                video_frame = True
             self._fast_counter -= 1
-        else:
-            video_frame = True
-
-        now = time.time()
-        self.video_clock.tick(200 if self.max_fps else 50)
 
         if video_frame:
-            if self.show_fps:
-                total_tstates = (frames - self._last_frame) * TSTATES_PER_INTERRUPT + (tstates - self._last_tstates)
-                speed = (total_tstates / (TSTATES_PER_INTERRUPT * (now - self._last_time) * 50)) * 100
-
-                self._last_frame = frames
-                self._last_tstates = tstates
-                self._last_time = now
+            pygame.transform.scale(self.spectrum.video.zx_screen_with_border, self.scaled_spectrum_screen_size(), self.pre_screen)
 
-                time_difference = time.time() - now
-                self.spare_time[0:-1] = self.spare_time[1:]
-                self.spare_time[-1] = int(time_difference * 100000 / 20)
-                spare_time = int(sum(self.spare_time) / len(self.spare_time))
+            if self.state == EmulatorState.RUNNING:
+                self.spectrum_screen_component.draw(self.screen)
+                self.state_label.draw(self.screen)
+                if self.show_budget:
+                    self.budget_component.draw(self.screen)
+                if self.show_heatmap:
+                    self.heatmap_component.draw(self.screen)
 
+            if self.show_fps:
                 if self.fast:
-                    pygame.display.set_caption(f'{CAPTION} - {self.video_clock.get_fps():.2f} FPS, Speed: {speed:0.1f}%')
+                    pygame.display.set_caption(f'{CAPTION} - {self.pacer.fps():.2f} FPS, Speed: {self.pacer.speed_percent():0.1f}%')
                 elif self.state == EmulatorState.RUNNING:
-                    pygame.display.set_caption(f'{CAPTION} - {self.video_clock.get_fps():.2f} FPS, {spare_time: 4}%')
+                    pygame.display.set_caption(f'{CAPTION} - {self.pacer.fps():.2f} FPS, {self.pacer.spare_percent(): 4.0f}%, late: {self.pacer.late_frames}')
                 else:
                     pygame.display.set_caption(f'{CAPTION} - PAUSED')
 
             pygame.display.flip()
 
+        self.pacer.present_done()
+        self.pacer.wait()
+
     def key_left(self, _: int, key_mods: int) -> bool:
         if self.state == EmulatorState.PAUSED:
-            if key_mods & pygame.KMOD_SHIFT != 0:
-                self.playback.restore_previous(100)
+            count = 100 if key_mods & pygame.KMOD_SHIFT != 0 else 1
+            # Instructions stepped in this pause are undone through write journal, older history comes from playback
+            if len(self.journal) > 0:
+                self.journal.step_back(count)
             else:
-                self.playback.restore_previous()
+                self.playback.restore_previous(count)
 
             return True
         return False
@@ -289,6 +351,19 @@ class DebugEnvironment:
             self.state = EmulatorState.PROFILE
         return False
 
+    def key_heatmap(self, _: int, _key_mods: int) -> bool:
+        self.show_heatmap = not self.show_heatmap
+        return False
+
+    def key_budget(self, _: int, _key_mods: int) -> bool:
+        self.show_budget = not self.show_budget
+        return False
+
+    def key_breakpoint(self, _: int, _key_mods: int) -> bool:
+        if self.state == EmulatorState.PAUSED:
+            self.debugger.toggle_breakpoint(self.spectrum.z80.regPC)
+        return False
+
     def key_help(self, _: int, _key_mods: int) -> bool:
         if self.top_component.modal_component:
             self.top_component.hide_modal()
@@ -299,14 +374,18 @@ class DebugEnvironment:
     def key_pause(self, _: int, _key_mods: int) -> bool:
         self.state = EmulatorState.RUNNING if self.state == EmulatorState.PAUSED else EmulatorState.PAUSED
         if self.state == EmulatorState.PAUSED:
-            self.playback.reset()
-            self.playback.record()
-            self.spectrum.profile(TSTATES_PER_INTERRUPT)
-            self.playback.restore_first()
-            self.profile_component.set_tstates(self.spectrum.bus_access.tstates)
-            self.profile_component.redraw()
+            self.pause()
         return False
 
+    def pause(self) -> None:
+        self.playback.reset()
+        self.playback.record()
+        self.journal.clear()
+        self.spectrum.profile(TSTATES_PER_INTERRUPT)
+        self.playback.restore_first()
+        self.profile_component.set_tstates(self.spectrum.bus_access.tstates)
+        self.profile_component.redraw()
+
     def process_keyboard(self) -> None:
         pygame.event.pump()
         self._current_key_mods = pygame.key.get_mods()
@@ -351,24 +430,34 @@ class DebugEnvironment:
                 self._key_repeat_method(self._key_repeat_method_key, self._key_repeat_method_key_mods)
 
     def process_interrupt(self) -> None:
+        if self.show_budget:
+            self.budget.end_frame()
+        if self.show_heatmap:
+            self.heatmap.end_frame()
         self.spectrum.end_frame()
         self.process_keyboard()
         if self.state != EmulatorState.RUNNING:
             self.update_ui()
         else:
-            self.update(self.spectrum.bus_access.frames, self.spectrum.bus_access.tstates)
+            self.update()
 
     def update_ui(self) -> None:
         self.screen.fill((0, 0, 0))
         self.ui_adapter.draw(self.screen)
-        self.update(self.spectrum.bus_access.frames, self.spectrum.bus_access.tstates)
+        self.update()
 
     def run(self) -> None:
         try:
             while True:
                 if self.state == EmulatorState.RUNNING:
+                    # Stepping left journaling bus on; this selects back accounting or heatmap bus if they are on
+                    self.spectrum.journaling = False
                     while self.state == EmulatorState.RUNNING:
-                        self.spectrum.execute(TSTATES_PER_INTERRUPT)
+                        # Breakpoint or watchpoint stops in the middle of the frame
+                        if self.debugger.execute(TSTATES_PER_INTERRUPT) is not None:
+                            self.state = EmulatorState.PAUSED
+                            self.pause()
+                            break
                         self.process_interrupt()
                     self.playback.record()
                 elif self.state == EmulatorState.PAUSED:
@@ -377,6 +466,8 @@ class DebugEnvironment:
                         self.update_ui()
                         self.process_keyboard()
                 elif self.state == EmulatorState.ONE_FRAME:
+                    self.spectrum.journaling = False
+                    self.journal.clear()
                     self.spectrum.execute(TSTATES_PER_INTERRUPT)
                     self.playback.reset()
                     self.process_interrupt()
@@ -387,15 +478,15 @@ class DebugEnvironment:
                 #     self.process_interrupt()
                 #     self.state = EmulatorState.PAUSED
                 elif self.state == EmulatorState.STEPPING:
+                    self.spectrum.journaling = True
                     while self._step != 0 and self.state == EmulatorState.STEPPING:
-                        if self.spectrum.execute_one_instruction():
+                        if self.journal.step():
                             self.process_interrupt()
                         if self._step > 0:
                             self._step -= 1
-                        self.playback.record()
                     self.profile_component.set_tstates(self.spectrum.bus_access.tstates)
                     self.spectrum.update_screen()
-                    self.update(self.spectrum.bus_access.frames, self.spectrum.bus_access.tstates)
+                    self.update()
                     self.state = EmulatorState.PAUSED
 
         except KeyboardInterrupt:
@@ -0,0 +1,43 @@
+from typing import Optional
+
+import numpy as np
+import pygame
+from pygame import Rect
+
+from gui.components import Component
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.frame_budget import FrameBudget
+
+BAR_WIDTH = 2
+
+# Colours of main loop, interrupt, halt and contention parts of bar (in order of FrameBudget.CATEGORIES)
+BAR_COLOURS = np.array([(64, 192, 64), (192, 64, 64), (48, 48, 96), (224, 192, 32)], dtype=np.uint8)
+BACKGROUND = np.array((0, 0, 0), dtype=np.uint8)
+
+
+# Stacked bar per frame of recent frames' budgets, newest on the right; full height is one
+# frame's T-states. Bars are rendered into pixel array at once (no draw call per bar).
+class FrameBudgetComponent(Component):
+    def __init__(self, rect: Optional[Rect], budget: FrameBudget) -> None:
+        super().__init__(rect)
+        self.budget = budget
+
+    def draw(self, surface) -> None:
+        width, height = self.rect.width, self.rect.height
+        frames = self.budget.recent(width // BAR_WIDTH)
+        pixels = np.empty((width, height, 3), dtype=np.uint8)
+        pixels[:] = BACKGROUND
+        if len(frames) > 0:
+            # Category boundaries in pixels from the bottom, clipped to the bar
+            tops = np.minimum(np.cumsum(frames, axis=1) * height // TSTATES_PER_INTERRUPT, height)
+            bottoms = np.concatenate((np.zeros((len(frames), 1), dtype=tops.dtype), tops[:, :-1]), axis=1)
+            y = np.arange(height)[::-1]
+            # Category of each pixel of each bar, -1 above the bar
+            categories = np.full((len(frames), height), -1, dtype=np.int8)
+            for category in range(frames.shape[1]):
+                inside = (y[None, :] >= bottoms[:, category, None]) & (y[None, :] < tops[:, category, None])
+                categories[inside] = category
+            bars = np.where(categories[:, :, None] >= 0, BAR_COLOURS[categories], BACKGROUND)
+            x = width - len(frames) * BAR_WIDTH
+            pixels[x:] = np.repeat(bars, BAR_WIDTH, axis=0)
+        surface.blit(pygame.surfarray.make_surface(pixels), self.rect)
@@ -32,6 +32,9 @@ class HelpModal(Panel):
                 "ESC - Menu (not working)",
                 "F1 - Help (this)",
                 "F2 - Pause/Unpause",
+                "F7 - Show/hide memory heatmap",
+                "F8 - Show/hide frame budget",
+                "F9 - Toggle breakpoint at PC",
                 "LEFT/RIGHT - previous/next instruction",
                 "SHIFT LEFT/RIGHT - previous/next 100 instructions",
                 "ALT LEFT/RIGHT - previous/next frame",
@@ -14,7 +14,7 @@ class InternalDebugComponent(Collection):
 
     def draw(self, surface) -> None:
         self.first_row_label.text = (
-            f"PB:{len(self.playback.backlog):06} "
+            f"PB:{len(self.playback):06} "
             f"Top:{self.playback.top:06} "
         )
         super().draw(surface)
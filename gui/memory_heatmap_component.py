@@ -0,0 +1,40 @@
+import pygame
+from pygame import Rect
+
+from gui.components import BaseUIFactory, Collection
+from utils.memory_heatmap import MemoryHeatmap, REGIONS
+from z80.z80_cpu import Z80CPU
+
+MAP_SIZE = 256
+LABEL_SPACING = 10
+TICK_COLOUR = (255, 255, 255)
+
+
+# Heatmap of memory accesses, a pixel per address and a row per page, with memory regions
+# labelled on the right and ticked on the left edge. Stack label follows SP.
+class MemoryHeatmapComponent(Collection):
+    def __init__(self, rect: Rect, ui_factory: BaseUIFactory, heatmap: MemoryHeatmap, z80: Z80CPU) -> None:
+        super().__init__(rect)
+        self.heatmap = heatmap
+        self.z80 = z80
+        label_x = rect.x + MAP_SIZE + 6
+        # Labels of regions starting within few rows are moved down to not overlap
+        y = rect.y
+        for name, start, _ in REGIONS:
+            y = max(y, rect.y + (start >> 8) - LABEL_SPACING // 2)
+            self.add_component(ui_factory.label(Rect(label_x, y, 0, 0), name, font=ui_factory.small_font))
+            y += LABEL_SPACING
+        self.stack_label = ui_factory.label(Rect(label_x, rect.y, 0, 0), "stack", font=ui_factory.small_font)
+        self.add_component(self.stack_label)
+
+    def draw(self, surface) -> None:
+        # Rows are pages, so image is transposed to pygame's (x, y) order
+        image = self.heatmap.image().transpose(1, 0, 2)
+        surface.blit(pygame.surfarray.make_surface(image), self.rect)
+        for _, start, _ in REGIONS:
+            y = self.rect.y + (start >> 8)
+            pygame.draw.line(surface, TICK_COLOUR, (self.rect.x - 4, y), (self.rect.x - 1, y))
+        stack_y = self.rect.y + (self.z80.regSP >> 8)
+        pygame.draw.line(surface, TICK_COLOUR, (self.rect.x + MAP_SIZE, stack_y), (self.rect.x + MAP_SIZE + 3, stack_y))
+        self.stack_label.rect.y = stack_y - LABEL_SPACING // 2
+        super().draw(surface)
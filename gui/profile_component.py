@@ -4,13 +4,13 @@ import pygame
 from pygame import Surface, Rect
 
 from gui.components import Collection, BaseUIFactory, TopDownLayout, LeftRightLayout
-from z80.instructions import Instruction
+from z80.instructions.profile import ProfiledInstructions
 
 SEPARATOR_HEIGHT = 3
 
 
 class ProfileComponent(Collection):
-    def __init__(self, rect: Optional[Rect], ui_factory: BaseUIFactory, instructions: list[Instruction]) -> None:
+    def __init__(self, rect: Optional[Rect], ui_factory: BaseUIFactory, instructions: ProfiledInstructions) -> None:
         super().__init__(rect)
         self._ui_factory = ui_factory
         self._surface: Optional[Surface] = None
@@ -67,15 +67,8 @@ class ProfileComponent(Collection):
         update_lines(self.profile)
 
     def _render(self) -> Surface:
-        error = False
-        found = False
-        selected_index = 0
-        while selected_index < len(self.instructions) and not error and not found:
-            if self.tstates == self.instructions[selected_index].tstates:
-                found = True
-            elif self.tstates < self.instructions[selected_index].tstates:
-                error = True
-            selected_index += 1
+        selected_index = self.instructions.index_of(self.tstates)
+        found = selected_index >= 0
 
         if self._surface is None:
             self._surface = Surface((self.rect.width, self.rect.height), flags=pygame.HWSURFACE)
@@ -97,7 +90,7 @@ class ProfileComponent(Collection):
             #     if selected_index == len(self.instructions) and len(self.instructions) > 0:
             #         self.lines.components[middle_line + 4].text = f"last_tstates={self.instructions[selected_index - 1].tstates}"
         else:
-            line_index = selected_index - middle_line - 1
+            line_index = selected_index - middle_line
 
             for i in range(len(self.lines.components)):
                 if line_index < 0 or line_index >= len(self.instructions):
@@ -5,7 +5,7 @@ from emulator_state import EmulatorState
 from gui.components import Component
 from gui.ui_size import UISize
 from spectrum.spectrum import Spectrum
-from spectrum.video import FULL_SCREEN_WIDTH, TSTATES_VERTICAL_RETRACE, FULL_SCREEN_HEIGHT, TSTATES_PER_LINE, TSTATES_HORIZONTAL_RETRACE, TSTATES_LEFT_BORDER, TSTATES_PER_INTERRUPT
+from spectrum.video import FULL_SCREEN_WIDTH, TSTATES_VERTICAL_RETRACE, FULL_SCREEN_HEIGHT, TSTATES_PER_LINE, TSTATES_HORIZONTAL_RETRACE, TSTATES_PER_INTERRUPT, raster_position
 
 
 MARGIN = 6
@@ -58,9 +58,7 @@ class SpectrumScreen(Component):
                 tstates -= TSTATES_PER_INTERRUPT
 
             if TSTATES_VERTICAL_RETRACE <= tstates:
-                local_ts = tstates - TSTATES_VERTICAL_RETRACE + TSTATES_LEFT_BORDER  # to correct for where the border happens
-                line = local_ts // TSTATES_PER_LINE
-                line_tstate = local_ts - line * TSTATES_PER_LINE
+                line, line_tstate = raster_position(tstates)
 
                 line *= self.ratio
                 fine_line_state = line_tstate
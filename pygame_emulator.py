@@ -1,8 +1,6 @@
 import enum
 from typing import Optional
 
-import time
-
 import pygame
 from pygame import Surface
 
@@ -10,8 +8,12 @@ from spectrum.keyboard import Keyboard
 from spectrum.spectrum import Spectrum
 from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
 from spectrum.video import COLORS, TSTATES_PER_INTERRUPT, FULL_SCREEN_WIDTH, FULL_SCREEN_HEIGHT, Video
+from utils.audio_output import AudioOutput
+from utils.frame_pacer import FramePacer, UNLIMITED
+from utils.run_ahead import RunAhead
 
 CAPTION = "ZX Spectrum 48k Emulator"
+MAX_RUN_AHEAD_FRAMES = 3
 
 
 class EmulatorState(enum.Enum):
@@ -22,35 +24,51 @@ class EmulatorState(enum.Enum):
 # This is just an example of how emulator can be used in PyGame code
 
 class PyGameEmulator:
-    def __init__(self, spectrum: Spectrum, show_fps: bool = True, ratio: int = 3) -> None:
+    def __init__(self, spectrum: Spectrum, show_fps: bool = True, ratio: int = 3, speed: int = 1, run_ahead: int = 0, sound: bool = True) -> None:
         self.show_fps = show_fps
         self.ratio = ratio
+        self._speed = speed
 
         self.spectrum = spectrum
         self.video: Video = spectrum.video
         self.keyboard: Keyboard = spectrum.keyboard
         self.bus_access: ZXSpectrum48ClockAndBusAccess = spectrum.bus_access
 
-        self.video_clock = pygame.time.Clock()
+        self.pacer = FramePacer(speed)
+        self.run_ahead = RunAhead(spectrum, run_ahead)
+        self.sound = sound
+        self.audio_output: Optional[AudioOutput] = None
 
         self.screen: Optional[Surface] = None
         self.pre_screen: Optional[Surface] = None
 
         self.state = EmulatorState.RUNNING
 
-        self.fast = False
-        self.show_fps = True
-        self.fast = False
+        self._fast = False
         self._fast_counter = 0
-        self._last_frame = 0
-        self._last_tstates = 0
-        self._last_time = time.time()
-        self.spare_time = [0] * 50
 
         self.key_methods = {
-            pygame.K_F1: self.key_pause, pygame.K_F3: self.key_ratio
+            pygame.K_F1: self.key_pause, pygame.K_F3: self.key_ratio, pygame.K_F4: self.key_run_ahead
         }
 
+    @property
+    def fast(self) -> bool: return self._fast
+
+    @fast.setter
+    def fast(self, fast: bool) -> None:
+        self._fast = fast
+        self._fast_counter = 0
+        self.pacer.speed = UNLIMITED if fast else self._speed
+
+    @property
+    def speed(self) -> int: return self._speed
+
+    @speed.setter
+    def speed(self, speed: int) -> None:
+        self._speed = speed
+        if not self._fast:
+            self.pacer.speed = speed
+
     def scaled_spectrum_screen_size(self) -> tuple[int, int]:
         return FULL_SCREEN_WIDTH * self.ratio, FULL_SCREEN_HEIGHT * self.ratio
 
@@ -66,45 +84,52 @@ class PyGameEmulator:
         pygame.display.set_icon(icon)
         pygame.display.flip()
 
-    def update(self, frames: int, tstates: int) -> None:
-        pygame.transform.scale(self.spectrum.video.zx_screen_with_border, self.scaled_spectrum_screen_size(), self.pre_screen)
-        self.screen.blit(self.pre_screen, (0, 0))
+        if self.sound:
+            self.audio_output = AudioOutput(self.spectrum.beeper.sample_rate)
+            try:
+                self.audio_output.init()
+                self.spectrum.audio_sink = self.audio_output.write
+            except pygame.error as e:
+                print(f"Sound disabled: {e}")
+                self.audio_output = None
 
-        video_frame = False
+    def update(self) -> None:
+        self.pacer.cpu_done()
+
+        # In fast mode emulation is not paced and only every 200th frame is presented
+        video_frame = True
         if self.fast:
-            if self._fast_counter <= 0:
-                self.video_clock.tick(50)
-                pygame.display.flip()
+            video_frame = self._fast_counter <= 0
+            if video_frame:
                 self._fast_counter = 200
-                video_frame = True
             self._fast_counter -= 1
-        else:
-            video_frame = True
-
-        now = time.time()
-        self.video_clock.tick(50)
 
         if video_frame:
-            if self.show_fps:
-                total_tstates = (frames - self._last_frame) * TSTATES_PER_INTERRUPT + (tstates - self._last_tstates)
-                speed = (total_tstates / (TSTATES_PER_INTERRUPT * (now - self._last_time) * 50)) * 100
-
-                self._last_frame = frames
-                self._last_tstates = tstates
-                self._last_time = now
-
-                time_difference = time.time() - now
-                self.spare_time[0:-1] = self.spare_time[1:]
-                self.spare_time[-1] = int(time_difference * 100000 / 20)
-                spare_time = int(sum(self.spare_time) / len(self.spare_time))
+            pygame.transform.scale(self.spectrum.video.zx_screen_with_border, self.scaled_spectrum_screen_size(), self.pre_screen)
+            self.screen.blit(self.pre_screen, (0, 0))
 
+            if self.show_fps:
                 if self.fast:
-                    pygame.display.set_caption(f'{CAPTION} - {self.video_clock.get_fps():.2f} FPS, Speed: {speed:0.1f}%')
+                    pygame.display.set_caption(f'{CAPTION} - {self.pacer.fps():.2f} FPS, Speed: {self.pacer.speed_percent():0.1f}%')
                 else:
-                    pygame.display.set_caption(f'{CAPTION} - {self.video_clock.get_fps():.2f} FPS, {spare_time: 4}%')
+                    pygame.display.set_caption(f'{CAPTION} - {self.pacer.fps():.2f} FPS, {self.pacer.spare_percent(): 4.0f}%, late: {self.pacer.late_frames}{self._run_ahead_caption()}')
 
             pygame.display.flip()
 
+        if self.audio_output is not None:
+            self.audio_output.pump()
+
+        self.pacer.present_done()
+        self.pacer.wait()
+
+    def _run_ahead_caption(self) -> str:
+        if self.run_ahead.frames == 0:
+            return ""
+        return f", run-ahead: {self.run_ahead.frames} (-{self.run_ahead.latency_reduction_ms():.0f}ms, +{self.run_ahead.average_ahead_ms():.1f}ms CPU)"
+
+    def key_run_ahead(self) -> None:
+        self.run_ahead.frames = self.run_ahead.frames + 1 if self.run_ahead.frames < MAX_RUN_AHEAD_FRAMES else 0
+
     def key_pause(self) -> None:
         self.state = EmulatorState.RUNNING if self.state == EmulatorState.PAUSED else EmulatorState.PAUSED
 
@@ -134,7 +159,8 @@ class PyGameEmulator:
     def process_interrupt(self) -> None:
         self.spectrum.end_frame()
         self.process_keyboard()
-        self.update(self.bus_access.frames, self.bus_access.tstates)
+        self.run_ahead.run_ahead()
+        self.update()
 
     def run(self) -> None:
         try:
@@ -143,7 +169,7 @@ class PyGameEmulator:
                     self.spectrum.execute(TSTATES_PER_INTERRUPT)
                     self.process_interrupt()
                 while self.state == EmulatorState.PAUSED:
-                    self.update(self.bus_access.frames, self.bus_access.tstates)
+                    self.update()
                     self.process_keyboard()
 
         except KeyboardInterrupt:
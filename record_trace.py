@@ -0,0 +1,46 @@
+import argparse
+import contextlib
+import os
+import sys
+
+# Keep standard output for the decoded trace only
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from spectrum.spectrum import Spectrum
+from utils.trace_recorder import TraceRecorder, decode_trace, load_trace
+
+
+parser = argparse.ArgumentParser(description="Records binary trace of the last instructions of a headless run, or decodes one to text")
+parser.add_argument("file", help="snapshot (.sna, .z80 or .szx) to run, or trace (.npy) to decode with --decode")
+parser.add_argument("-f", "--frames", type=int, default=50, help="number of frames to run")
+parser.add_argument("-s", "--size", type=int, default=1_000_000, help="number of the last instructions kept")
+parser.add_argument("-o", "--output", help="save trace to this .npy file; with --decode write text to this file")
+parser.add_argument("-n", "--last", type=int, default=0, help="print this many last instructions decoded")
+parser.add_argument("--decode", action="store_true", help="decode trace file to text")
+args = parser.parse_args()
+
+if args.decode:
+    records = load_trace(args.file)
+    if args.last:
+        records = records[-args.last:]
+    with open(args.output, "w") if args.output else contextlib.nullcontext(sys.stdout) as out:
+        for line in decode_trace(records):
+            out.write(line + "\n")
+    sys.exit(0)
+
+spectrum = Spectrum()
+with contextlib.redirect_stdout(sys.stderr):
+    spectrum.init()
+spectrum.rendering = False
+spectrum.load_snapshot(args.file)
+
+recorder = TraceRecorder(spectrum, args.size)
+try:
+    recorder.run_frames(args.frames)
+finally:
+    # Trace is saved also when emulation fails, it's the last instructions before the failure
+    if args.output:
+        recorder.save_npy(args.output)
+    if args.last:
+        for line in decode_trace(recorder.records()[-args.last:]):
+            print(line)
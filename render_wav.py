@@ -0,0 +1,14 @@
+import argparse
+
+from utils.wav_render import render_snapshot_to_wav
+
+
+parser = argparse.ArgumentParser(description="Renders sound of a snapshot to WAV file without display")
+parser.add_argument("snapshot", help=".sna snapshot to load")
+parser.add_argument("wav", help="output WAV file")
+parser.add_argument("-s", "--seconds", type=float, default=30.0, help="length to render")
+parser.add_argument("--no-ay", action="store_true", help="do not emulate AY interface")
+args = parser.parse_args()
+
+speed = render_snapshot_to_wav(args.snapshot, args.wav, args.seconds, ay=not args.no_ay)
+print(f"Rendered {args.seconds}s to {args.wav} at {speed:.1f}x real time")
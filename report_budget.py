@@ -0,0 +1,40 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+import numpy as np
+
+# Keep standard output for the summary only
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from spectrum.spectrum import Spectrum
+from utils.frame_budget import FrameBudget
+
+
+parser = argparse.ArgumentParser(description="Runs snapshot without display and prints its per frame T-state budget as JSON")
+parser.add_argument("snapshot", help="snapshot (.sna, .z80 or .szx) to load")
+parser.add_argument("-f", "--frames", type=int, default=250, help="number of frames to run")
+parser.add_argument("-o", "--output", help="write summary to this file instead of standard output")
+parser.add_argument("--history", help="also save every frame's budget (main, interrupt, halt, contention) to this .npy file")
+args = parser.parse_args()
+
+spectrum = Spectrum()
+with contextlib.redirect_stdout(sys.stderr):
+    spectrum.init()
+spectrum.rendering = False
+spectrum.load_snapshot(args.snapshot)
+
+budget = FrameBudget(spectrum, history=max(args.frames, 1))
+budget.run_frames(args.frames)
+
+summary = json.dumps(budget.summary(), indent=2)
+if args.output:
+    with open(args.output, "w") as f:
+        f.write(summary + "\n")
+else:
+    print(summary)
+
+if args.history:
+    np.save(args.history, budget.recent(args.frames))
@@ -16,8 +16,11 @@ emulator.init()
 # spectrum.load_sna("snapshots/zexall.sna")
 spectrum.load_sna("snapshots/nirvana-demo.sna")
 
+# Standard speed blocks of .tap/.tzx are loaded instantly by LOAD ""
+# spectrum.insert_tape("game.tzx")
+
 # spectrum.video.fast = True
-# spectrum.z80.show_debug_info = True
+# Instruction trace (see utils.trace_recorder): python record_trace.py snapshot.sna -f 50 -o trace.npy
 # spectrum.keyboard.do_key(True, 13, 0)
 
 emulator.run()
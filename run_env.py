@@ -18,7 +18,7 @@ environment.init()
 spectrum.load_sna("snapshots/nirvana-demo.sna")
 
 # spectrum.video.fast = True
-# spectrum.z80.show_debug_info = True
+# Instruction trace (see utils.trace_recorder): python record_trace.py snapshot.sna -f 50 -o trace.npy
 # spectrum.keyboard.do_key(True, 13, 0)
 
 environment.run()
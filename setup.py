@@ -22,6 +22,7 @@ setup(
     ],
     install_requires=[
         'pygame',
+        'numpy',
     ],
     python_requires='>=3.9',
 )
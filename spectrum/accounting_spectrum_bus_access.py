@@ -0,0 +1,206 @@
+from typing import Callable
+
+from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
+from z80.memory import Memory
+from z80.ports import Ports
+
+
+# Same as normal bus but sums contention delays into 'contention' (only contended accesses
+# pay for it) and keeps T-state and contention at which interrupt (or NMI) handling started
+# in this instruction, -1 if it didn't (see utils.pc_accounting).
+class AccountingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
+    def __init__(self,
+                 memory: Memory,
+                 ports: Ports,
+                 update_next_screen_byte: Callable) -> None:
+        super().__init__(memory, ports, update_next_screen_byte)
+        self.contention = 0
+        self.interrupt_tstates = -1
+        self.interrupt_contention = 0
+
+    # Interrupt taken while this bus ran for someone else is not to be found by next user
+    def copy_from_bus_access(self, other: ZXSpectrum48ClockAndBusAccess) -> None:
+        super().copy_from_bus_access(other)
+        self.interrupt_tstates = -1
+
+    def fetch_opcode(self, address: int) -> int:
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 4
+        else:
+            self.tstates += 4
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        return self.memory.peekb(address)
+
+    def undo_fetch_opcode(self, address: int) -> None:
+        end = self.tstates
+        super().undo_fetch_opcode(address)
+        self.contention -= end - self.tstates - 4
+
+    def peekb(self, address: int) -> int:
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+        else:
+            self.tstates += 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        return self.memory.peekb(address)
+
+    def peeksb(self, address: int) -> int:
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+        else:
+            self.tstates += 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        return self.memory.peeksb(address)
+
+    def pokeb(self, address: int, value: int) -> None:
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+        else:
+            self.tstates += 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        self.memory.pokeb(address, value & 0xFF)
+
+    def peekw(self, address: int) -> int:
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+        else:
+            self.tstates += 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        lsb = self.memory.peekb(address)
+
+        address = (address + 1) & 0xffff
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+        else:
+            self.tstates += 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        msb = self.memory.peekb(address)
+
+        return (msb << 8) + lsb
+
+    def pokew(self, address: int, value: int) -> None:
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+        else:
+            self.tstates += 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        self.memory.pokeb(address, value & 0xff)
+
+        address = (address + 1) & 0xffff
+        if 16384 <= address < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+        else:
+            self.tstates += 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        self.memory.pokeb(address, (value >> 8))
+
+    def address_on_bus(self, address: int, tstates: int) -> None:
+        if 16384 <= address < 32768:
+            for i in range(tstates):
+                delay = self.delay_tstates[self.tstates]
+                self.contention += delay
+                self.tstates += delay + 1
+        else:
+            self.tstates += tstates
+
+        while self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+    def interrupt_handling_time(self, tstates: int) -> None:
+        self.interrupt_tstates = self.tstates
+        self.interrupt_contention = self.contention
+        super().interrupt_handling_time(tstates)
+
+    def in_port(self, port: int) -> int:
+        if 16384 <= port < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 1
+        else:
+            self.tstates += 1
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
+
+        self._last_port_cycles(port)
+        return self.ports.in_port(port)
+
+    def out_port(self, port: int, value: int):
+        if 16384 <= port < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 1
+        else:
+            self.tstates += 1
+
+        self.ports.out_port(port, value)
+        self._last_port_cycles(port)
+
+    # Last three of four port cycles; ULA (even) ports are contended wherever the address is
+    def _last_port_cycles(self, port: int) -> None:
+        if port & 0x0001 != 0:
+            if 16384 <= port < 32768:
+                for i in range(3):
+                    delay = self.delay_tstates[self.tstates]
+                    self.contention += delay
+                    self.tstates += delay + 1
+            else:
+                self.tstates += 3
+        else:
+            delay = self.delay_tstates[self.tstates]
+            self.contention += delay
+            self.tstates += delay + 3
+
+        if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
+            self.update_next_screen_word()
+            self.next_screen_byte_index += 1
@@ -0,0 +1,259 @@
+from array import array
+from typing import Optional
+
+import numpy as np
+
+from spectrum.beeper import DEFAULT_SAMPLE_RATE
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.frame_pacer import CPU_FREQUENCY
+
+
+# Melodik interface (and 128K machines) run AY at half of CPU clock.
+# Noise and envelope counters are clocked at AY clock / 16 - a 'tick' here.
+# Frame length (69888) is multiple of it.
+TSTATES_PER_TICK = 32
+# Tone counters are clocked at AY clock / 8 (tone is clock / (16 * period)),
+# so tone phase is kept in half-ticks.
+TONE_STEPS_PER_TICK = 2
+
+MAX_WRITES = TSTATES_PER_INTERRUPT // 8
+
+REGISTER_MASKS = (0xff, 0x0f, 0xff, 0x0f, 0xff, 0x0f, 0x1f, 0xff, 0x1f, 0x1f, 0x1f, 0xff, 0xff, 0x0f, 0xff, 0xff)
+
+R_TONE_A = 0
+R_NOISE_PERIOD = 6
+R_MIXER = 7
+R_VOLUME_A = 8
+R_ENV_PERIOD_LOW = 11
+R_ENV_PERIOD_HIGH = 12
+R_ENV_SHAPE = 13
+
+# Measured AY DAC output levels, normalised
+VOLUME_TABLE = np.array([
+    0.0, 0.0137, 0.0205, 0.0291, 0.0423, 0.0618, 0.0847, 0.1369,
+    0.1691, 0.2647, 0.3527, 0.4499, 0.5704, 0.6873, 0.8482, 1.0
+], dtype=np.float64)
+
+_noise_sequence: Optional[np.ndarray] = None
+
+
+def noise_sequence() -> np.ndarray:
+    # Complete output of 17 bit LFSR (x^17 + x^14 + 1). It is periodic so noise
+    # at any point is just an index into this table.
+    global _noise_sequence
+    if _noise_sequence is None:
+        length = (1 << 17) - 1
+        bits = bytearray(length)
+        lfsr = 1
+        for i in range(length):
+            bit = (lfsr ^ (lfsr >> 3)) & 1
+            lfsr = (lfsr >> 1) | (bit << 16)
+            bits[i] = lfsr & 1
+        _noise_sequence = np.frombuffer(bytes(bits), dtype=np.uint8)
+    return _noise_sequence
+
+
+def envelope_levels(shape: int, steps: np.ndarray) -> np.ndarray:
+    attack = (shape & 0x04) != 0
+    cycle = steps >> 4
+    position = steps & 0x0f
+    first = position if attack else 15 - position
+
+    if (shape & 0x08) == 0:  # no continue - single ramp then 0
+        return np.where(cycle == 0, first, 0)
+
+    alternate = (shape & 0x02) != 0
+    if shape & 0x01:  # hold
+        held = 15 if attack != alternate else 0
+        return np.where(cycle == 0, first, held)
+
+    if alternate:
+        rising = (cycle & 1) == (0 if attack else 1)
+        return np.where(rising, position, 15 - position)
+    return first
+
+
+# AY-3-8912 sound chip. Register writes are stored with T-state they happened at;
+# at the end of the frame chip output is synthesised with NumPy for every interval
+# between writes (where registers are constant) and box-filtered down to sample rate.
+class AY:
+    def __init__(self, sample_rate: int = DEFAULT_SAMPLE_RATE, volume: float = 0.5) -> None:
+        self.sample_rate = sample_rate
+        self.volume = volume
+        self.tstates_per_sample = CPU_FREQUENCY / sample_rate
+
+        self.registers = [0] * 16
+        self.selected = 0
+
+        # Registers at the start of the frame - writes are applied to this copy during synthesis
+        self.frame_registers = [0] * 16
+
+        self.write_tstates = array('i', bytes(4 * MAX_WRITES))
+        self.write_values = array('H', bytes(2 * MAX_WRITES))
+        self.count = 0
+        self.dropped_writes = 0
+
+        self.tone_phase = [0, 0, 0]
+        self.noise_phase = 0
+        self.noise_index = 0
+        self.envelope_phase = 0
+        self.envelope_step = 0
+        self.sample_phase = 0.0
+
+    def reset(self) -> None:
+        self.registers = [0] * 16
+        self.frame_registers = [0] * 16
+        self.selected = 0
+        self.count = 0
+        self.tone_phase = [0, 0, 0]
+        self.noise_phase = 0
+        self.noise_index = 0
+        self.envelope_phase = 0
+        self.envelope_step = 0
+        self.sample_phase = 0.0
+
+    def select(self, value: int) -> None:
+        self.selected = value & 0x0f if value < 16 else 16
+
+    def read(self) -> int:
+        return self.registers[self.selected] if self.selected < 16 else 0xff
+
+    def write(self, tstates: int, value: int) -> None:
+        reg = self.selected
+        if reg >= 16:
+            return
+        value &= REGISTER_MASKS[reg]
+        self.registers[reg] = value
+        if self.count < MAX_WRITES:
+            self.write_tstates[self.count] = tstates
+            self.write_values[self.count] = (reg << 8) | value
+            self.count += 1
+        else:
+            self.dropped_writes += 1
+
+    def get_state(self) -> tuple:
+        return (
+            tuple(self.registers), tuple(self.frame_registers), self.selected,
+            self.write_tstates[:self.count].tolist(), self.write_values[:self.count].tolist(),
+            tuple(self.tone_phase), self.noise_phase, self.noise_index,
+            self.envelope_phase, self.envelope_step, self.sample_phase
+        )
+
+    def set_state(self, state: tuple) -> None:
+        registers, frame_registers, self.selected, write_tstates, write_values, tone_phase, \
+            self.noise_phase, self.noise_index, self.envelope_phase, self.envelope_step, self.sample_phase = state
+        self.registers = list(registers)
+        self.frame_registers = list(frame_registers)
+        self.tone_phase = list(tone_phase)
+        self.count = len(write_tstates)
+        self.write_tstates[:self.count] = array('i', write_tstates)
+        self.write_values[:self.count] = array('H', write_values)
+
+    def _advance(self, registers: list[int], ticks: int) -> None:
+        for channel in range(3):
+            tone_period = (registers[R_TONE_A + channel * 2] | (registers[R_TONE_A + channel * 2 + 1] << 8)) or 1
+            self.tone_phase[channel] = (self.tone_phase[channel] + ticks * TONE_STEPS_PER_TICK) % (2 * tone_period)
+
+        noise_period = registers[R_NOISE_PERIOD] or 1
+        self.noise_index = (self.noise_index + (self.noise_phase + ticks) // noise_period) % ((1 << 17) - 1)
+        self.noise_phase = (self.noise_phase + ticks) % noise_period
+
+        envelope_period = (registers[R_ENV_PERIOD_LOW] | (registers[R_ENV_PERIOD_HIGH] << 8)) or 1
+        step = self.envelope_step + (self.envelope_phase + ticks) // envelope_period
+        if step >= 32:
+            # Only first cycle and parity of the cycle matter for envelope shapes
+            step = 32 + (step & 0x1f)
+        self.envelope_step = step
+        self.envelope_phase = (self.envelope_phase + ticks) % envelope_period
+
+    def _synthesise(self, registers: list[int], output: np.ndarray) -> None:
+        ticks = len(output)
+        k = np.arange(ticks, dtype=np.int64)
+        mixer = registers[R_MIXER]
+
+        noise = None
+        envelope = None
+        output[:] = 0.0
+        for channel in range(3):
+            volume = registers[R_VOLUME_A + channel]
+            if volume == 0:
+                continue
+
+            # Disabled tone and noise leave channel output high - that is how samples are played on AY
+            signal = np.ones(ticks, dtype=np.float64)
+            if not (mixer >> channel) & 1:
+                tone_period = (registers[R_TONE_A + channel * 2] | (registers[R_TONE_A + channel * 2 + 1] << 8)) or 1
+                # Average of both half-ticks - output can toggle in the middle of a tick
+                steps = self.tone_phase[channel] + k * TONE_STEPS_PER_TICK
+                signal *= (((steps // tone_period) & 1) + (((steps + 1) // tone_period) & 1)) * 0.5
+            if not (mixer >> (channel + 3)) & 1:
+                if noise is None:
+                    sequence = noise_sequence()
+                    noise_period = registers[R_NOISE_PERIOD] or 1
+                    noise = sequence[(self.noise_index + (self.noise_phase + k) // noise_period) % len(sequence)] == 1
+                signal *= noise
+
+            if volume & 0x10:
+                if envelope is None:
+                    envelope_period = (registers[R_ENV_PERIOD_LOW] | (registers[R_ENV_PERIOD_HIGH] << 8)) or 1
+                    steps = self.envelope_step + (self.envelope_phase + k) // envelope_period
+                    envelope = VOLUME_TABLE[envelope_levels(registers[R_ENV_SHAPE], steps)]
+                output += signal * envelope
+            else:
+                output += signal * VOLUME_TABLE[volume]
+
+        self._advance(registers, ticks)
+
+    def render_ticks(self, frame_tstates: int = TSTATES_PER_INTERRUPT, synthesise: bool = True) -> Optional[np.ndarray]:
+        tstates = np.frombuffer(self.write_tstates, dtype=np.int32, count=self.count)
+        in_frame = int(np.searchsorted(tstates, frame_tstates, side='left'))
+        write_ticks = (tstates[:in_frame] // TSTATES_PER_TICK).tolist()
+        values = self.write_values[:in_frame].tolist()
+        total_ticks = frame_tstates // TSTATES_PER_TICK
+
+        registers = self.frame_registers
+        output = np.empty(total_ticks, dtype=np.float64) if synthesise else None
+        position = 0
+        for i in range(in_frame + 1):
+            end = min(write_ticks[i], total_ticks) if i < in_frame else total_ticks
+            if end > position:
+                if synthesise:
+                    self._synthesise(registers, output[position:end])
+                else:
+                    self._advance(registers, end - position)
+                position = end
+            if i < in_frame:
+                reg = values[i] >> 8
+                registers[reg] = values[i] & 0xff
+                if reg == R_ENV_SHAPE:
+                    self.envelope_step = 0
+                    self.envelope_phase = 0
+
+        # Writes after the end of the frame (last instruction overrun) belong to the next frame
+        carried = self.count - in_frame
+        for i in range(carried):
+            self.write_tstates[i] = self.write_tstates[in_frame + i] - frame_tstates
+            self.write_values[i] = self.write_values[in_frame + i]
+        self.count = carried
+        return output
+
+    def end_frame(self, frame_tstates: int = TSTATES_PER_INTERRUPT) -> np.ndarray:
+        output = self.render_ticks(frame_tstates)
+
+        # Box filter from ticks to samples: integral of the output at sample boundaries
+        integral = np.zeros(len(output) + 1, dtype=np.float64)
+        np.cumsum(output, out=integral[1:])
+
+        tps = self.tstates_per_sample
+        samples = int((frame_tstates - self.sample_phase) // tps)
+        boundaries = self.sample_phase + np.arange(samples + 1, dtype=np.float64) * tps
+        tick_positions = np.clip(boundaries / TSTATES_PER_TICK, 0, len(output))
+        values = np.interp(tick_positions, np.arange(len(output) + 1), integral)
+
+        self.sample_phase = boundaries[-1] - frame_tstates
+        return (np.diff(values) * TSTATES_PER_TICK / tps * self.volume / 3).astype(np.float32)
+
+    def skip_frame(self, frame_tstates: int = TSTATES_PER_INTERRUPT) -> None:
+        self.render_ticks(frame_tstates, synthesise=False)
+        samples = int((frame_tstates - self.sample_phase) // self.tstates_per_sample)
+        self.sample_phase = self.sample_phase + samples * self.tstates_per_sample - frame_tstates
@@ -0,0 +1,105 @@
+from array import array
+
+import numpy as np
+
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.frame_pacer import CPU_FREQUENCY
+
+
+DEFAULT_SAMPLE_RATE = 44100
+
+# OUT takes at least 11 T-states so there can't be more level changes in a frame than this
+MAX_EVENTS = TSTATES_PER_INTERRUPT // 8
+
+# Output level for (speaker << 1) | mic bits of port 0xFE
+LEVEL_AMPLITUDES = np.array([0.0, 0.08, 0.92, 1.0], dtype=np.float64)
+
+
+# Beeper records only changes of speaker/MIC level during the frame - each as a single
+# store of (tstates << 2) | level into preallocated array. At the end of the frame level changes
+# are integrated over each sample period (box filter) which produces PCM block for the frame.
+class Beeper:
+    def __init__(self, sample_rate: int = DEFAULT_SAMPLE_RATE, volume: float = 0.5) -> None:
+        self.sample_rate = sample_rate
+        self.volume = volume
+        self.tstates_per_sample = CPU_FREQUENCY / sample_rate
+
+        self.events = array('i', bytes(4 * MAX_EVENTS))
+        self.count = 0
+        self.level = 0
+        self.dropped_events = 0
+
+        # Level at the start of the current frame and T-state (relative to frame start, <= 0) of next sample boundary
+        self.start_level = 0
+        self.sample_phase = 0.0
+
+    def out(self, tstates: int, value: int) -> None:
+        level = (value >> 3) & 0x03
+        if level != self.level:
+            self.level = level
+            if self.count < MAX_EVENTS:
+                self.events[self.count] = (tstates << 2) | level
+                self.count += 1
+            else:
+                self.dropped_events += 1
+
+    def reset(self) -> None:
+        self.count = 0
+        self.start_level = self.level
+        self.sample_phase = 0.0
+
+    def _carry_over(self, frame_tstates: int, tstates: np.ndarray) -> int:
+        # Events that happened after the end of the frame (last instruction overrun) belong to the next frame
+        in_frame = int(np.searchsorted(tstates, frame_tstates, side='left'))
+        carried = self.count - in_frame
+        if carried > 0:
+            for i in range(carried):
+                event = self.events[in_frame + i]
+                self.events[i] = (((event >> 2) - frame_tstates) << 2) | (event & 0x03)
+        self.count = carried
+        return in_frame
+
+    def skip_frame(self, frame_tstates: int = TSTATES_PER_INTERRUPT) -> None:
+        events = np.frombuffer(self.events, dtype=np.int32, count=self.count)
+        tstates = events >> 2
+        # Level is read before carried over events overwrite the start of the (viewed) array
+        in_frame = int(np.searchsorted(tstates, frame_tstates, side='left'))
+        if in_frame > 0:
+            self.start_level = int(events[in_frame - 1] & 0x03)
+        self._carry_over(frame_tstates, tstates)
+        samples = int((frame_tstates - self.sample_phase) // self.tstates_per_sample)
+        self.sample_phase = self.sample_phase + samples * self.tstates_per_sample - frame_tstates
+
+    def end_frame(self, frame_tstates: int = TSTATES_PER_INTERRUPT) -> np.ndarray:
+        events = np.frombuffer(self.events, dtype=np.int32, count=self.count).copy()
+        tstates = events >> 2
+        levels = events & 0x03
+
+        in_frame = self._carry_over(frame_tstates, tstates)
+        tstates = tstates[:in_frame]
+        levels = levels[:in_frame]
+
+        tps = self.tstates_per_sample
+        samples = int((frame_tstates - self.sample_phase) // tps)
+        boundaries = self.sample_phase + np.arange(samples + 1, dtype=np.float64) * tps
+
+        # Piecewise constant signal: segment k starts at seg_start[k] with amplitude seg_amp[k]
+        seg_start = np.empty(in_frame + 1, dtype=np.float64)
+        seg_start[0] = min(boundaries[0], 0.0)
+        seg_start[1:] = tstates
+        seg_amp = np.empty(in_frame + 1, dtype=np.float64)
+        seg_amp[0] = LEVEL_AMPLITUDES[self.start_level]
+        seg_amp[1:] = LEVEL_AMPLITUDES[levels]
+
+        # Integral of the signal at the start of each segment and at each sample boundary
+        cumulative = np.zeros(in_frame + 1, dtype=np.float64)
+        cumulative[1:] = np.cumsum(seg_amp[:-1] * np.diff(seg_start))
+        index = np.searchsorted(seg_start, boundaries, side='right') - 1
+        integral = cumulative[index] + seg_amp[index] * (boundaries - seg_start[index])
+
+        block = (np.diff(integral) / tps * self.volume).astype(np.float32)
+
+        if in_frame > 0:
+            self.start_level = int(levels[-1])
+        self.sample_phase = boundaries[-1] - frame_tstates
+        return block
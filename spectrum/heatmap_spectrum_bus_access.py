@@ -0,0 +1,60 @@
+from array import array
+from typing import Callable
+
+from spectrum.accounting_spectrum_bus_access import AccountingZXSpectrum48ClockAndBusAccess
+from z80.memory import Memory
+from z80.ports import Ports
+
+_Bus = AccountingZXSpectrum48ClockAndBusAccess
+
+
+# Accounting bus which also counts reads, writes and opcode fetches (executes) per address,
+# for utils.memory_heatmap. Counters are never replaced, only cleared in place, so views
+# of them stay valid. Based on accounting bus so frame budget keeps its contention.
+class HeatmapZXSpectrum48ClockAndBusAccess(AccountingZXSpectrum48ClockAndBusAccess):
+    def __init__(self,
+                 memory: Memory,
+                 ports: Ports,
+                 update_next_screen_byte: Callable) -> None:
+        super().__init__(memory, ports, update_next_screen_byte)
+        self.reads = array('I', bytes(4 * 65536))
+        self.writes = array('I', bytes(4 * 65536))
+        self.executes = array('I', bytes(4 * 65536))
+
+    def clear_counts(self) -> None:
+        zeros = bytes(4 * 65536)
+        memoryview(self.reads).cast('B')[:] = zeros
+        memoryview(self.writes).cast('B')[:] = zeros
+        memoryview(self.executes).cast('B')[:] = zeros
+
+    def fetch_opcode(self, address: int) -> int:
+        self.executes[address] += 1
+        return _Bus.fetch_opcode(self, address)
+
+    def undo_fetch_opcode(self, address: int) -> None:
+        _Bus.undo_fetch_opcode(self, address)
+        self.executes[address] -= 1
+
+    def peekb(self, address: int) -> int:
+        self.reads[address] += 1
+        return _Bus.peekb(self, address)
+
+    def peeksb(self, address: int) -> int:
+        self.reads[address] += 1
+        return _Bus.peeksb(self, address)
+
+    def pokeb(self, address: int, value: int) -> None:
+        self.writes[address] += 1
+        _Bus.pokeb(self, address, value)
+
+    def peekw(self, address: int) -> int:
+        reads = self.reads
+        reads[address] += 1
+        reads[(address + 1) & 0xffff] += 1
+        return _Bus.peekw(self, address)
+
+    def pokew(self, address: int, value: int) -> None:
+        writes = self.writes
+        writes[address] += 1
+        writes[(address + 1) & 0xffff] += 1
+        _Bus.pokew(self, address, value)
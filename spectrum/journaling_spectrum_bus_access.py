@@ -0,0 +1,28 @@
+from array import array
+from typing import Callable
+
+from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
+from z80.memory import Memory
+from z80.ports import Ports
+
+
+# Bus access that logs (address << 8) | old value of every byte written, so
+# writes of any number of instructions can be undone in reverse order.
+class JournalingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
+    def __init__(self,
+                 memory: Memory,
+                 ports: Ports,
+                 update_next_screen_byte: Callable) -> None:
+        super().__init__(memory, ports, update_next_screen_byte)
+        self.journal = array('i')
+
+    def pokeb(self, address: int, value: int) -> None:
+        self.journal.append((address << 8) | self.memory.mem[address])
+        super().pokeb(address, value)
+
+    def pokew(self, address: int, value: int) -> None:
+        mem = self.memory.mem
+        self.journal.append((address << 8) | mem[address])
+        next_address = (address + 1) & 0xffff
+        self.journal.append((next_address << 8) | mem[next_address])
+        super().pokew(address, value)
@@ -23,6 +23,10 @@ class Keyboard:
         self.keyboard = [0xff] * 8
         self.joy = [0]
 
+        # Result of reading port 0xFE for every value of high address byte (row select);
+        # updated in place whenever key state changes so readers can keep a reference to it
+        self.row_table = bytearray(b'\xff' * 256)
+
         self.signals = {
             K_1: [_1_5, b0],
             K_2: [_1_5, b1],
@@ -84,6 +88,17 @@ class Keyboard:
         self.keyboard[_CAPS_V] = 0xff
 
         self.joy = [0]
+        self.update_row_table()
+
+    def update_row_table(self) -> None:
+        # Row 0 is selected by A15, row 7 by A8. Table for each high byte is built from
+        # the one with its lowest zero bit set, so every entry costs a single AND.
+        table = self.row_table
+        rows = self.keyboard
+        table[0xff] = 0xff
+        for high in range(0xfe, -1, -1):
+            bit = ~high & (high + 1)  # lowest zero bit
+            table[high] = table[high | bit] & rows[7 - (bit.bit_length() - 1)]
 
     def do_key(self, down, scan_code, mods):
         caps = (mods & KMOD_CTRL) != 0
@@ -165,3 +180,5 @@ class Keyboard:
 
         except KeyError:
             pass
+
+        self.update_row_table()
@@ -0,0 +1,89 @@
+import struct
+from array import array
+from typing import Optional
+
+from spectrum.ay import AY
+from spectrum.beeper import Beeper
+from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
+from spectrum.video import SCREEN_WIDTH, SCREEN_HEIGHT, Video
+from z80.memory import Memory
+from z80.z80_cpu import Z80CPU, STATE_ATTRIBUTES
+
+
+_WORD_ATTRIBUTES = {"regPC", "regIX", "regIY", "regSP", "memptr"}
+_BOOL_ATTRIBUTES = {
+    "carryFlag", "_flagQ", "_lastFlagQ", "regRbit7", "ffIFF1", "ffIFF2",
+    "pendingEI", "activeNMI", "activeINT", "halted", "pinReset"
+}
+
+
+def _attribute_format(name: str) -> str:
+    if name == "regR":
+        return "q"  # R is kept as ever increasing counter
+    if name in _WORD_ATTRIBUTES:
+        return "i"
+    if name in _BOOL_ATTRIBUTES:
+        return "?"
+    return "B"
+
+
+# Core state is everything but memory, video buffer and sound: CPU state, then bus
+# (tstates, frames, int_line, next_screen_byte_index, border), then video beam
+# (offs, pix_addr, attr_addr, pixel_byte_x, pixel_byte_y). All code saving and restoring
+# machine state goes through core_state()/set_core_state() (and STATE_STRUCT when packed).
+STATE_STRUCT = struct.Struct("<" + "".join(_attribute_format(name) for name in STATE_ATTRIBUTES) + "ii?iB" + "iiiii")
+CPU_STATE_LENGTH = len(STATE_ATTRIBUTES)
+
+
+def core_state(z80: Z80CPU, bus_access: ZXSpectrum48ClockAndBusAccess, video: Video) -> tuple:
+    return (
+        *z80.get_state(),
+        bus_access.tstates, bus_access.frames, bus_access.int_line,
+        bus_access.next_screen_byte_index, bus_access.ports.current_border,
+        video.offs, video.pix_addr, video.attr_addr, video.pixel_byte_x, video.pixel_byte_y
+    )
+
+
+def set_core_state(state: tuple, z80: Z80CPU, bus_access: ZXSpectrum48ClockAndBusAccess, video: Video) -> None:
+    z80.set_state(state[:CPU_STATE_LENGTH])
+    bus_access.tstates, bus_access.frames, bus_access.int_line, \
+        bus_access.next_screen_byte_index, bus_access.ports.current_border = state[CPU_STATE_LENGTH:CPU_STATE_LENGTH + 5]
+    video.offs, video.pix_addr, video.attr_addr, video.pixel_byte_x, video.pixel_byte_y = state[CPU_STATE_LENGTH + 5:]
+
+
+# Beeper and AY state, including sound events of the current frame
+def sound_state(beeper: Beeper, ay: Optional[AY] = None) -> tuple:
+    return (
+        beeper.level, beeper.start_level, beeper.sample_phase, beeper.events[:beeper.count].tolist(),
+        ay.get_state() if ay is not None else None
+    )
+
+
+def set_sound_state(state: tuple, beeper: Beeper, ay: Optional[AY] = None) -> None:
+    beeper.level, beeper.start_level, beeper.sample_phase, events, ay_state = state
+    beeper.count = len(events)
+    beeper.events[:beeper.count] = array('i', events)
+    if ay is not None and ay_state is not None:
+        ay.set_state(ay_state)
+
+
+# Fast in-memory copy of complete machine state. Buffers are allocated once
+# so saving and restoring are just slice copies and attribute assignments.
+class MachineState:
+    def __init__(self) -> None:
+        self.memory = bytearray(65536)
+        self.video_buffer = bytearray(SCREEN_WIDTH * SCREEN_HEIGHT)
+        self.core_state: tuple = ()
+        self.sound_state: tuple = ()
+
+    def save(self, memory: Memory, z80: Z80CPU, bus_access: ZXSpectrum48ClockAndBusAccess, video: Video, beeper: Beeper, ay: Optional[AY] = None) -> None:
+        self.memory[:] = memory.mem
+        self.video_buffer[:] = video.buffer_m
+        self.core_state = core_state(z80, bus_access, video)
+        self.sound_state = sound_state(beeper, ay)
+
+    def restore(self, memory: Memory, z80: Z80CPU, bus_access: ZXSpectrum48ClockAndBusAccess, video: Video, beeper: Beeper, ay: Optional[AY] = None) -> None:
+        memory.mem[:] = self.memory
+        video.buffer_m[:] = self.video_buffer
+        set_core_state(self.core_state, z80, bus_access, video)
+        set_sound_state(self.sound_state, beeper, ay)
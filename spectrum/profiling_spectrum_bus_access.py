@@ -1,7 +1,7 @@
 from typing import Callable
 
 from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
-from z80.instructions.profile import FetchOpcode, PeekB, PokeB, PeekW, PokeW, AddrOnBus, InPort, OutPort, MemoryAccess
+from z80.instructions.profile import AccessRecords, FETCH_OPCODE, PEEK_B, POKE_B, PEEK_W, POKE_W, ADDR_ON_BUS, IN_PORT, OUT_PORT, DELAY_BITS
 from z80.memory import Memory
 from z80.ports import Ports
 
@@ -9,20 +9,23 @@ from z80.ports import Ports
 INTERRUPT_LENGTH = 24
 
 
+# Records every bus access (with its contention) into preallocated AccessRecords columns.
+# Single byte accesses are recorded with T-state they start at; word, address on bus and
+# port accesses with T-state after their last cycle. Address of a word is its first byte's.
 class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
     def __init__(self,
                  memory: Memory,
                  ports: Ports,
                  update_next_screen_byte: Callable) -> None:
         super().__init__(memory, ports, update_next_screen_byte)
-        self.profile: list[MemoryAccess] = []
+        self.records = AccessRecords()
 
     def fetch_opcode(self, address: int) -> int:
         if 16384 <= address < 32768:
-            self.profile.append(FetchOpcode(self.tstates, 4, self.delay_tstates[self.tstates]))
+            self.records.add(FETCH_OPCODE, address, self.tstates, 4, 1, self.delay_tstates[self.tstates])
             self.tstates += self.delay_tstates[self.tstates] + 4
         else:
-            self.profile.append(FetchOpcode(self.tstates, 4))
+            self.records.add(FETCH_OPCODE, address, self.tstates, 4)
             self.tstates += 4
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
@@ -34,10 +37,10 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
 
     def peekb(self, address: int) -> int:
         if 16384 <= address < 32768:
-            self.profile.append(PeekB(self.tstates, 3, self.delay_tstates[self.tstates]))
+            self.records.add(PEEK_B, address, self.tstates, 3, 1, self.delay_tstates[self.tstates])
             self.tstates += self.delay_tstates[self.tstates] + 3
         else:
-            self.profile.append(PeekB(self.tstates, 3))
+            self.records.add(PEEK_B, address, self.tstates, 3)
             self.tstates += 3
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
@@ -48,10 +51,10 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
 
     def peeksb(self, address: int) -> int:
         if 16384 <= address < 32768:
-            self.profile.append(PeekB(self.tstates, 3, self.delay_tstates[self.tstates]))
+            self.records.add(PEEK_B, address, self.tstates, 3, 1, self.delay_tstates[self.tstates])
             self.tstates += self.delay_tstates[self.tstates] + 3
         else:
-            self.profile.append(PeekB(self.tstates, 3))
+            self.records.add(PEEK_B, address, self.tstates, 3)
             self.tstates += 3
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
@@ -62,10 +65,10 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
 
     def pokeb(self, address: int, value: int) -> None:
         if 16384 <= address < 32768:
-            self.profile.append(PokeB(self.tstates, 3, self.delay_tstates[self.tstates]))
+            self.records.add(POKE_B, address, self.tstates, 3, 1, self.delay_tstates[self.tstates])
             self.tstates += self.delay_tstates[self.tstates] + 3
         else:
-            self.profile.append(PokeB(self.tstates, 3))
+            self.records.add(POKE_B, address, self.tstates, 3)
             self.tstates += 3
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
@@ -96,7 +99,7 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
         else:
             self.tstates += 3
 
-        self.profile.append(PeekW(self.tstates, 3, 3,  delay1, delay2))
+        self.records.add(PEEK_W, (address - 1) & 0xffff, self.tstates, 3, 2, delay1 | (delay2 << DELAY_BITS))
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
             self.update_next_screen_word()
@@ -128,7 +131,7 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
         else:
             self.tstates += 3
 
-        self.profile.append(PokeW(self.tstates, 3, 3,  delay1, delay2))
+        self.records.add(POKE_W, (address - 1) & 0xffff, self.tstates, 3, 2, delay1 | (delay2 << DELAY_BITS))
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
             self.update_next_screen_word()
@@ -137,15 +140,15 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
         self.memory.pokeb(address, (value >> 8))
 
     def address_on_bus(self, address: int, tstates: int) -> None:
-        delays = []
         if 16384 <= address < 32768:
+            delays = 0
             for i in range(tstates):
-                delays.append(self.delay_tstates[self.tstates])
+                delays |= self.delay_tstates[self.tstates] << (i * DELAY_BITS)
                 self.tstates += self.delay_tstates[self.tstates] + 1
+            self.records.add(ADDR_ON_BUS, address, self.tstates, tstates, tstates, delays)
         else:
             self.tstates += tstates
-
-        self.profile.append(AddrOnBus(self.tstates, tstates, *delays))
+            self.records.add(ADDR_ON_BUS, address, self.tstates, tstates)
 
         while self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
             self.update_next_screen_word()
@@ -159,39 +162,14 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
             self.next_screen_byte_index += 1
 
     def in_port(self, port: int) -> int:
-        delays = []
-        if 16384 <= port < 32768:
-            delays.append(self.delay_tstates[self.tstates])
-            self.tstates += self.delay_tstates[self.tstates] + 1
-        else:
-            delays.append(0)
-            self.tstates += 1
+        delays = self._first_port_cycle(port)
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
             self.update_next_screen_word()
             self.next_screen_byte_index += 1
 
-        if port & 0x0001 != 0:
-            if 16384 <= port < 32768:
-                delays.append(self.delay_tstates[self.tstates])
-                self.tstates += self.delay_tstates[self.tstates] + 1
-                delays.append(self.delay_tstates[self.tstates])
-                self.tstates += self.delay_tstates[self.tstates] + 1
-                delays.append(self.delay_tstates[self.tstates])
-                self.tstates += self.delay_tstates[self.tstates] + 1
-                delays.append(self.delay_tstates[self.tstates])
-            else:
-                self.tstates += 3
-                delays.append(0)
-                delays.append(0)
-                delays.append(0)
-        else:
-            self.tstates += self.delay_tstates[self.tstates] + 3
-            delays.append(0)
-            delays.append(0)
-            delays.append(0)
-
-        self.profile.append(InPort(self.tstates, 4, *delays))
+        delays |= self._last_port_cycles(port)
+        self.records.add(IN_PORT, port, self.tstates, 4, 4, delays)
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
             self.update_next_screen_word()
@@ -200,36 +178,39 @@ class ProfilingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
         return self.ports.in_port(port)
 
     def out_port(self, port: int, value: int):
-        delays = []
-        if 16384 <= port < 32768:
-            delays.append(self.delay_tstates[self.tstates])
-            self.tstates += self.delay_tstates[self.tstates] + 1
-        else:
-            self.tstates += 1
-            delays.append(0)
+        delays = self._first_port_cycle(port)
 
         self.ports.out_port(port, value)
-        if port & 0x0001 != 0:
-            if 16384 <= port < 32768:
-                delays.append(self.delay_tstates[self.tstates])
-                self.tstates += self.delay_tstates[self.tstates] + 1
-                delays.append(self.delay_tstates[self.tstates])
-                self.tstates += self.delay_tstates[self.tstates] + 1
-                delays.append(self.delay_tstates[self.tstates])
-                self.tstates += self.delay_tstates[self.tstates] + 1
-            else:
-                self.tstates += 3
-                delays.append(0)
-                delays.append(0)
-                delays.append(0)
-        else:
-            self.tstates += self.delay_tstates[self.tstates] + 3
-            delays.append(0)
-            delays.append(0)
-            delays.append(0)
-
-        self.profile.append(OutPort(self.tstates, 4, *delays))
+        delays |= self._last_port_cycles(port)
+        self.records.add(OUT_PORT, port, self.tstates, 4, 4, delays)
 
         if self.tstates >= self.screen_byte_tstate[self.next_screen_byte_index]:
             self.update_next_screen_word()
             self.next_screen_byte_index += 1
+
+    # Port access is four 1 T-state cycles; returned are their delays, packed
+    def _first_port_cycle(self, port: int) -> int:
+        if 16384 <= port < 32768:
+            delay = self.delay_tstates[self.tstates]
+            self.tstates += delay + 1
+            return delay
+        self.tstates += 1
+        return 0
+
+    def _last_port_cycles(self, port: int) -> int:
+        if port & 0x0001 != 0:
+            if 16384 <= port < 32768:
+                delays = 0
+                for i in range(1, 4):
+                    delays |= self.delay_tstates[self.tstates] << (i * DELAY_BITS)
+                    self.tstates += self.delay_tstates[self.tstates] + 1
+                return delays
+            self.tstates += 3
+            return 0
+        delay = self.delay_tstates[self.tstates]
+        self.tstates += delay + 3
+        return delay << DELAY_BITS
+
+    def undo_fetch_opcode(self, address: int) -> None:
+        self.records.count -= 1
+        super().undo_fetch_opcode(address)
@@ -1,28 +1,46 @@
 import os.path
 
 import sys
+from typing import Optional, Callable
 
+import numpy as np
+
+from spectrum.accounting_spectrum_bus_access import AccountingZXSpectrum48ClockAndBusAccess
+from spectrum.ay import AY
+from spectrum.beeper import Beeper
+from spectrum.heatmap_spectrum_bus_access import HeatmapZXSpectrum48ClockAndBusAccess
+from spectrum.journaling_spectrum_bus_access import JournalingZXSpectrum48ClockAndBusAccess
 from spectrum.keyboard import Keyboard
+from spectrum.machine_state import MachineState, core_state, set_core_state, sound_state, set_sound_state
 from spectrum.profiling_spectrum_bus_access import ProfilingZXSpectrum48ClockAndBusAccess
 from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
 from spectrum.spectrum_ports import SpectrumPorts
+from spectrum.tape import LD_BYTES, SA_LD_RET, Tape, load_block
+from spectrum.tape_player import LoaderAccelerator, TapePlayer
 from spectrum.video import TSTATES_PER_INTERRUPT, Video
+from spectrum.watching_spectrum_bus_access import WatchingZXSpectrum48ClockAndBusAccess, Watches, watching_bus_access_class
 from utils.loader import Loader
-from z80.instructions import Instruction, AddrMode
-from z80.instructions.instruction_def import decode_instruction
-from z80.instructions.instructions import HALT
+from z80.instructions.profile import ProfiledInstructions
 from z80.memory import Memory
+from z80.pc_traps import PCTraps
 from z80.z80_cpu import Z80CPU
 
 ROMFILE = "zxspectrum48k.rom"
 
 
+def _no_screen_update() -> None:
+    pass
+
+
 # This class mostly instatiates and encapsulates several different parts
 # including memory, ports, bus access, processor and video
 class Spectrum:
-    def __init__(self):
+    def __init__(self, ay: bool = False):
         self.keyboard = Keyboard()
-        self.ports = SpectrumPorts(self.keyboard)
+        self.beeper = Beeper()
+        # Optional AY interface (Melodik style, on 128K ports 0xFFFD/0xBFFD)
+        self.ay: Optional[AY] = AY(self.beeper.sample_rate) if ay else None
+        self.ports = SpectrumPorts(self.keyboard, self.beeper, self.ay)
         self.memory = Memory()
 
         self.video = Video(self.memory, self.ports)
@@ -36,14 +54,53 @@ class Spectrum:
             self.memory,
             self.ports,
             self.video.update_next_screen_word)
+        self._journaling_bus_access = JournalingZXSpectrum48ClockAndBusAccess(
+            self.memory,
+            self.ports,
+            self.video.update_next_screen_word)
+        self.watches = Watches()
+        self._watching_bus_access = WatchingZXSpectrum48ClockAndBusAccess(
+            self.memory,
+            self.ports,
+            self.video.update_next_screen_word,
+            self.watches)
+        self._watching_bus_accesses = {(ZXSpectrum48ClockAndBusAccess, False, False, False): self._watching_bus_access}
+        self._accounting_bus_access = AccountingZXSpectrum48ClockAndBusAccess(
+            self.memory,
+            self.ports,
+            self.video.update_next_screen_word)
+        self._heatmap_bus_access = HeatmapZXSpectrum48ClockAndBusAccess(
+            self.memory,
+            self.ports,
+            self.video.update_next_screen_word)
+        # Kinds of bus selected by properties of the same names (see _select_bus_access())
+        self._watching = False
+        self._watched = (False, False, False)
+        self._accounting = False
+        self._heatmap = False
         self._bus_access = self._normal_bus_access
-        self.instructions = []
+        self.ports.clock = self._bus_access
+        self.instructions = ProfiledInstructions(self._profiling_bus_access.records, self.memory.mem)
+
+        # Receives PCM block (float32, mono, beeper.sample_rate) at the end of every frame
+        self.audio_sink: Optional[Callable[[np.ndarray], None]] = None
 
         self.z80 = Z80CPU(self._bus_access)
 
         self.loader = Loader(self.z80, self.ports)
 
+        self.traps = PCTraps(self.z80)
+
+        # Standard tape blocks are loaded by trap at ROM's LD-BYTES
+        self.tape: Optional[Tape] = None
+        self.traps.add(LD_BYTES, self._load_block_trap)
+
+        # Real time playback for custom loaders
+        self.tape_player: Optional[TapePlayer] = None
+        self.loader_accelerator: Optional[LoaderAccelerator] = None
+
         self.video_update_time = 0
+        self._rendering = True
 
         self.video.init()
 
@@ -54,10 +111,138 @@ class Spectrum:
     def bus_access(self, bus_access: ZXSpectrum48ClockAndBusAccess) -> None:
         self._bus_access = bus_access
         self.z80.bus_access = bus_access
+        self.ports.clock = bus_access
+
+    @property
+    def rendering(self) -> bool: return self._rendering
+
+    @rendering.setter
+    def rendering(self, rendering: bool) -> None:
+        # When rendering is off bus access doesn't update video buffer and end of frame doesn't touch screen surfaces
+        self._rendering = rendering
+        update_next_screen_word = self.video.update_next_screen_word if rendering else _no_screen_update
+        self._normal_bus_access.update_next_screen_word = update_next_screen_word
+        self._profiling_bus_access.update_next_screen_word = update_next_screen_word
+        self._journaling_bus_access.update_next_screen_word = update_next_screen_word
+        for bus_access in self._watching_bus_accesses.values():
+            bus_access.update_next_screen_word = update_next_screen_word
+        self._accounting_bus_access.update_next_screen_word = update_next_screen_word
+        self._heatmap_bus_access.update_next_screen_word = update_next_screen_word
+
+    @property
+    def journaling(self) -> bool: return self._bus_access is self._journaling_bus_access
+
+    @journaling.setter
+    def journaling(self, journaling: bool) -> None:
+        # Journaling bus logs old value of every written byte (see utils.write_journal)
+        if journaling == self.journaling:
+            return
+        if not journaling:
+            self._select_bus_access()
+            return
+        self._journaling_bus_access.copy_from_bus_access(self._bus_access)
+        del self._journaling_bus_access.journal[:]
+        self.bus_access = self._journaling_bus_access
+
+    @property
+    def watching(self) -> bool: return self._watching
+
+    @watching.setter
+    def watching(self, watching: bool) -> None:
+        # Watching bus reports accesses of watched pages and ports (see utils.debugger)
+        self._watching = watching
+        self._select_bus_access()
+
+    # Selects watching bus checking only given kinds of access (see self.watches)
+    def watch(self, reads: bool, writes: bool, ports: bool) -> None:
+        self._watched = (reads, writes, ports)
+        self._select_bus_access()
+
+    @property
+    def accounting(self) -> bool: return self._accounting
+
+    @accounting.setter
+    def accounting(self, accounting: bool) -> None:
+        # Accounting bus sums contention delays (see utils.frame_budget and utils.pc_accounting)
+        self._accounting = accounting
+        self._select_bus_access()
+
+    @property
+    def accounting_bus_access(self) -> AccountingZXSpectrum48ClockAndBusAccess: return self._accounting_bus_access
+
+    @property
+    def heatmap(self) -> bool: return self._heatmap
+
+    @heatmap.setter
+    def heatmap(self, heatmap: bool) -> None:
+        # Heatmap bus counts accesses per address (see utils.memory_heatmap) and sums contention as accounting one
+        self._heatmap = heatmap
+        self._select_bus_access()
+
+    @property
+    def heatmap_bus_access(self) -> HeatmapZXSpectrum48ClockAndBusAccess: return self._heatmap_bus_access
+
+    # Heatmap bus (which also accounts) or accounting bus if selected, with watching checks
+    # over it if watching, so watchpoints don't turn off contention accounting or heatmap
+    def _select_bus_access(self) -> None:
+        if self._heatmap:
+            bus_access = self._heatmap_bus_access
+        elif self._accounting:
+            bus_access = self._accounting_bus_access
+        else:
+            bus_access = self._normal_bus_access
+        if self._watching:
+            bus_access = self._watching_bus_access_over(bus_access)
+        if bus_access is not self._bus_access:
+            bus_access.copy_from_bus_access(self._bus_access)
+            self.bus_access = bus_access
+
+    def _watching_bus_access_over(self, base: ZXSpectrum48ClockAndBusAccess) -> WatchingZXSpectrum48ClockAndBusAccess:
+        key = (type(base), *self._watched)
+        bus_access = self._watching_bus_accesses.get(key)
+        if bus_access is None:
+            bus_access = watching_bus_access_class(*self._watched, type(base))(
+                self.memory,
+                self.ports,
+                self._normal_bus_access.update_next_screen_word,
+                self.watches)
+            if isinstance(base, HeatmapZXSpectrum48ClockAndBusAccess):
+                # Same counters, so utils.memory_heatmap sees accesses counted under watchpoints
+                bus_access.reads, bus_access.writes, bus_access.executes = base.reads, base.writes, base.executes
+            self._watching_bus_accesses[key] = bus_access
+        self._watching_bus_access = bus_access
+        return bus_access
+
+    @property
+    def watching_bus_access(self) -> WatchingZXSpectrum48ClockAndBusAccess: return self._watching_bus_access
+
+    def save_state(self, state: Optional[MachineState] = None) -> MachineState:
+        if state is None:
+            state = MachineState()
+        state.save(self.memory, self.z80, self._bus_access, self.video, self.beeper, self.ay)
+        return state
+
+    def restore_state(self, state: MachineState) -> None:
+        state.restore(self.memory, self.z80, self._bus_access, self.video, self.beeper, self.ay)
+        self.traps.refresh()
+
+    # CPU, bus and video beam state (see spectrum.machine_state)
+    def core_state(self) -> tuple:
+        return core_state(self.z80, self._bus_access, self.video)
+
+    def set_core_state(self, state: tuple) -> None:
+        set_core_state(state, self.z80, self._bus_access, self.video)
+
+    def sound_state(self) -> tuple:
+        return sound_state(self.beeper, self.ay)
+
+    def set_sound_state(self, state: tuple) -> None:
+        set_sound_state(state, self.beeper, self.ay)
 
     def load_rom(self, romfilename):
         with open(os.path.join(os.path.dirname(__file__), romfilename), "rb") as rom:
             rom.readinto(self.memory.mem)
+        self.traps.refresh()
 
         print(f"Loaded ROM: {romfilename}")
 
@@ -66,6 +251,9 @@ class Spectrum:
         self.ports.out_port(254, 0xff)  # white border on startup
         self.z80.reset()
         self.bus_access.reset()
+        self.beeper.reset()
+        if self.ay is not None:
+            self.ay.reset()
 
         sys.setswitchinterval(255)  # we don't use threads, kind of speed up
 
@@ -74,44 +262,113 @@ class Spectrum:
 
     def end_frame(self) -> None:
         self.bus_access.end_frame(TSTATES_PER_INTERRUPT)
-        self.video.update_screen()
+        if self.audio_sink is not None:
+            block = self.beeper.end_frame(TSTATES_PER_INTERRUPT)
+            if self.ay is not None:
+                # Both use same sample grid so blocks are always of the same length
+                block += self.ay.end_frame(TSTATES_PER_INTERRUPT)
+            self.audio_sink(block)
+        else:
+            self.beeper.skip_frame(TSTATES_PER_INTERRUPT)
+            if self.ay is not None:
+                self.ay.skip_frame(TSTATES_PER_INTERRUPT)
+        if self._rendering:
+            self.video.update_screen()
         self.video.start_screen()
 
     def execute(self, tstate_limit: int) -> None:
         self.z80.execute(tstate_limit)
 
     def profile(self, tstate_limit: int = TSTATES_PER_INTERRUPT) -> None:
-        ptr = [0]
-
-        def next_byte() -> int:
-            p = ptr[0]
-            ptr[0] += 1
-            return self.memory.mem[p]
-
-        self._profiling_bus_access.copy_from_bus_access(self._normal_bus_access)
+        mem = self.memory.mem
+        previous_bus_access = self._bus_access
+        self._profiling_bus_access.copy_from_bus_access(previous_bus_access)
         self._bus_access = self._profiling_bus_access
         self.z80.bus_access = self._profiling_bus_access
-        del self.instructions[:]
+        self.ports.clock = self._profiling_bus_access
+        records = self._profiling_bus_access.records
+        records.clear()
+        self.instructions.clear()
         while self.bus_access.tstates < tstate_limit:
-            self._profiling_bus_access.profile = []
             address = self.z80.regPC
-            ptr[0] = address
-            # code = self.memory.mem[address]
-            tstates = self._profiling_bus_access.tstates
+            # First four bytes of instruction as they were before it executed
+            code = mem[address] | (mem[(address + 1) & 0xffff] << 8) | (mem[(address + 2) & 0xffff] << 16) | (mem[(address + 3) & 0xffff] << 24)
+            self.instructions.add(address, self._profiling_bus_access.tstates, code, records.count)
             self.z80.execute_one_cycle()
-            if self.z80.halted:
-                instruction = Instruction(address, HALT(), AddrMode.SIMPLE)
-            else:
-                instruction = decode_instruction(address, next_byte)
-            instruction.profile = self._profiling_bus_access.profile
-            instruction.tstates = tstates
-            self.instructions.append(instruction)
-        self._normal_bus_access.copy_from_bus_access(self._profiling_bus_access)
-        self._bus_access = self._normal_bus_access
+        previous_bus_access.copy_from_bus_access(self._profiling_bus_access)
+        self._bus_access = previous_bus_access
         self.z80.bus_access = self._bus_access
+        self.ports.clock = self._bus_access
 
     def load_sna(self, filename: str) -> None:
         self.loader.load_sna(filename)
+        self.traps.refresh()
+
+    # Type of snapshot (.sna, .z80 or .szx) is taken from file extension
+    def load_snapshot(self, filename: str) -> None:
+        self.loader.load(filename)
+        self.traps.refresh()
+
+    def save_snapshot(self, filename: str) -> None:
+        self.loader.save(filename, self.bus_access.tstates)
+
+    def insert_tape(self, filename: str) -> None:
+        self.eject_tape()
+        self.tape = Tape(filename)
+
+    def eject_tape(self) -> None:
+        self.tape_player = None
+        self.ports.tape_player = None
+        self._set_loader_accelerator(False)
+        if self.tape is not None:
+            self.tape.close()
+            self.tape = None
+
+    def _now(self) -> int:
+        return self._bus_access.frames * TSTATES_PER_INTERRUPT + self._bus_access.tstates
+
+    # Plays inserted tape in real time (up to the next 'stop the tape'). ROM trap is not used after this.
+    def play_tape(self, accelerate: bool = True) -> None:
+        if self.tape is None:
+            return
+        if self.tape_player is None:
+            self.tape_player = TapePlayer(self.tape)
+            self.ports.tape_player = self.tape_player
+        self._set_loader_accelerator(accelerate)
+        self.tape_player.play(self._now())
+
+    def stop_tape(self) -> None:
+        if self.tape_player is not None:
+            self.tape_player.stop(self._now())
+
+    def _load_block_trap(self, z80: Z80CPU) -> Optional[int]:
+        if self.tape is not None and self.tape_player is None and load_block(z80, self.tape):
+            # Block is copied directly into memory
+            self.traps.refresh()
+            return SA_LD_RET
+        return None
+
+    def _set_loader_accelerator(self, accelerate: bool) -> None:
+        if accelerate:
+            if self.loader_accelerator is None:
+                self.loader_accelerator = LoaderAccelerator(self.z80, self.tape_player, self.keyboard.row_table)
+            self.traps.hook_opcode(0xdb, self._accelerate_in_a_n)
+            self.traps.hook_opcode(0x3d, self._accelerate_dec_a)
+            self.traps.hook_opcode(0x10, self._accelerate_djnz)
+        else:
+            self.loader_accelerator = None
+            self.traps.unhook_opcode(0xdb, self._accelerate_in_a_n)
+            self.traps.unhook_opcode(0x3d, self._accelerate_dec_a)
+            self.traps.unhook_opcode(0x10, self._accelerate_djnz)
+
+    def _accelerate_in_a_n(self) -> None:
+        self.loader_accelerator.accelerate(self._bus_access)
+
+    def _accelerate_dec_a(self) -> None:
+        self.loader_accelerator.accelerate_dec_a(self._bus_access)
+
+    def _accelerate_djnz(self) -> None:
+        self.loader_accelerator.accelerate_djnz(self._bus_access)
 
     def execute_one_instruction(self) -> bool:
         self.z80.execute_one_cycle()
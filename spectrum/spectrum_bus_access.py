@@ -82,6 +82,18 @@ class ZXSpectrum48ClockAndBusAccess(ClockAndBusAccess):
         t = self.memory.peekb(address)
         return t
 
+    def undo_fetch_opcode(self, address: int) -> None:
+        if 16384 <= address < 32768:
+            # Contention makes several starting T-states end at the same one;
+            # any of them leads to identical state when opcode is fetched again
+            end = self.tstates
+            start = end - 4
+            while start + self.delay_tstates[start] + 4 != end:
+                start -= 1
+            self.tstates = start
+        else:
+            self.tstates -= 4
+
     def peekb(self, address: int) -> int:
         if 16384 <= address < 32768:
             self.tstates += self.delay_tstates[self.tstates] + 3
@@ -1,18 +1,46 @@
+from typing import Optional, TYPE_CHECKING
+
 from spectrum.keyboard import Keyboard
+from z80.bus_access import ClockAndBusAccess
 from z80.ports import Ports
 
+if TYPE_CHECKING:
+    # spectrum.beeper and spectrum.ay depend on spectrum.video which depends on this module
+    from spectrum.ay import AY
+    from spectrum.beeper import Beeper
+    from spectrum.tape_player import TapePlayer
+
+
+DECODED_ADDRESS_BITS = 0xc0ff
+
+
+def _no_out(_port: int, _value: int) -> None:
+    pass
+
 
 # This implementation is from PyZX
 # https://github.com/Q-Master/PyZX/blob/master/ports.py
 class SpectrumPorts(Ports):
-    def __init__(self, keyboard: Keyboard):
+    def __init__(self, keyboard: Keyboard, beeper: Optional['Beeper'] = None, ay: Optional['AY'] = None):
         self.keyboard = keyboard
+        self.row_table = keyboard.row_table
+        self.beeper = beeper
+        self.ay = ay
+        # Bus access used for time stamping of port writes (set by owner of the bus)
+        self.clock: Optional[ClockAndBusAccess] = None
         self.current_border = 0
+        # EAR input (bit 6 of port 0xFE) while tape is playing
+        self.tape_player: Optional['TapePlayer'] = None
 
         self.PORTMAP = [
             (0x0001, 0x00fe, 2, 2, 2, self.xInFE, self.xOutFE),  # keyboard
-            # (0xc002, 0xfffd, 2, 2, 2, xInFFFD, xOutFFFD),
-            # (0xc002, 0xbffd, 2, 2, 2, None, xOutBFFD),      # AYdataW
+        ]
+        if ay is not None:
+            self.PORTMAP += [
+                (0xc002, 0xfffd, 2, 2, 2, self.xInFFFD, self.xOutFFFD),  # AY register select / read
+                (0xc002, 0xbffd, 2, 2, 2, None, self.xOutBFFD),          # AYdataW
+            ]
+        self.PORTMAP += [
             # (0x0320, 0xfadf, 2, 2, 2, xInFADF, None),       # K-MOUSEturboB
             # (0x0720, 0xfbdf, 2, 2, 2, xInFBDF, None),       # K-MOUSE_X
             # (0x0720, 0xffdf, 2, 2, 2, xInFFDF, None),      # K-MOUSE_Y
@@ -20,42 +48,43 @@ class SpectrumPorts(Ports):
             (0x0000, 0x0000, 0, 2, 2, self.spInFF, None),  # all unknown ports is FF (nodos)
             (0x0000, 0x0000, 2, 2, 2, self.spInFF, None)
         ]
+        self.update_decode_tables()
+
+    # All devices decode only A0-A7 and A14-A15 so PORTMAP is resolved once into tables
+    # indexed by those ten bits. Must be called again if PORTMAP is changed.
+    def update_decode_tables(self) -> None:
+        for mask, value, _, _, _, _, _ in self.PORTMAP:
+            if mask & ~DECODED_ADDRESS_BITS:
+                raise ValueError(f"Port mask 0x{mask:04x} uses address bits outside of 0x{DECODED_ADDRESS_BITS:04x}")
+
+        self.in_table = [self.spInFF] * 1024
+        self.out_table = [_no_out] * 1024
+        for index in range(1024):
+            port = (index & 0xff) | ((index & 0x300) << 6)
+            for mask, value, _, _, _, fin, fout in self.PORTMAP:
+                if port & mask == value & mask:
+                    self.in_table[index] = fin if fin else self.spInFF
+                    self.out_table[index] = fout if fout else _no_out
+                    break
 
     def xInFE(self, port: int) -> int:
-        res = 0xff
-        k = self.keyboard.keyboard
-        if (port & 0x8000) == 0:
-            res &= k[0]  # _B_SPC
-        if (port & 0x4000) == 0:
-            res &= k[1]  # _H_ENT
-        if (port & 0x2000) == 0:
-            res &= k[2]  # _Y_P
-        if (port & 0x1000) == 0:
-            res &= k[3]  # _6_0
-        if (port & 0x0800) == 0:
-            res &= k[4]  # _1_5
-        if (port & 0x0400) == 0:
-            res &= k[5]  # _Q_T
-        if (port & 0x0200) == 0:
-            res &= k[6]  # _A_G
-        if (port & 0x0100) == 0:
-            res &= k[7]  # _CAPS_V
-        return res
+        if self.tape_player is not None and not self.tape_player.ear(self.clock):
+            return self.row_table[port >> 8] & 0xbf
+        return self.row_table[port >> 8]
 
     def xOutFE(self, _port: int, value: int):
         self.current_border = value & 0x07
+        if self.beeper is not None and self.clock is not None:
+            self.beeper.out(self.clock.tstates, value)
 
-    @staticmethod
-    def xInFFFD(_port: int) -> int:
-        return 0xff
+    def xInFFFD(self, _port: int) -> int:
+        return self.ay.read()
 
-    @staticmethod
-    def xOutFFFD(_port: int, _value: int):
-        return 0xff
+    def xOutFFFD(self, _port: int, value: int):
+        self.ay.select(value)
 
-    @staticmethod
-    def xOutBFFD(_port: int, _value: int):
-        return 0xff
+    def xOutBFFD(self, _port: int, value: int):
+        self.ay.write(self.clock.tstates if self.clock is not None else 0, value)
 
     @staticmethod
     def xInFADF(_port: int) -> int:
@@ -77,14 +106,7 @@ class SpectrumPorts(Ports):
         return 0xff
 
     def in_port(self, portnum: int) -> int:
-        for mask, value, _, _, _, fin, _ in self.PORTMAP:
-            if portnum & mask == value & mask:
-                return fin(portnum) if fin else 0xff
-        return 0xff
+        return self.in_table[(portnum & 0xff) | ((portnum & 0xc000) >> 6)](portnum)
 
     def out_port(self, portnum: int, data: int):
-        for mask, value, _, _, _, _, fout in self.PORTMAP:
-            if portnum & mask == value & mask:
-                if fout:
-                    fout(portnum, data)
-                break
+        self.out_table[(portnum & 0xff) | ((portnum & 0xc000) >> 6)](portnum, data)
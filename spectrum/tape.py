@@ -0,0 +1,253 @@
+import mmap
+import os
+from typing import Optional
+
+import numpy as np
+
+from z80.z80_cpu import Z80CPU
+
+
+TZX_SIGNATURE = b"ZXTape!\x1a"
+
+ID_STANDARD = 0x10
+ID_TURBO = 0x11
+ID_PURE_TONE = 0x12
+ID_PULSES = 0x13
+ID_PURE_DATA = 0x14
+ID_DIRECT_RECORDING = 0x15
+ID_PAUSE = 0x20
+ID_GROUP_START = 0x21
+ID_GROUP_END = 0x22
+ID_LOOP_START = 0x24
+ID_LOOP_END = 0x25
+ID_STOP_48K = 0x2a
+ID_SET_LEVEL = 0x2b
+
+LD_BYTES = 0x0556
+SA_LD_RET = 0x053f
+
+
+def word_at(data, offset: int) -> int:
+    return data[offset] | (data[offset + 1] << 8)
+
+
+def triple_at(data, offset: int) -> int:
+    return data[offset] | (data[offset + 1] << 8) | (data[offset + 2] << 16)
+
+
+def dword_at(data, offset: int) -> int:
+    return word_at(data, offset) | (word_at(data, offset + 2) << 16)
+
+
+# Length of TZX block body (after the ID byte) for each block type. Unknown blocks
+# follow the extension rule of the format - body starts with its 32bit length.
+TZX_BLOCK_LENGTHS = {
+    0x10: lambda d, o: 4 + word_at(d, o + 2),
+    0x11: lambda d, o: 18 + triple_at(d, o + 15),
+    0x12: lambda d, o: 4,
+    0x13: lambda d, o: 1 + 2 * d[o],
+    0x14: lambda d, o: 10 + triple_at(d, o + 7),
+    0x15: lambda d, o: 8 + triple_at(d, o + 5),
+    0x18: lambda d, o: 4 + dword_at(d, o),
+    0x19: lambda d, o: 4 + dword_at(d, o),
+    0x20: lambda d, o: 2,
+    0x21: lambda d, o: 1 + d[o],
+    0x22: lambda d, o: 0,
+    0x23: lambda d, o: 2,
+    0x24: lambda d, o: 2,
+    0x25: lambda d, o: 0,
+    0x26: lambda d, o: 2 + 2 * word_at(d, o),
+    0x27: lambda d, o: 0,
+    0x28: lambda d, o: 2 + word_at(d, o),
+    0x2a: lambda d, o: 4,
+    0x2b: lambda d, o: 5,
+    0x30: lambda d, o: 1 + d[o],
+    0x31: lambda d, o: 2 + d[o + 1],
+    0x32: lambda d, o: 2 + word_at(d, o),
+    0x33: lambda d, o: 1 + 3 * d[o],
+    0x35: lambda d, o: 20 + dword_at(d, o + 16),
+    0x5a: lambda d, o: 9,
+}
+
+
+class TapeError(Exception):
+    pass
+
+
+# Block of tape. For TAP files every block is a standard speed data block (ID 0x10).
+# 'body' is everything after the ID byte and 'data' are bytes the block carries (if any),
+# both memoryviews into the mapped file.
+class TapeBlock:
+    def __init__(self, block_id: int, body: memoryview, data: Optional[memoryview] = None, pause: int = 1000) -> None:
+        self.id = block_id
+        self.body = body
+        self.data = data
+        self.pause = pause
+
+    @property
+    def standard(self) -> bool:
+        return self.id == ID_STANDARD
+
+
+# Tape file mapped into memory. Blocks are located only when asked for
+# so opening even a very large compilation is instant.
+class Tape:
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._file = open(filename, "rb")
+        if os.path.getsize(filename) > 0:
+            self._map: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+        else:
+            self._map = None
+            self._view = memoryview(b"")
+
+        self.tzx = self._view[:len(TZX_SIGNATURE)] == TZX_SIGNATURE
+        self._offset = len(TZX_SIGNATURE) + 2 if self.tzx else 0
+        self._blocks: list[TapeBlock] = []
+        self.position = 0
+
+    def close(self) -> None:
+        # Every view into the map has to be released before it can be closed
+        for block in self._blocks:
+            block.body.release()
+            if block.data is not None:
+                block.data.release()
+        self._blocks = []
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def rewind(self) -> None:
+        self.position = 0
+
+    def _parse_next(self) -> bool:
+        view = self._view
+        offset = self._offset
+        if offset >= len(view):
+            return False
+
+        if not self.tzx:
+            if offset + 2 > len(view):
+                raise TapeError(f"Truncated TAP block at offset {offset}")
+            length = word_at(view, offset)
+            data = view[offset + 2:offset + 2 + length]
+            if len(data) != length:
+                raise TapeError(f"Truncated TAP block at offset {offset}")
+            block = TapeBlock(ID_STANDARD, view[offset:offset + 2 + length], data)
+            self._offset = offset + 2 + length
+        else:
+            block_id = view[offset]
+            body_offset = offset + 1
+            length_of = TZX_BLOCK_LENGTHS.get(block_id)
+            length = length_of(view, body_offset) if length_of is not None else 4 + dword_at(view, body_offset)
+            body = view[body_offset:body_offset + length]
+            if len(body) != length:
+                raise TapeError(f"Truncated TZX block 0x{block_id:02x} at offset {offset}")
+            block = TapeBlock(block_id, body)
+            if block_id == ID_STANDARD:
+                block.pause = word_at(body, 0)
+                block.data = body[4:]
+            elif block_id == ID_TURBO:
+                block.pause = word_at(body, 13)
+                block.data = body[18:]
+            elif block_id == ID_PURE_DATA:
+                block.pause = word_at(body, 8)
+                block.data = body[10:]
+            self._offset = body_offset + length
+
+        self._blocks.append(block)
+        return True
+
+    def block(self, index: int) -> Optional[TapeBlock]:
+        while index >= len(self._blocks):
+            if not self._parse_next():
+                return None
+        return self._blocks[index]
+
+    def blocks(self):
+        index = 0
+        while True:
+            block = self.block(index)
+            if block is None:
+                return
+            yield block
+            index += 1
+
+    # Next standard speed block, from the current position - used by ROM loader trap
+    def next_standard_block(self) -> Optional[TapeBlock]:
+        while True:
+            block = self.block(self.position)
+            if block is None:
+                return None
+            self.position += 1
+            if block.standard and block.data is not None and len(block.data) > 0:
+                return block
+
+
+# Does what ROM's LD-BYTES does with the next standard block of the tape: expects A - flag byte,
+# carry - load (otherwise verify), IX - destination and DE - length. Registers are left as ROM
+# would leave them when jumping to SA/LD-RET. Returns False if there is no standard block left.
+def load_block(z80: Z80CPU, tape: Tape) -> bool:
+    block = tape.next_standard_block()
+    if block is None:
+        return False
+
+    data = block.data
+    expected_flag = z80.regA
+    load = z80.carryFlag
+    address = z80.regIX
+    length = z80.get_reg_DE()
+    memory = z80.bus_access.memory
+
+    flag = data[0]
+    if flag != expected_flag:
+        # LD-FLAG: XOR C / RET NZ
+        z80.regA = flag ^ expected_flag
+        z80.set_flags(0)
+        return True
+
+    available = min(length, len(data) - 1)
+    payload = data[1:1 + available]
+    parity = flag ^ (int(np.bitwise_xor.reduce(np.frombuffer(payload, dtype=np.uint8))) if available > 0 else 0)
+
+    if load:
+        if address >= 16384 and address + available <= 65536:
+            memory.mem[address:address + available] = payload
+        else:
+            for i in range(available):
+                memory.pokeb((address + i) & 0xffff, payload[i])
+    else:
+        current = bytes(memory.mem[address:address + available]) if address + available <= 65536 else \
+            bytes(memory.mem[(address + i) & 0xffff] for i in range(available))
+        if current != bytes(payload):
+            # LD-VERIFY: LD A,(IX+0) / XOR L / RET NZ, with the byte already in L and H
+            mismatch = next(i for i in range(available) if current[i] != payload[i])
+            z80.regIX = (address + mismatch) & 0xffff
+            z80.set_reg_DE(length - mismatch)
+            z80.regL = payload[mismatch]
+            z80.regH = flag ^ (int(np.bitwise_xor.reduce(np.frombuffer(payload[:mismatch + 1], dtype=np.uint8))))
+            z80.regA = current[mismatch]
+            z80._xor(payload[mismatch])
+            return True
+
+    z80.regIX = (address + available) & 0xffff
+    z80.set_reg_DE(length - available)
+    if available > 0:
+        z80.regL = payload[available - 1]
+
+    if available == length and len(data) > length + 1:
+        # LD-8-BITS for parity byte (left in L), then LD A,H / CP 01
+        z80.regL = data[length + 1]
+        parity ^= data[length + 1]
+        z80.regH = parity
+        z80.regA = parity
+        z80._cp(1)
+    else:
+        # Block ended too early - ROM would return with carry reset
+        z80.regH = parity
+        z80.regA = 0
+        z80.set_flags(0)
+
+    return True
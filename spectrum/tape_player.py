@@ -0,0 +1,424 @@
+from array import array
+from bisect import bisect_right
+from typing import Optional
+
+import numpy as np
+
+from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
+from spectrum.tape import Tape, word_at
+from spectrum.video import TSTATES_PER_INTERRUPT
+from z80.z80_cpu import Z80CPU
+
+
+TSTATES_PER_MS = 3500
+
+PILOT_PULSE = 2168
+HEADER_PILOT_PULSES = 8063
+DATA_PILOT_PULSES = 3223
+SYNC1_PULSE = 667
+SYNC2_PULSE = 735
+ZERO_PULSE = 855
+ONE_PULSE = 1710
+
+
+# Part of the tape between two 'stop the tape' points. Edges are T-states of level
+# transitions from the start of the segment.
+class TapeSegment:
+    def __init__(self, edges: array, length: int, start_level: int) -> None:
+        self.edges = edges
+        self.length = length
+        self.start_level = start_level
+
+    @property
+    def end_level(self) -> int:
+        return self.start_level ^ (len(self.edges) & 1)
+
+
+def data_pulses(data: memoryview, zero: int, one: int, used_bits: int = 8) -> np.ndarray:
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    if len(bits) > 0 and used_bits < 8:
+        bits = bits[:len(bits) - 8 + used_bits]
+    return np.repeat(np.where(bits == 1, one, zero), 2)
+
+
+# Collects level transitions of the tape. Every pulse starts with a transition.
+class EdgeWriter:
+    def __init__(self) -> None:
+        self.segments: list[TapeSegment] = []
+        self.parts: list[np.ndarray] = []
+        self.time = 0
+        self.level = 0
+        self.start_level = 0
+        self.pulse_ended = True
+
+    def pulses(self, lengths: np.ndarray) -> None:
+        if len(lengths) == 0:
+            return
+        lengths = lengths.astype(np.int64)
+        ends = np.cumsum(lengths)
+        self.parts.append(self.time + ends - lengths)
+        self.time += int(ends[-1])
+        self.level ^= len(lengths) & 1
+        self.pulse_ended = False
+
+    def edge(self) -> None:
+        self.parts.append(np.array([self.time], dtype=np.int64))
+        self.level ^= 1
+
+    def end_pulse(self) -> None:
+        if not self.pulse_ended:
+            self.edge()
+            self.pulse_ended = True
+
+    def pause(self, ms: int) -> None:
+        # Pause of 0 means 'stop the tape'
+        self.end_pulse()
+        if ms == 0:
+            self.stop()
+            return
+        # Level goes low 1ms into the pause
+        if self.level:
+            self.time += TSTATES_PER_MS
+            self.edge()
+            ms -= 1
+        self.time += ms * TSTATES_PER_MS
+
+    def set_level(self, level: int) -> None:
+        self.end_pulse()
+        if level != self.level:
+            self.edge()
+
+    def samples(self, tstates_per_sample: int, levels: np.ndarray) -> None:
+        if len(levels) == 0:
+            return
+        self.end_pulse()
+        changes = np.flatnonzero(np.diff(levels, prepend=np.uint8(self.level)))
+        self.parts.append(self.time + changes.astype(np.int64) * tstates_per_sample)
+        self.time += len(levels) * tstates_per_sample
+        self.level = int(levels[-1])
+
+    def stop(self) -> None:
+        edges = array('q')
+        if self.parts:
+            edges.frombytes(np.concatenate(self.parts).tobytes())
+        if len(edges) > 0 or self.time > 0:
+            self.segments.append(TapeSegment(edges, self.time, self.start_level))
+        self.parts = []
+        self.time = 0
+        self.start_level = self.level
+
+    def standard(self, data: memoryview, pilot: int, pilot_pulses: int,
+                 sync1: int, sync2: int, zero: int, one: int, used_bits: int) -> None:
+        self.pulses(np.full(pilot_pulses, pilot, dtype=np.int64))
+        self.pulses(np.array([sync1, sync2], dtype=np.int64))
+        self.pulses(data_pulses(data, zero, one, used_bits))
+
+
+# Converts the whole tape to level transitions. Loops are unrolled; jumps, calls and
+# generalised data blocks (0x19) are not supported and are skipped.
+def tape_segments(tape: Tape) -> list[TapeSegment]:
+    blocks = list(tape.blocks())
+    writer = EdgeWriter()
+    loops: list[list[int]] = []
+    index = 0
+    while index < len(blocks):
+        block = blocks[index]
+        body = block.body
+        if block.id == 0x10:
+            pilot_pulses = HEADER_PILOT_PULSES if len(block.data) > 0 and block.data[0] < 128 else DATA_PILOT_PULSES
+            writer.standard(block.data, PILOT_PULSE, pilot_pulses, SYNC1_PULSE, SYNC2_PULSE, ZERO_PULSE, ONE_PULSE, 8)
+            writer.pause(block.pause)
+        elif block.id == 0x11:
+            writer.standard(block.data, word_at(body, 0), word_at(body, 10), word_at(body, 2), word_at(body, 4),
+                            word_at(body, 6), word_at(body, 8), body[12])
+            writer.pause(block.pause)
+        elif block.id == 0x12:
+            writer.pulses(np.full(word_at(body, 2), word_at(body, 0), dtype=np.int64))
+        elif block.id == 0x13:
+            writer.pulses(np.frombuffer(body[1:], dtype='<u2'))
+        elif block.id == 0x14:
+            writer.pulses(data_pulses(block.data, word_at(body, 0), word_at(body, 2), body[4]))
+            writer.pause(block.pause)
+        elif block.id == 0x15:
+            levels = np.unpackbits(np.frombuffer(body[8:], dtype=np.uint8))
+            if len(levels) > 0 and body[4] < 8:
+                levels = levels[:len(levels) - 8 + body[4]]
+            writer.samples(word_at(body, 0), levels)
+            writer.pause(word_at(body, 2))
+        elif block.id == 0x20:
+            writer.pause(word_at(body, 0))
+        elif block.id == 0x24:
+            loops.append([index, word_at(body, 0)])
+        elif block.id == 0x25 and loops:
+            loops[-1][1] -= 1
+            if loops[-1][1] > 0:
+                index = loops[-1][0]
+            else:
+                loops.pop()
+        elif block.id == 0x2a:
+            writer.end_pulse()
+            writer.stop()
+        elif block.id == 0x2b:
+            writer.set_level(body[4] & 1)
+        index += 1
+
+    writer.end_pulse()
+    writer.stop()
+    return writer.segments
+
+
+# Plays the tape in real time: EAR level at any moment is bisect into precomputed
+# transitions. Time is absolute - frames * TSTATES_PER_INTERRUPT + tstates.
+# Playing stops at the end of each segment; play() continues with the next one.
+class TapePlayer:
+    def __init__(self, tape: Tape) -> None:
+        self.segments = tape_segments(tape)
+        self.segment_index = -1
+        self.edges = array('q')
+        self.origin = 0
+        self.end = 0
+        self.start_level = 0
+        self.stopped_level = 0
+        self.playing = False
+
+    @property
+    def finished(self) -> bool:
+        return self.segment_index >= len(self.segments) - 1 and not self.playing
+
+    def play(self, now: int) -> None:
+        if self.playing or self.segment_index >= len(self.segments) - 1:
+            return
+        self.segment_index += 1
+        segment = self.segments[self.segment_index]
+        self.edges = segment.edges
+        self.start_level = self.stopped_level
+        self.origin = now
+        self.end = now + segment.length
+        self.playing = True
+
+    def stop(self, now: int) -> None:
+        if self.playing:
+            self.stopped_level = self.level(now)
+            self.playing = False
+
+    def level(self, now: int) -> int:
+        if not self.playing:
+            return self.stopped_level
+        if now >= self.end:
+            self.stopped_level = self.start_level ^ (len(self.edges) & 1)
+            self.playing = False
+            return self.stopped_level
+        return self.start_level ^ (bisect_right(self.edges, now - self.origin) & 1)
+
+    # Absolute time of the first transition after 'now', or None if there is none while playing
+    def next_edge(self, now: int) -> Optional[int]:
+        if not self.playing:
+            return None
+        index = bisect_right(self.edges, now - self.origin)
+        return self.origin + self.edges[index] if index < len(self.edges) else None
+
+    def ear(self, clock: ZXSpectrum48ClockAndBusAccess) -> int:
+        return self.level(clock.frames * TSTATES_PER_INTERRUPT + clock.tstates)
+
+
+# Edge sampling loop of a tape loader - the ROM's LD-SAMPLE and similar loops in custom loaders:
+#
+#   [INC B / RET Z] [LD A,n] IN A,(n) [RRA] [RET NC] XOR C / AND m / JR Z,loop
+#
+# T-states are counted from just after the fetch of IN's opcode to the same point of the next iteration.
+class EdgeLoop:
+    def __init__(self, start: int, end: int, code: bytes, port: int, load_a: Optional[int], inc_b: bool,
+                 rra: bool, ret_nc: bool, mask: int) -> None:
+        self.start = start
+        self.end = end
+        self.code = code
+        self.port = port
+        self.load_a = load_a
+        self.inc_b = inc_b
+        self.rra = rra
+        self.ret_nc = ret_nc
+        self.mask = mask
+
+        self.tstates_after_in = (4 if rra else 0) + (5 if ret_nc else 0) + 4 + 7 + 12
+        self.tstates_before_in = (9 if inc_b else 0) + (7 if load_a is not None else 0) + 4
+        self.instructions = (2 if inc_b else 0) + (1 if load_a is not None else 0) + 1 + (1 if rra else 0) + (1 if ret_nc else 0) + 3
+
+    def continues(self, value: int, regC: int) -> bool:
+        if self.ret_nc and not value & 0x01:
+            return False
+        if self.rra:
+            value >>= 1
+        return ((value ^ regC) & self.mask) == 0
+
+
+def find_edge_loop(mem: memoryview, in_address: int) -> Optional[EdgeLoop]:
+    if in_address > 0xfff0:
+        return None
+    if mem[in_address] != 0xdb or mem[in_address + 1] & 0x01:
+        return None
+
+    address = in_address + 2
+    rra = mem[address] == 0x1f
+    if rra:
+        address += 1
+    ret_nc = mem[address] == 0xd0
+    if ret_nc:
+        address += 1
+    if mem[address] != 0xa9 or mem[address + 1] != 0xe6 or mem[address + 3] != 0x28:
+        return None
+    mask = mem[address + 2]
+    if rra and mask & 0x80 or mask == 0:
+        return None
+
+    end = address + 5
+    offset = mem[address + 4]
+    start = end + (offset - 256 if offset > 127 else offset)
+    # Whole loop has to be in uncontended memory so only IN's port access depends on the beam
+    if start > in_address or (start < 0x8000 and end > 0x4000):
+        return None
+
+    prefix = bytes(mem[start:in_address])
+
+    inc_b = prefix[:2] == b"\x04\xc8"
+    if inc_b:
+        prefix = prefix[2:]
+    load_a = None
+    if len(prefix) == 2 and prefix[0] == 0x3e:
+        load_a = prefix[1]
+        prefix = b""
+    if prefix:
+        return None
+
+    return EdgeLoop(start, end, bytes(mem[start:end]), mem[in_address + 1], load_a, inc_b, rra, ret_nc, mask)
+
+
+# T-states from just after the opcode fetch of the loop instruction to the same point of the next iteration
+DEC_A_JR_NZ_ITERATION = 16
+DJNZ_ITERATION = 13
+
+
+def _uncontended_loop(z80: Z80CPU, address: int, length: int) -> bool:
+    return not z80.ffIFF1 and not 0x40 <= z80.regI < 0x80 and (address >= 0x8000 or address + length <= 0x4000)
+
+
+def _catch_up_screen(clock: ZXSpectrum48ClockAndBusAccess) -> None:
+    while clock.tstates >= clock.screen_byte_tstate[clock.next_screen_byte_index]:
+        clock.update_next_screen_word()
+        clock.next_screen_byte_index += 1
+
+
+# Skips iterations of edge sampling loops that can't see a transition. At IN's opcode
+# fetch the loop is recognised, iterations up to the one that would sample a different
+# level are accounted for arithmetically (including contention of port access) and the
+# IN instruction then continues normally - end result is identical to executing the loop.
+# Delay loops between edges (DEC A / JR NZ and DJNZ $) are collapsed the same way.
+class LoaderAccelerator:
+    def __init__(self, z80: Z80CPU, player: TapePlayer, row_table: bytearray) -> None:
+        self.z80 = z80
+        self.player = player
+        self.row_table = row_table
+        self.loops: dict[int, Optional[EdgeLoop]] = {}
+        self.skipped_iterations = 0
+
+    def _loop_at(self, mem: memoryview, in_address: int) -> Optional[EdgeLoop]:
+        if in_address in self.loops:
+            loop = self.loops[in_address]
+            if loop is None or mem[loop.start:loop.end] == loop.code:
+                return loop
+        loop = find_edge_loop(mem, in_address)
+        self.loops[in_address] = loop
+        return loop
+
+    # To be called after the opcode of IN A,(n) is fetched
+    def accelerate(self, clock: ZXSpectrum48ClockAndBusAccess) -> None:
+        z80 = self.z80
+        if z80.ffIFF1 or 0x40 <= z80.regI < 0x80 or not self.player.playing:
+            return
+        loop = self._loop_at(clock.memory.mem, (z80.regPC - 1) & 0xffff)
+        if loop is None:
+            return
+
+        base = clock.frames * TSTATES_PER_INTERRUPT
+        t = clock.tstates
+        level = self.player.level(base + t)
+        next_edge = self.player.next_edge(base + t)
+        edge = next_edge - base if next_edge is not None else TSTATES_PER_INTERRUPT
+
+        ear = 0xff if level else 0xbf
+        loop_a = loop.load_a if loop.load_a is not None else 0
+        regC = z80.regC
+        if not loop.continues(self.row_table[z80.regA] & ear, regC) or not loop.continues(self.row_table[loop_a] & ear, regC):
+            return
+
+        delay = clock.delay_tstates
+        port_high = z80.regA
+        regB = z80.regB
+        skipped = 0
+        while not (loop.inc_b and regB == 255):
+            sample = t + 3
+            if 0x40 <= port_high < 0x80:
+                sample += delay[sample] + 1
+            else:
+                sample += 1
+            sample += delay[sample] + 3
+            following = sample + loop.tstates_after_in + loop.tstates_before_in
+            if sample >= edge or following >= TSTATES_PER_INTERRUPT:
+                break
+            t = following
+            port_high = loop_a
+            regB += 1
+            skipped += 1
+
+        if skipped == 0:
+            return
+
+        self.skipped_iterations += skipped
+        clock.tstates = t
+        _catch_up_screen(clock)
+
+        z80.regR += skipped * loop.instructions
+        # Flags are left by last INC B, or by AND which let loop continue
+        if loop.inc_b:
+            z80.carryFlag = False
+            z80.regB = z80._inc8(regB - 1)
+        else:
+            z80.regA = 0
+            z80._and(0)
+        z80._flagQ = False
+        z80.regA = loop_a
+
+    # To be called after the opcode of DEC A is fetched; skips to the last iteration of DEC A / JR NZ,$-1
+    def accelerate_dec_a(self, clock: ZXSpectrum48ClockAndBusAccess) -> None:
+        z80 = self.z80
+        address = (z80.regPC - 1) & 0xffff
+        mem = clock.memory.mem
+        if address > 0xfffc or mem[address + 1] != 0x20 or mem[address + 2] != 0xfd or not _uncontended_loop(z80, address, 3):
+            return
+        skipped = min((z80.regA - 1) & 0xff, (TSTATES_PER_INTERRUPT - 1 - clock.tstates) // DEC_A_JR_NZ_ITERATION)
+        if skipped <= 0:
+            return
+
+        self.skipped_iterations += skipped
+        clock.tstates += skipped * DEC_A_JR_NZ_ITERATION
+        _catch_up_screen(clock)
+        z80.regR += skipped * 2
+        z80.regA = z80._dec8(z80.regA - skipped + 1)
+        z80._flagQ = False
+        z80.memptr = address
+
+    # To be called after the opcode of DJNZ is fetched; skips to the last iteration of DJNZ $
+    def accelerate_djnz(self, clock: ZXSpectrum48ClockAndBusAccess) -> None:
+        z80 = self.z80
+        address = (z80.regPC - 1) & 0xffff
+        if address > 0xfffd or clock.memory.mem[address + 1] != 0xfe or not _uncontended_loop(z80, address, 2):
+            return
+        skipped = min((z80.regB - 1) & 0xff, (TSTATES_PER_INTERRUPT - 1 - clock.tstates) // DJNZ_ITERATION)
+        if skipped <= 0:
+            return
+
+        self.skipped_iterations += skipped
+        clock.tstates += skipped * DJNZ_ITERATION
+        _catch_up_screen(clock)
+        z80.regR += skipped
+        z80.regB = (z80.regB - skipped) & 0xff
+        z80.memptr = address
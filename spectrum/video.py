@@ -54,6 +54,14 @@ SPECTRUM_SCREEN_SIZE = (SCREEN_WIDTH, SCREEN_HEIGHT)
 SPECTRUM_FULL_SCREEN_SIZE = (FULL_SCREEN_WIDTH, FULL_SCREEN_HEIGHT)
 
 
+# Line of full screen (0 is the top border line, negative in vertical retrace) and T-state in
+# the line (0 is start of left border) beam is at in given T-state of frame. Works on NumPy arrays too.
+def raster_position(tstates):
+    local_ts = tstates - TSTATES_VERTICAL_RETRACE + TSTATES_LEFT_BORDER  # to correct for where the border happens
+    line = local_ts // TSTATES_PER_LINE
+    return line, local_ts - line * TSTATES_PER_LINE
+
+
 # This implementation is originally from PyZX
 # https://github.com/Q-Master/PyZX/blob/master/video.py
 # It is fixed for problems with transformation of 8bit surfaces.
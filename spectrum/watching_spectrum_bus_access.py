@@ -0,0 +1,127 @@
+from typing import Callable, Optional
+
+from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
+from z80.memory import Memory
+from z80.ports import Ports
+
+
+def _no_watch(_address: int, _value: int) -> None:
+    pass
+
+
+# What is watched: 256 byte pages flagged in read_pages/write_pages and callbacks
+# for accesses of them. Port callbacks are called for all port accesses.
+class Watches:
+    def __init__(self) -> None:
+        self.read_pages = bytearray(256)
+        self.write_pages = bytearray(256)
+        self.on_read: Callable[[int, int], None] = _no_watch
+        self.on_write: Callable[[int, int], None] = _no_watch
+        self.on_in: Callable[[int, int], None] = _no_watch
+        self.on_out: Callable[[int, int], None] = _no_watch
+
+
+# Bus access for watchpoints. This class checks nothing; watching_bus_access_class() adds
+# methods checking one kind of access each, so only kinds of access actually watched go
+# through checking methods (opcode fetches are never checked). Checks can be put over any
+# bus class (accounting or heatmap one too) whose methods they call directly.
+# Methods are not replaced on instances as that slows down all attribute access of the bus.
+class WatchingZXSpectrum48ClockAndBusAccess(ZXSpectrum48ClockAndBusAccess):
+    def __init__(self,
+                 memory: Memory,
+                 ports: Ports,
+                 update_next_screen_byte: Callable,
+                 watches: Optional[Watches] = None) -> None:
+        super().__init__(memory, ports, update_next_screen_byte)
+        self.watches = watches if watches is not None else Watches()
+
+
+def _read_watching(bus_class: type) -> dict[str, Callable]:
+    bus_peekb = bus_class.peekb
+    bus_peeksb = bus_class.peeksb
+    bus_peekw = bus_class.peekw
+
+    def peekb(self, address: int) -> int:
+        value = bus_peekb(self, address)
+        watches = self.watches
+        if watches.read_pages[address >> 8]:
+            watches.on_read(address, value)
+        return value
+
+    def peeksb(self, address: int) -> int:
+        value = bus_peeksb(self, address)
+        watches = self.watches
+        if watches.read_pages[address >> 8]:
+            watches.on_read(address, value & 0xff)
+        return value
+
+    def peekw(self, address: int) -> int:
+        value = bus_peekw(self, address)
+        watches = self.watches
+        if watches.read_pages[address >> 8]:
+            watches.on_read(address, value & 0xff)
+        next_address = (address + 1) & 0xffff
+        if watches.read_pages[next_address >> 8]:
+            watches.on_read(next_address, value >> 8)
+        return value
+
+    return {"peekb": peekb, "peeksb": peeksb, "peekw": peekw}
+
+
+def _write_watching(bus_class: type) -> dict[str, Callable]:
+    bus_pokeb = bus_class.pokeb
+    bus_pokew = bus_class.pokew
+
+    def pokeb(self, address: int, value: int) -> None:
+        bus_pokeb(self, address, value)
+        watches = self.watches
+        if watches.write_pages[address >> 8]:
+            watches.on_write(address, value & 0xff)
+
+    def pokew(self, address: int, value: int) -> None:
+        bus_pokew(self, address, value)
+        watches = self.watches
+        if watches.write_pages[address >> 8]:
+            watches.on_write(address, value & 0xff)
+        next_address = (address + 1) & 0xffff
+        if watches.write_pages[next_address >> 8]:
+            watches.on_write(next_address, value >> 8)
+
+    return {"pokeb": pokeb, "pokew": pokew}
+
+
+def _port_watching(bus_class: type) -> dict[str, Callable]:
+    bus_in_port = bus_class.in_port
+    bus_out_port = bus_class.out_port
+
+    def in_port(self, port: int) -> int:
+        value = bus_in_port(self, port)
+        self.watches.on_in(port, value)
+        return value
+
+    def out_port(self, port: int, value: int):
+        bus_out_port(self, port, value)
+        self.watches.on_out(port, value)
+
+    return {"in_port": in_port, "out_port": out_port}
+
+
+_classes: dict[tuple[type, bool, bool, bool], type] = {}
+
+
+def watching_bus_access_class(reads: bool, writes: bool, ports: bool,
+                              bus_class: type = ZXSpectrum48ClockAndBusAccess) -> type:
+    key = (bus_class, reads, writes, ports)
+    cls = _classes.get(key)
+    if cls is None:
+        methods: dict[str, Callable] = {}
+        for watched, watching in zip(key[1:], (_read_watching, _write_watching, _port_watching)):
+            if watched:
+                methods.update(watching(bus_class))
+        if bus_class is ZXSpectrum48ClockAndBusAccess:
+            bases: tuple[type, ...] = (WatchingZXSpectrum48ClockAndBusAccess,)
+        else:
+            bases = (WatchingZXSpectrum48ClockAndBusAccess, bus_class)
+        cls = type(f"Watching{bus_class.__name__}", bases, methods) if methods or len(bases) > 1 else bases[0]
+        _classes[key] = cls
+    return cls
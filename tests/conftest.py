@@ -0,0 +1,41 @@
+import os
+from typing import Callable
+
+import pytest
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+
+
+SNAPSHOT = os.path.join(os.path.dirname(__file__), "..", "snapshots", "nirvana-demo.sna")
+
+
+@pytest.fixture
+def snapshot_file() -> str:
+    return SNAPSHOT
+
+
+# Returns function creating initialised Spectrum, by default with the demo snapshot loaded
+# and run for given number of frames
+@pytest.fixture
+def create_spectrum() -> Callable[..., Spectrum]:
+    def create(load_snapshot: bool = True, frames: int = 0, rendering: bool = True) -> Spectrum:
+        spectrum = Spectrum()
+        spectrum.init()
+        spectrum.rendering = rendering
+        if load_snapshot:
+            spectrum.load_sna(SNAPSHOT)
+        for _ in range(frames):
+            spectrum.execute(TSTATES_PER_INTERRUPT)
+            spectrum.end_frame()
+        return spectrum
+    return create
+
+
+# Returns function taking memory, CPU state, T-states and frames of Spectrum, for comparing machine states
+@pytest.fixture
+def snapshot() -> Callable[[Spectrum], tuple]:
+    def take(spectrum: Spectrum) -> tuple:
+        bus_access = spectrum.bus_access
+        return bytes(spectrum.memory.mem), spectrum.z80.get_state(), bus_access.tstates, bus_access.frames
+    return take
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import wave
+
+import numpy as np
+from hamcrest import assert_that, is_, close_to, greater_than
+
+from spectrum.ay import AY, TSTATES_PER_TICK, envelope_levels, noise_sequence
+from spectrum.keyboard import Keyboard
+from spectrum.spectrum import Spectrum
+from spectrum.spectrum_ports import SpectrumPorts
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.wav_render import render_to_wav
+
+
+def write_registers(ay: AY, tstates: int, registers: dict[int, int]) -> None:
+    for reg, value in registers.items():
+        ay.select(reg)
+        ay.write(tstates, value)
+
+
+class TestAY:
+    def test_silence(self) -> None:
+        ay = AY(44100, volume=1.0)
+        block = ay.end_frame()
+        assert_that(float(np.abs(block).max()), is_(0.0))
+        assert_that(len(block), close_to(44100 * TSTATES_PER_INTERRUPT / 3_500_000, 1))
+
+    def test_registers_are_masked_and_read_back(self) -> None:
+        ay = AY()
+        write_registers(ay, 0, {1: 0xff, 8: 0xff, 13: 0xff})
+        ay.select(1)
+        assert_that(ay.read(), is_(0x0f))
+        ay.select(8)
+        assert_that(ay.read(), is_(0x1f))
+        ay.select(13)
+        assert_that(ay.read(), is_(0x0f))
+        ay.select(0x20)
+        assert_that(ay.read(), is_(0xff))
+
+    def test_tone_frequency(self) -> None:
+        ay = AY(44100, volume=1.0)
+        # Tone is AY clock / (16 * period): 1.75MHz / (16 * 252) = 434Hz
+        write_registers(ay, 0, {0: 252, 1: 0, 7: 0x3e, 8: 15})
+        block = np.concatenate([ay.end_frame() for _ in range(50)])
+        spectrum = np.abs(np.fft.rfft(block - block.mean()))
+        peak = float(np.fft.rfftfreq(len(block), 1 / 44100)[int(np.argmax(spectrum))])
+        assert_that(peak, close_to(1_750_000 / (16 * 252), 2))
+        assert_that(float(block.max()), close_to(1.0 / 3, 0.0001))
+
+    def test_mixer_disabled_channel_outputs_volume(self) -> None:
+        ay = AY(44100, volume=1.0)
+        # Tone and noise disabled - channel output is constant volume level (used for samples)
+        write_registers(ay, 0, {7: 0x3f, 8: 15})
+        block = ay.end_frame()
+        assert_that(float(block[1:].min()), close_to(1.0 / 3, 0.0001))
+
+    def test_writes_are_applied_at_their_tstate(self) -> None:
+        ay = AY(44100, volume=1.0)
+        write_registers(ay, TSTATES_PER_INTERRUPT // 2, {7: 0x3f, 8: 15})
+        ticks = ay.render_ticks()
+        half = len(ticks) // 2
+        assert_that(float(ticks[:half].max()), is_(0.0))
+        assert_that(float(ticks[half:].min()), is_(1.0))
+
+    def test_writes_after_end_of_frame_are_carried_over(self) -> None:
+        ay = AY()
+        write_registers(ay, TSTATES_PER_INTERRUPT + 10, {8: 15})
+        ay.end_frame()
+        assert_that(ay.count, is_(1))
+        assert_that(ay.write_tstates[0], is_(10))
+
+    def test_envelope_shapes(self) -> None:
+        steps = np.arange(48)
+        # \___
+        assert_that(envelope_levels(0x00, steps)[:17].tolist(), is_(list(range(15, -1, -1)) + [0]))
+        # /___
+        assert_that(envelope_levels(0x04, steps)[15:18].tolist(), is_([15, 0, 0]))
+        # \\\\
+        assert_that(envelope_levels(0x08, steps)[14:18].tolist(), is_([1, 0, 15, 14]))
+        # \/\/
+        assert_that(envelope_levels(0x0a, steps)[14:18].tolist(), is_([1, 0, 0, 1]))
+        # /~~~
+        assert_that(envelope_levels(0x0d, steps)[14:40].tolist(), is_([14] + [15] * 25))
+        # /\/\
+        assert_that(envelope_levels(0x0e, steps)[30:34].tolist(), is_([1, 0, 0, 1]))
+
+    def test_envelope_state_is_kept_across_frames(self) -> None:
+        ay = AY()
+        write_registers(ay, 0, {11: 0x00, 12: 0x10, 13: 0x0e})
+        ay.end_frame()
+        # 2184 ticks / 4096 ticks per step
+        assert_that(ay.envelope_step, is_(0))
+        assert_that(ay.envelope_phase, is_(TSTATES_PER_INTERRUPT // TSTATES_PER_TICK))
+
+    def test_noise_sequence_is_balanced(self) -> None:
+        sequence = noise_sequence()
+        assert_that(len(sequence), is_((1 << 17) - 1))
+        assert_that(int(sequence.sum()), is_(1 << 16))
+
+    def test_skip_frame_matches_end_frame_state(self) -> None:
+        first = AY()
+        second = AY()
+        for ay in (first, second):
+            write_registers(ay, 100, {0: 123, 6: 7, 7: 0x30, 8: 0x10, 11: 50, 13: 0x0a})
+        first.end_frame()
+        second.skip_frame()
+        assert_that(second.get_state(), is_(first.get_state()))
+
+    def test_ports(self) -> None:
+        ay = AY()
+        ports = SpectrumPorts(Keyboard(), None, ay)
+        ports.out_port(0xfffd, 7)
+        ports.out_port(0xbffd, 0x38)
+        assert_that(ports.in_port(0xfffd), is_(0x38))
+
+
+class TestWavRender:
+    def test_render_program_to_wav(self) -> None:
+        spectrum = Spectrum(ay=True)
+        spectrum.init()
+
+        # ld bc,0xfffd; ld a,7; out (c),a; ld b,0xbf; ld a,0x3e; out (c),a
+        # ld b,0xff; ld a,8; out (c),a; ld b,0xbf; ld a,15; out (c),a; jr $
+        code = [
+            0x01, 0xfd, 0xff, 0x3e, 0x07, 0xed, 0x79, 0x06, 0xbf, 0x3e, 0x3e, 0xed, 0x79,
+            0x06, 0xff, 0x3e, 0x08, 0xed, 0x79, 0x06, 0xbf, 0x3e, 0x0f, 0xed, 0x79, 0x18, 0xfe
+        ]
+        for i, b in enumerate(code):
+            spectrum.memory.mem[0x8000 + i] = b
+        spectrum.z80.regPC = 0x8000
+        spectrum.z80.ffIFF1 = False
+        spectrum.z80.ffIFF2 = False
+        write_registers(spectrum.ay, 0, {0: 100, 1: 0})
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "out.wav")
+            render_to_wav(spectrum, filename, 10)
+
+            with wave.open(filename, "rb") as wav:
+                assert_that(wav.getframerate(), is_(44100))
+                assert_that(wav.getnframes(), close_to(44100 * 10 * TSTATES_PER_INTERRUPT / 3_500_000, 1))
+                samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+
+        assert_that(int(samples.max()), greater_than(1000))
+        assert_that(spectrum.rendering, is_(True))
+        assert_that(spectrum.audio_sink, is_(None))
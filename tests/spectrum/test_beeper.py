@@ -0,0 +1,73 @@
+import numpy as np
+from hamcrest import assert_that, is_, close_to
+
+from spectrum.beeper import Beeper
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.audio_output import AudioRingBuffer
+
+
+SPEAKER_ON = 0x10
+SPEAKER_OFF = 0x00
+
+
+class TestBeeper:
+    def test_silence_produces_frame_of_samples(self) -> None:
+        beeper = Beeper(44100, volume=1.0)
+        total = 0
+        for _ in range(50):
+            block = beeper.end_frame(TSTATES_PER_INTERRUPT)
+            assert_that(float(np.abs(block).max()), is_(0.0))
+            total += len(block)
+
+        # 50 frames are 998.4ms at 3.5MHz
+        assert_that(total, close_to(44100 * 50 * TSTATES_PER_INTERRUPT / 3_500_000, 1))
+
+    def test_only_level_changes_are_recorded(self) -> None:
+        beeper = Beeper()
+        beeper.out(100, SPEAKER_ON | 0x07)
+        beeper.out(200, SPEAKER_ON | 0x02)
+        beeper.out(300, SPEAKER_OFF)
+        assert_that(beeper.count, is_(2))
+
+    def test_square_wave_box_filter(self) -> None:
+        beeper = Beeper(44100, volume=1.0)
+        # Speaker is on for the second half of the frame
+        beeper.out(TSTATES_PER_INTERRUPT // 2, SPEAKER_ON)
+        block = beeper.end_frame(TSTATES_PER_INTERRUPT)
+
+        assert_that(float(block[:len(block) // 2 - 1].max()), is_(0.0))
+        assert_that(float(block[len(block) // 2 + 1:].min()), close_to(0.92, 0.0001))
+        assert_that(float(block.sum() / len(block)), close_to(0.46, 0.01))
+
+    def test_events_after_end_of_frame_are_carried_over(self) -> None:
+        beeper = Beeper(44100, volume=1.0)
+        beeper.out(TSTATES_PER_INTERRUPT + 10, SPEAKER_ON)
+        block = beeper.end_frame(TSTATES_PER_INTERRUPT)
+        assert_that(float(block.max()), is_(0.0))
+        assert_that(beeper.count, is_(1))
+        assert_that(beeper.events[0] >> 2, is_(10))
+
+        block = beeper.end_frame(TSTATES_PER_INTERRUPT)
+        assert_that(float(block[1:].min()), close_to(0.92, 0.0001))
+
+    def test_skipped_frame_keeps_level_of_its_last_event(self) -> None:
+        beeper = Beeper(44100, volume=1.0)
+        beeper.out(100, SPEAKER_ON)
+        beeper.out(TSTATES_PER_INTERRUPT + 12, SPEAKER_OFF)
+        beeper.skip_frame(TSTATES_PER_INTERRUPT)
+        assert_that(beeper.start_level, is_(2))
+        assert_that((beeper.count, beeper.events[0] >> 2), is_((1, 12)))
+
+
+class TestAudioRingBuffer:
+    def test_overrun_and_underrun(self) -> None:
+        ring = AudioRingBuffer(8)
+        ring.write(np.arange(6, dtype=np.int16))
+        ring.write(np.arange(6, dtype=np.int16))
+        assert_that(ring.overruns, is_(1))
+        assert_that(ring.overrun_samples, is_(4))
+
+        assert_that(ring.read(4).tolist(), is_([0, 1, 2, 3]))
+        assert_that(ring.read(6).tolist(), is_([4, 5, 0, 1, 1, 1]))
+        assert_that(ring.underruns, is_(1))
+        assert_that(ring.underrun_samples, is_(2))
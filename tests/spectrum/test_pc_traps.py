@@ -0,0 +1,124 @@
+from typing import Callable
+
+import pytest
+from hamcrest import assert_that, is_, is_not
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.rom_traps import PrintCapture
+from z80.pc_traps import ExecutionBreak
+
+
+@pytest.fixture
+def spectrum(create_spectrum: Callable[..., Spectrum]) -> Spectrum:
+    return create_spectrum(load_snapshot=False, rendering=False)
+
+
+def run_code(spectrum: Spectrum, code: bytes, address: int = 0x8000, steps: int = 10) -> None:
+    spectrum.memory.mem[address:address + len(code)] = code
+    spectrum.z80.regPC = address
+    for _ in range(steps):
+        spectrum.z80.execute_one_cycle()
+
+
+class TestPCTraps:
+    def test_only_trapped_opcodes_are_patched(self, spectrum: Spectrum) -> None:
+        traps = spectrum.traps
+        main_cmds = spectrum.z80._main_cmds
+        patched = [opcode for opcode in range(256) if main_cmds[opcode] is not traps.original_cmds[opcode]]
+        # Only INC D - first instruction of LD-BYTES
+        assert_that(patched, is_([0x14]))
+
+        traps.add(0x8000, lambda z80: None)
+        spectrum.memory.mem[0x8000] = 0x00
+        traps.refresh()
+        assert_that(main_cmds[0x00], is_not(traps.original_cmds[0x00]))
+        traps.remove(0x8000)
+        assert_that(main_cmds[0x00], is_(traps.original_cmds[0x00]))
+
+    def test_handler_can_skip_or_let_instruction_run(self, spectrum: Spectrum) -> None:
+        z80 = spectrum.z80
+        seen = []
+
+        def skip(cpu) -> int:
+            seen.append(cpu.regPC)
+            cpu.regB = 0x42
+            return 0x8010
+
+        # LD B,1 / JR $ ... at 0x8010: LD C,B / JR $
+        spectrum.memory.mem[0x8010:0x8013] = b"\x48\x18\xfe"
+        spectrum.memory.mem[0x8000:0x8004] = b"\x06\x01\x18\xfe"
+        spectrum.traps.add(0x8000, skip)
+        run_code(spectrum, b"\x06\x01\x18\xfe", steps=3)
+        assert_that(seen, is_([0x8000]))
+        assert_that((z80.regB, z80.regC, z80.regPC), is_((0x42, 0x42, 0x8011)))
+
+        spectrum.traps.add(0x8000, lambda cpu: seen.append(-1))
+        run_code(spectrum, b"\x06\x01\x18\xfe", steps=2)
+        assert_that(seen[-1], is_(-1))
+        assert_that((z80.regB, z80.regPC), is_((0x01, 0x8002)))
+
+    def test_same_opcode_elsewhere_is_not_trapped(self, spectrum: Spectrum) -> None:
+        calls = []
+        spectrum.memory.mem[0x8000:0x8002] = b"\x04\x04"  # INC B / INC B
+        spectrum.traps.add(0x8001, lambda cpu: calls.append(cpu.regB))
+        spectrum.z80.regB = 0
+        run_code(spectrum, b"\x04\x04", steps=2)
+        assert_that(calls, is_([1]))
+        assert_that(spectrum.z80.regB, is_(2))
+
+    def test_trap_follows_code_written_to_its_address(self, spectrum: Spectrum) -> None:
+        calls = []
+        spectrum.traps.add(0x8005, lambda cpu: calls.append(cpu.regA))
+        # LD A,0x3C / LD (0x8005),A / (0x8005:) INC A ... written by the program itself
+        code = b"\x3e\x3c\x32\x05\x80\x00\x18\xfe"
+        run_code(spectrum, code, steps=3)
+        assert_that(calls, is_([0x3c]))
+        assert_that((spectrum.z80.regA, spectrum.z80.regPC), is_((0x3d, 0x8006)))
+
+    def test_trap_is_rearmed_when_state_is_restored(self, spectrum: Spectrum) -> None:
+        calls = []
+        state = spectrum.save_state()
+        spectrum.traps.add(0x8000, lambda cpu: calls.append(cpu.regPC))
+        state.memory[0x8000] = 0x3c  # INC A
+        spectrum.z80.regPC = 0x8000
+        state.core_state = spectrum.core_state()
+        spectrum.restore_state(state)
+        spectrum.z80.execute_one_cycle()
+        assert_that(calls, is_([0x8000]))
+
+    def test_opcode_after_prefix_is_not_trapped_or_hooked(self, spectrum: Spectrum) -> None:
+        calls = []
+        hooked = []
+        # INC B / DD INC B (no IX instruction, runs as INC B) / NOP
+        spectrum.memory.mem[0x8000:0x8004] = b"\x04\xdd\x04\x00"
+        spectrum.traps.add(0x8000, lambda cpu: calls.append(cpu.regPC))
+        spectrum.traps.add(0x8002, lambda cpu: calls.append(cpu.regPC))
+        spectrum.traps.hook_opcode(0x04, lambda: hooked.append(spectrum.z80.regPC))
+        spectrum.z80.regB = 0
+        run_code(spectrum, b"\x04\xdd\x04\x00", steps=3)
+        assert_that(calls, is_([0x8000]))
+        assert_that(hooked, is_([0x8001]))
+        assert_that((spectrum.z80.regB, spectrum.z80.regPC), is_((2, 0x8004)))
+
+    def test_break_next_stops_halted_cpu(self, spectrum: Spectrum) -> None:
+        z80 = spectrum.z80
+        run_code(spectrum, b"\x76", steps=3)
+        assert_that((z80.halted, z80.regPC), is_((True, 0x8001)))
+        r = z80.regR
+        tstates = spectrum.bus_access.tstates
+        spectrum.traps.break_next()
+        with pytest.raises(ExecutionBreak):
+            z80.execute_one_cycle()
+        assert_that((z80.halted, z80.regPC, z80.regR, spectrum.bus_access.tstates), is_((True, 0x8001, r, tstates)))
+        z80.execute_one_cycle()
+        assert_that(z80.regR, is_(r + 1))
+
+    def test_print_capture_collects_rom_output(self, spectrum: Spectrum) -> None:
+        capture = PrintCapture(spectrum)
+        for _ in range(100):
+            spectrum.execute(TSTATES_PER_INTERRUPT)
+            spectrum.end_frame()
+        assert_that(capture.text(), is_("\u00a9 1982 Sinclair Research Ltd"))
+        capture.close()
+        assert_that(0x09f4 in spectrum.traps.traps, is_(False))
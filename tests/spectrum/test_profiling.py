@@ -0,0 +1,89 @@
+from typing import Callable
+
+import pytest
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from z80.instructions.profile import AccessRecords, FetchOpcode, PeekB, PeekW, FETCH_OPCODE, PEEK_W
+
+
+@pytest.fixture
+def spectrum(create_spectrum: Callable[..., Spectrum]) -> Spectrum:
+    return create_spectrum(load_snapshot=False, rendering=False)
+
+
+def boot(spectrum: Spectrum, frames: int) -> None:
+    for _ in range(frames):
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        spectrum.end_frame()
+
+
+class TestProfiling:
+    def test_profile_runs_like_normal_execution(self, spectrum: Spectrum, create_spectrum: Callable[..., Spectrum]) -> None:
+        other = create_spectrum(load_snapshot=False, rendering=False)
+        boot(spectrum, 5)
+        boot(other, 5)
+
+        spectrum.profile(TSTATES_PER_INTERRUPT)
+        other.execute(TSTATES_PER_INTERRUPT)
+
+        assert_that(spectrum.z80.get_state(), is_(other.z80.get_state()))
+        assert_that(spectrum.bus_access.tstates, is_(other.bus_access.tstates))
+        assert_that(bytes(spectrum.memory.mem) == bytes(other.memory.mem), is_(True))
+
+    def test_records_cover_all_tstates_of_instructions(self, spectrum: Spectrum) -> None:
+        boot(spectrum, 5)
+        spectrum.profile(TSTATES_PER_INTERRUPT)
+
+        instructions = spectrum.instructions
+        records = spectrum._profiling_bus_access.records
+        assert_that(len(instructions) > 1000, is_(True))
+        for i in range(len(instructions) - 1):
+            start, end = instructions.record_range(i)
+            assert_that(records.kinds[start], is_(FETCH_OPCODE))
+            assert_that(records.at_tstates[start], is_(instructions.tstates[i]))
+            assert_that(records.total_tstates(start, end), is_(instructions.tstates[i + 1] - instructions.tstates[i]))
+
+    def test_instructions_and_accesses_are_created_on_lookup(self, spectrum: Spectrum) -> None:
+        boot(spectrum, 5)
+        code = bytes([
+            0x3a, 0x00, 0x40,  # LD A,(0x4000)
+            0x2a, 0x00, 0x40,  # LD HL,(0x4000)
+            0xdb, 0xfe,        # IN A,(0xfe)
+            0x18, 0xfe         # JR $
+        ])
+        spectrum.memory.mem[0x8000:0x8000 + len(code)] = code
+        spectrum.z80.regPC = 0x8000
+        spectrum.z80.ffIFF1 = False
+        spectrum.bus_access.tstates = 14335
+        spectrum.profile(14400)
+
+        instructions = spectrum.instructions
+        assert_that(instructions.index_of(14335), is_(0))
+        assert_that(instructions.index_of(14336), is_(-1))
+        load_a = instructions[0]
+        assert_that(load_a.address, is_(0x8000))
+        assert_that([type(access) for access in load_a.profile], is_([FetchOpcode, PeekW, PeekB]))
+        # Read of contended 0x4000 while screen is fetched
+        assert_that(load_a.profile[2].delay > 0, is_(True))
+        assert_that(load_a.profile[2].at_tstates, is_(14335 + 10))
+        # Word accesses keep T-state after their last cycle
+        assert_that(load_a.profile[1].at_tstates, is_(14335 + 10))
+        assert_that(instructions[2].profile[2].at_tstates, is_(instructions[3].tstates))
+        # Records keep accessed address (of first byte of a word) and port
+        records = spectrum._profiling_bus_access.records
+        start, end = instructions.record_range(1)
+        assert_that(list(records.addresses[start:end]), is_([0x8003, 0x8004, 0x4000]))
+        start, end = instructions.record_range(2)
+        assert_that(records.addresses[end - 1] & 0xff, is_(0xfe))
+
+    def test_records_grow_and_pack_delays(self) -> None:
+        records = AccessRecords(capacity=2)
+        for i in range(5):
+            records.add(PEEK_W, 0x4000 + i, i * 6, 3, 2, 6 | (5 << 4))
+        assert_that(records.count, is_(5))
+        assert_that(records.delays_of(4), is_([6, 5]))
+        assert_that(records.addresses[4], is_(0x4004))
+        assert_that(records.total_tstates(0, 1), is_(17))
+        assert_that(str(records.access(4)), is_("rw3+6,3+5"))
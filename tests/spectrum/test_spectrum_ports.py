@@ -0,0 +1,77 @@
+import random
+
+from hamcrest import assert_that, is_, calling, raises
+from pygame.locals import K_a, K_p, K_SPACE, K_KP0, KMOD_NONE, KMOD_CTRL
+
+from spectrum.ay import AY
+from spectrum.keyboard import Keyboard
+from spectrum.spectrum_ports import SpectrumPorts
+
+
+def scan_portmap(ports: SpectrumPorts, port: int):
+    for mask, value, _, _, _, fin, fout in ports.PORTMAP:
+        if port & mask == value & mask:
+            return fin, fout
+    return None, None
+
+
+def read_rows(rows: list[int], port: int) -> int:
+    result = 0xff
+    for row in range(8):
+        if (port & (0x8000 >> row)) == 0:
+            result &= rows[row]
+    return result
+
+
+class TestSpectrumPorts:
+    def test_decode_tables_match_portmap(self) -> None:
+        ports = SpectrumPorts(Keyboard(), None, AY())
+        for port in range(65536):
+            fin, fout = scan_portmap(ports, port)
+            index = (port & 0xff) | ((port & 0xc000) >> 6)
+            assert_that(ports.in_table[index], is_(fin if fin else ports.spInFF))
+            if fout is not None:
+                assert_that(ports.out_table[index], is_(fout))
+
+    def test_unsupported_mask_is_rejected(self) -> None:
+        ports = SpectrumPorts(Keyboard())
+        ports.PORTMAP.insert(0, (0x0100, 0x0000, 2, 2, 2, ports.spInFF, None))
+        assert_that(calling(ports.update_decode_tables), raises(ValueError))
+
+    def test_keyboard_rows(self) -> None:
+        keyboard = Keyboard()
+        ports = SpectrumPorts(keyboard)
+        keyboard.do_key(True, K_a, KMOD_NONE)
+        keyboard.do_key(True, K_p, KMOD_CTRL)
+
+        assert_that(ports.in_port(0xfdfe), is_(0xfe))
+        assert_that(ports.in_port(0xdffe), is_(0xfe))
+        assert_that(ports.in_port(0xfefe), is_(0xfe))
+        assert_that(ports.in_port(0xfbfe), is_(0xff))
+        assert_that(ports.in_port(0x00fe), is_(0xfe))
+
+        keyboard.do_key(False, K_a, KMOD_NONE)
+        assert_that(ports.in_port(0xfdfe), is_(0xff))
+
+        keyboard.do_key(True, K_SPACE, KMOD_NONE)
+        keyboard.reset_keyboard()
+        assert_that(ports.in_port(0x7ffe), is_(0xff))
+
+    def test_row_table_matches_matrix(self) -> None:
+        keyboard = Keyboard()
+        ports = SpectrumPorts(keyboard)
+        random.seed(1)
+        for _ in range(10):
+            keyboard.keyboard[:] = [random.randrange(256) | 0xe0 for _ in range(8)]
+            keyboard.update_row_table()
+            for high in range(256):
+                port = (high << 8) | 0xfe
+                assert_that(ports.in_port(port), is_(read_rows(keyboard.keyboard, port)))
+
+    def test_kempston(self) -> None:
+        keyboard = Keyboard()
+        ports = SpectrumPorts(keyboard)
+        keyboard.do_key(True, K_KP0, KMOD_NONE)
+        assert_that(ports.in_port(0x001f), is_(0x10))
+        keyboard.reset_keyboard()
+        assert_that(ports.in_port(0x001f), is_(0))
@@ -0,0 +1,150 @@
+import os
+import struct
+import tempfile
+
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from spectrum.tape import LD_BYTES, ID_STANDARD, Tape
+
+
+RETURN_ADDRESS = 0x7000
+
+
+def tap_block(flag: int, data: bytes, checksum_fix: int = 0) -> bytes:
+    checksum = flag
+    for b in data:
+        checksum ^= b
+    return struct.pack("<H", len(data) + 2) + bytes([flag]) + data + bytes([checksum ^ checksum_fix])
+
+
+def header(name: str, length: int, start: int) -> bytes:
+    return bytes([3]) + name.ljust(10).encode("ascii") + struct.pack("<HHH", length, start, 0x8000)
+
+
+def write_file(content: bytes, suffix: str) -> str:
+    fd, filename = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return filename
+
+
+def create_spectrum(filename: str) -> Spectrum:
+    spectrum = Spectrum()
+    spectrum.init()
+    spectrum.memory.mem[RETURN_ADDRESS:RETURN_ADDRESS + 2] = b"\x18\xfe"  # JR $
+    spectrum.insert_tape(filename)
+    return spectrum
+
+
+# Calls LD-BYTES as LD "" would and runs until ROM returns
+def ld_bytes(spectrum: Spectrum, flag: int, address: int, length: int, load: bool = True) -> bool:
+    z80 = spectrum.z80
+    z80.regA = flag
+    z80.set_flags(1 if load else 0)
+    z80.regIX = address
+    z80.set_reg_DE(length)
+    z80.regSP = 0xff00
+    spectrum.memory.pokew(z80.regSP, RETURN_ADDRESS)
+    z80.regPC = LD_BYTES
+    z80.ffIFF1 = z80.ffIFF2 = False
+    for _ in range(100):
+        spectrum.z80.execute_one_cycle()
+        if z80.regPC == RETURN_ADDRESS:
+            return z80.carryFlag
+    raise AssertionError("LD-BYTES did not return")
+
+
+class TestTape:
+    def test_loads_header_and_data_blocks(self) -> None:
+        data = bytes(range(256)) * 4
+        filename = write_file(tap_block(0x00, header("test", len(data), 0x8000)) + tap_block(0xff, data), ".tap")
+        try:
+            spectrum = create_spectrum(filename)
+            z80 = spectrum.z80
+
+            assert_that(ld_bytes(spectrum, 0x00, 0x6000, 17), is_(True))
+            assert_that(bytes(spectrum.memory.mem[0x6000:0x6011]), is_(header("test", len(data), 0x8000)))
+
+            assert_that(ld_bytes(spectrum, 0xff, 0x8000, len(data)), is_(True))
+            assert_that(bytes(spectrum.memory.mem[0x8000:0x8000 + len(data)]), is_(data))
+            assert_that(z80.regIX, is_(0x8000 + len(data)))
+            assert_that(z80.get_reg_DE(), is_(0))
+            assert_that(z80.ffIFF1, is_(True))
+            spectrum.eject_tape()
+        finally:
+            os.remove(filename)
+
+    def test_flag_mismatch_skips_block(self) -> None:
+        filename = write_file(tap_block(0x00, header("a", 3, 0x8000)) + tap_block(0xff, b"abc"), ".tap")
+        try:
+            spectrum = create_spectrum(filename)
+
+            assert_that(ld_bytes(spectrum, 0xff, 0x8000, 3), is_(False))
+            assert_that(bytes(spectrum.memory.mem[0x8000:0x8003]), is_(b"\x00\x00\x00"))
+
+            assert_that(ld_bytes(spectrum, 0xff, 0x8000, 3), is_(True))
+            assert_that(bytes(spectrum.memory.mem[0x8000:0x8003]), is_(b"abc"))
+            spectrum.eject_tape()
+        finally:
+            os.remove(filename)
+
+    def test_bad_checksum_and_short_block_reset_carry(self) -> None:
+        filename = write_file(tap_block(0xff, b"abc", checksum_fix=1) + tap_block(0xff, b"ab"), ".tap")
+        try:
+            spectrum = create_spectrum(filename)
+
+            assert_that(ld_bytes(spectrum, 0xff, 0x8000, 3), is_(False))
+            assert_that(ld_bytes(spectrum, 0xff, 0x9000, 3), is_(False))
+            # Checksum byte is taken as last byte of data and there is nothing left for parity
+            assert_that(spectrum.z80.get_reg_DE(), is_(0))
+            assert_that(bytes(spectrum.memory.mem[0x9000:0x9002]), is_(b"ab"))
+            spectrum.eject_tape()
+        finally:
+            os.remove(filename)
+
+    def test_verify_does_not_write(self) -> None:
+        filename = write_file(tap_block(0xff, b"abc") + tap_block(0xff, b"abc"), ".tap")
+        try:
+            spectrum = create_spectrum(filename)
+            spectrum.memory.mem[0x8000:0x8003] = b"abc"
+            assert_that(ld_bytes(spectrum, 0xff, 0x8000, 3, load=False), is_(True))
+            # Checksum byte is left in L
+            assert_that((spectrum.z80.regL, spectrum.z80.regH, spectrum.z80.regA), is_((0xff ^ 0x61 ^ 0x62 ^ 0x63, 0, 0)))
+            spectrum.memory.mem[0x9000:0x9003] = b"aXc"
+            assert_that(ld_bytes(spectrum, 0xff, 0x9000, 3, load=False), is_(False))
+            z80 = spectrum.z80
+            # Returns at the differing byte with A = memory XOR tape
+            assert_that((z80.regA, z80.regL, z80.regIX, z80.get_reg_DE()), is_((ord("X") ^ ord("b"), ord("b"), 0x9001, 2)))
+            assert_that((z80.regH, z80.is_zero_flag()), is_((0xff ^ ord("a") ^ ord("b"), False)))
+            assert_that(bytes(spectrum.memory.mem[0x9000:0x9003]), is_(b"aXc"))
+            spectrum.eject_tape()
+        finally:
+            os.remove(filename)
+
+    def test_tzx_blocks_are_parsed_lazily(self) -> None:
+        text = b"\x30\x05hello"
+        standard = tap_block(0xff, b"xyz")
+        content = b"ZXTape!\x1a\x01\x14" + text + b"\x10" + struct.pack("<H", 500) + standard + b"\x20\x00\x00"
+        filename = write_file(content, ".tzx")
+        try:
+            tape = Tape(filename)
+            assert_that(tape.tzx, is_(True))
+            assert_that(len(tape._blocks), is_(0))
+
+            block = tape.next_standard_block()
+            assert_that(block.id, is_(ID_STANDARD))
+            assert_that(block.pause, is_(500))
+            assert_that(bytes(block.data[1:4]), is_(b"xyz"))
+            assert_that(len(tape._blocks), is_(2))
+
+            assert_that(tape.next_standard_block(), is_(None))
+            assert_that([b.id for b in tape.blocks()], is_([0x30, 0x10, 0x20]))
+            tape.close()
+
+            spectrum = create_spectrum(filename)
+            assert_that(ld_bytes(spectrum, 0xff, 0x8000, 3), is_(True))
+            assert_that(bytes(spectrum.memory.mem[0x8000:0x8003]), is_(b"xyz"))
+            spectrum.eject_tape()
+        finally:
+            os.remove(filename)
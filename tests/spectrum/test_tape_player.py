@@ -0,0 +1,173 @@
+import os
+import struct
+import tempfile
+
+from hamcrest import assert_that, is_, greater_than
+
+from spectrum.spectrum import Spectrum
+from spectrum.tape import Tape, LD_BYTES
+from spectrum.tape_player import TapePlayer, tape_segments, HEADER_PILOT_PULSES, TSTATES_PER_MS
+from spectrum.video import TSTATES_PER_INTERRUPT
+
+
+RETURN_ADDRESS = 0x7000
+
+
+def write_file(content: bytes, suffix: str) -> str:
+    fd, filename = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return filename
+
+
+def tzx(*blocks: bytes) -> bytes:
+    return b"ZXTape!\x1a\x01\x14" + b"".join(blocks)
+
+
+def turbo_block(flag: int, data: bytes, pilot_pulses: int) -> bytes:
+    payload = bytes([flag]) + data
+    checksum = 0
+    for b in payload:
+        checksum ^= b
+    payload += bytes([checksum])
+    return b"\x11" + struct.pack("<HHHHHHBH", 2168, 667, 735, 855, 1710, pilot_pulses, 8, 1000) + \
+        struct.pack("<I", len(payload))[:3] + payload
+
+
+def run_until(spectrum: Spectrum, address: int, max_frames: int) -> None:
+    z80 = spectrum.z80
+    frames = 0
+    while z80.regPC != address:
+        z80.execute_one_cycle()
+        if spectrum.bus_access.tstates >= TSTATES_PER_INTERRUPT:
+            spectrum.end_frame()
+            frames += 1
+            assert frames < max_frames, f"PC did not reach 0x{address:04x}"
+
+
+def machine_state(spectrum: Spectrum) -> tuple:
+    return spectrum.z80.get_state(), spectrum.bus_access.tstates, spectrum.bus_access.frames, bytes(spectrum.memory.mem)
+
+
+class TestTapeSegments:
+    def test_standard_block_edges(self) -> None:
+        data = bytes([0x00]) + bytes(17) + bytes([0x00])
+        filename = write_file(struct.pack("<H", len(data)) + data, ".tap")
+        try:
+            tape = Tape(filename)
+            segments = tape_segments(tape)
+            assert_that(len(segments), is_(1))
+
+            edges = segments[0].edges
+            # pilot, two sync pulses, two pulses per bit and the edge which ends the last pulse
+            assert_that(len(edges), is_(HEADER_PILOT_PULSES + 2 + len(data) * 16 + 1))
+            assert_that(edges[1] - edges[0], is_(2168))
+            assert_that(edges[HEADER_PILOT_PULSES + 2] - edges[HEADER_PILOT_PULSES + 1], is_(735))
+            assert_that(edges[-1] - edges[-2], is_(855))
+            assert_that(segments[0].end_level, is_(0))
+            assert_that(segments[0].length, is_(edges[-1] + 1000 * TSTATES_PER_MS))
+            tape.close()
+        finally:
+            os.remove(filename)
+
+    def test_stop_the_tape_splits_segments(self) -> None:
+        filename = write_file(tzx(b"\x12" + struct.pack("<HH", 1000, 3), b"\x20\x00\x00", b"\x12" + struct.pack("<HH", 500, 2)), ".tzx")
+        try:
+            tape = Tape(filename)
+            player = TapePlayer(tape)
+            assert_that([len(segment.edges) for segment in player.segments], is_([4, 3]))
+
+            player.play(10000)
+            assert_that(player.level(10000), is_(1))
+            assert_that(player.level(11000), is_(0))
+            assert_that(player.next_edge(11000), is_(12000))
+            assert_that(player.level(13000), is_(0))
+            assert_that(player.playing, is_(False))
+
+            player.play(20000)
+            assert_that(player.level(20000), is_(1))
+            assert_that(player.level(20500), is_(0))
+            assert_that(player.finished, is_(False))
+            # Last pulse ends with an edge
+            assert_that(player.level(21000), is_(1))
+            assert_that(player.finished, is_(True))
+            tape.close()
+        finally:
+            os.remove(filename)
+
+
+class TestTapePlayer:
+    def test_ear_bit_follows_tape(self) -> None:
+        filename = write_file(tzx(b"\x12" + struct.pack("<HH", 20000, 2)), ".tzx")
+        try:
+            spectrum = Spectrum()
+            spectrum.init()
+            spectrum.insert_tape(filename)
+            spectrum.play_tape()
+            spectrum.bus_access.tstates = 10000
+            assert_that(spectrum.ports.in_port(0x7ffe) & 0x40, is_(0x40))
+            spectrum.bus_access.tstates = 30000
+            assert_that(spectrum.ports.in_port(0x7ffe) & 0x40, is_(0))
+            spectrum.eject_tape()
+            assert_that(spectrum.ports.tape_player, is_(None))
+        finally:
+            os.remove(filename)
+
+    def test_accelerated_rom_loading_is_exact(self) -> None:
+        data = bytes((i * 7) & 0xff for i in range(16))
+        filename = write_file(tzx(turbo_block(0xff, data, 3000)), ".tzx")
+        try:
+            results = []
+            for accelerate in (False, True):
+                spectrum = Spectrum()
+                spectrum.init()
+                spectrum.rendering = False
+                spectrum.memory.mem[RETURN_ADDRESS:RETURN_ADDRESS + 2] = b"\x18\xfe"  # JR $
+                spectrum.insert_tape(filename)
+
+                z80 = spectrum.z80
+                z80.regA = 0xff
+                z80.set_flags(1)
+                z80.regIX = 0x8000
+                z80.set_reg_DE(len(data))
+                z80.regSP = 0xff00
+                spectrum.memory.pokew(z80.regSP, RETURN_ADDRESS)
+                z80.regPC = LD_BYTES
+                spectrum.play_tape(accelerate)
+
+                # Trap is not used once tape is played in real time
+                run_until(spectrum, RETURN_ADDRESS, 200)
+                assert_that(z80.carryFlag, is_(True))
+                assert_that(bytes(spectrum.memory.mem[0x8000:0x8000 + len(data)]), is_(data))
+                results.append(machine_state(spectrum))
+                if accelerate:
+                    assert_that(spectrum.loader_accelerator.skipped_iterations, greater_than(100000))
+                spectrum.eject_tape()
+
+            assert_that(results[1], is_(results[0]))
+        finally:
+            os.remove(filename)
+
+    def test_accelerated_custom_edge_loop_is_exact(self) -> None:
+        filename = write_file(tzx(b"\x20" + struct.pack("<H", 100), b"\x12" + struct.pack("<HH", 2168, 4)), ".tzx")
+        try:
+            results = []
+            for accelerate in (False, True):
+                spectrum = Spectrum()
+                spectrum.init()
+                # DI / LD C,0 / loop: IN A,(FE) / RRA / XOR C / AND 20h / JR Z,loop / JR $
+                spectrum.memory.mem[0x9000:0x900d] = bytes.fromhex("f30e00dbfe1fa9e62028f818fe")
+                spectrum.insert_tape(filename)
+                spectrum.z80.regPC = 0x9000
+                spectrum.play_tape(accelerate)
+
+                run_until(spectrum, 0x900b, 20)
+                results.append(machine_state(spectrum))
+                assert_that(spectrum.bus_access.frames, is_(5))
+                if accelerate:
+                    assert_that(spectrum.loader_accelerator.skipped_iterations, greater_than(5000))
+                spectrum.eject_tape()
+
+            assert_that(results[1], is_(results[0]))
+        finally:
+            os.remove(filename)
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from typing import Callable
+
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.beam_timeline import BeamTimeline, AHEAD, BEHIND, TORN
+
+CODE = bytes([
+    0x32, 0x00, 0x40,        # LD (0x4000),A
+    0x32, 0x00, 0x40,        # LD (0x4000),A
+    0x32, 0x00, 0x40,        # LD (0x4000),A
+    0x32, 0x00, 0x58,        # LD (0x5800),A
+    0xed, 0x53, 0xff, 0x57,  # LD (0x57ff),DE
+    0x18, 0xfe               # JR $
+])
+
+
+def profile_code(spectrum: Spectrum) -> BeamTimeline:
+    spectrum.memory.mem[0x8000:0x8000 + len(CODE)] = CODE
+    spectrum.z80.regPC = 0x8000
+    spectrum.z80.ffIFF1 = False
+    spectrum.bus_access.tstates = 14310
+    spectrum.profile(14500)
+    return BeamTimeline(spectrum)
+
+
+class TestBeamTimeline:
+    def test_instructions_are_mapped_to_beam_position(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        timeline = profile_code(create_spectrum(load_snapshot=False, rendering=False))
+
+        assert_that((timeline.start[:3].tolist(), timeline.end[:3].tolist()), is_(([14310, 14323, 14336], [14323, 14336, 14352])))
+        # ULA fetches the first screen byte when beam is at the start of line 48 (after 48 border lines)
+        assert_that((timeline.start_line[:3].tolist(), timeline.start_x[:3].tolist()), is_(([47, 48, 48], [222, 11, 24])))
+        assert_that(int(timeline.end[-1]), is_(int(timeline.start[-1]) + 12))
+
+    def test_screen_writes_are_flagged_against_ula_fetch(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        timeline = profile_code(create_spectrum(load_snapshot=False, rendering=False))
+
+        assert_that(timeline.write_addresses.tolist(), is_([0x4000, 0x4000, 0x4000, 0x5800, 0x57ff, 0x5800]))
+        assert_that(timeline.write_instructions.tolist(), is_([0, 1, 2, 3, 4, 4]))
+        # 0x4000 is fetched at 14337: second write ends one T-state before, third waits for contention
+        assert_that(timeline.write_tstates[:3].tolist(), is_([14323, 14336, 14352]))
+        assert_that(timeline.margin[:3].tolist(), is_([14, 1, -15]))
+        # Attribute is fetched on eight lines, writing it within them splits the cell
+        assert_that(timeline.status.tolist(), is_([AHEAD, AHEAD, BEHIND, TORN, AHEAD, TORN]))
+        assert_that(timeline.writes_per_instruction(TORN)[:5].tolist(), is_([0, 0, 0, 1, 1]))
+
+        histogram = timeline.scanline_histogram()
+        assert_that(histogram.sum(axis=0).tolist(), is_([len(timeline), 3, 1, 2]))
+        assert_that(histogram[63].tolist(), is_([1, 0, 0, 0]))
+
+    def test_csv_export(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(frames=2)
+        spectrum.profile(TSTATES_PER_INTERRUPT)
+        timeline = BeamTimeline(spectrum)
+        with tempfile.TemporaryDirectory() as directory:
+            instructions = os.path.join(directory, "instructions.csv")
+            timeline.save_csv(instructions)
+            with open(instructions) as f:
+                lines = f.read().splitlines()
+            assert_that(lines[0], is_("index,address,start,end,start_line,start_x,end_line,end_x,writes_ahead,writes_behind,writes_torn"))
+            assert_that(len(lines), is_(len(timeline) + 1))
+
+            writes = os.path.join(directory, "writes.csv")
+            timeline.save_writes_csv(writes)
+            with open(writes) as f:
+                assert_that(len(f.read().splitlines()), is_(len(timeline.status) + 1))
+
+            histogram = os.path.join(directory, "histogram.csv")
+            timeline.save_histogram_csv(histogram)
+            with open(histogram) as f:
+                lines = f.read().splitlines()
+            assert_that((lines[0], len(lines)), is_(("line,instructions,writes_ahead,writes_behind,writes_torn", 313)))
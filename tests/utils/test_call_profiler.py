@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+from typing import Callable
+
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from utils.call_profiler import CallProfiler
+
+# DI / loop: CALL 0x9000 / JR loop
+MAIN = bytes.fromhex("f3 cd 00 90 18 fb")
+# CALL 0x9100 / RET
+ROUTINE = bytes.fromhex("cd 00 91 c9")
+# XOR A / RET NZ (not taken) / RET Z
+SUBROUTINE = bytes.fromhex("af c0 c8")
+
+# DI / loop: CALL 0x9200 / CALL 0x9300 / JR loop
+TRICKS = bytes.fromhex("f3 cd 00 92 cd 00 93 18 f8")
+# POP HL / JP (HL) - returns without RET
+POP_JUMP = bytes.fromhex("e1 e9")
+# LD HL, 0x9306 / PUSH HL / RET (jumps to 0x9306) / RET
+PUSH_RET = bytes.fromhex("21 06 93 e5 c9 00 c9")
+
+
+def load(spectrum: Spectrum, code: dict[int, bytes]) -> int:
+    for address, data in code.items():
+        spectrum.memory.mem[address:address + len(data)] = data
+    spectrum.z80.regPC = 0x8000
+    spectrum.z80.regSP = 0xa000
+    return spectrum.bus_access.tstates
+
+
+class TestCallProfiler:
+    def test_inclusive_and_exclusive_tstates_per_call_path(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        start = load(spectrum, {0x8000: MAIN, 0x9000: ROUTINE, 0x9100: SUBROUTINE})
+        profiler = CallProfiler(spectrum, names={0x9000: "routine"})
+        # DI and then ten times CALL (17), CALL (17), XOR A (4), RET NZ (5), RET Z (11), RET (10), JR (12)
+        profiler.execute(start + 4 + 10 * 76)
+
+        # Time from fetch of CALL to fetch of next call or return is accounted to the path
+        assert_that(profiler.exclusive, is_({(): 10 * 22 + 4, (0x9000,): 10 * 28, (0x9000, 0x9100): 10 * 26}))
+        assert_that(profiler.calls, is_({(0x9000,): 10, (0x9000, 0x9100): 10}))
+        inclusive = profiler.inclusive()
+        assert_that((inclusive[()], inclusive[(0x9000,)]), is_((4 + 10 * 76, 10 * 54)))
+        assert_that(profiler.stack, is_([]))
+        assert_that(profiler.report().splitlines()[2].endswith("10x root;routine"), is_(True))
+
+    def test_stack_tricks_are_unwound_by_sp(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        start = load(spectrum, {0x8000: TRICKS, 0x9200: POP_JUMP, 0x9300: PUSH_RET})
+        profiler = CallProfiler(spectrum)
+        profiler.execute(start + 1000)
+
+        # Routine which returned by POP/JP is gone when next one is called, PUSH/RET is not a return
+        assert_that(set(profiler.calls), is_({(0x9200,), (0x9300,)}))
+        ended = [(address, end - start_tstates) for address, start_tstates, end, depth, _ in profiler.events if address == 0x9300]
+        assert_that(ended[0], is_((0x9300, 13 + 10 + 11 + 10 + 4)))
+
+    def test_interrupts_enter_handler(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False, frames=100)
+        profiler = CallProfiler(spectrum)
+        profiler.run_frames(3)
+
+        # Interrupt of the first frame was accepted before profiling started and the one of
+        # the next frame at the end of the last instruction, so two handlers completed
+        handlers = [event for event in profiler.events if event[0] == 0x0038]
+        assert_that([(end - start, interrupt) for _, start, end, _, interrupt in handlers], is_([(889, True), (889, True)]))
+        assert_that(profiler.stack[-1].address, is_(0x0038))
+        # IM1 handler calls KEYBOARD routine and returns with RET
+        handler_paths = [path for path in profiler.calls if path[-1] == 0x0038]
+        assert_that(sum(profiler.calls[path] for path in handler_paths), is_(3))
+        assert_that(sum(1 for path in profiler.calls if path[-2:] == (0x0038, 0x02bf)), is_(2))
+
+    def test_export(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        start = load(spectrum, {0x8000: MAIN, 0x9000: ROUTINE, 0x9100: SUBROUTINE})
+        profiler = CallProfiler(spectrum, names={0x9100: "sub"})
+        profiler.execute(start + 4 + 2 * 76)
+        with tempfile.TemporaryDirectory() as directory:
+            folded = os.path.join(directory, "profile.folded")
+            profiler.save_folded(folded)
+            with open(folded) as f:
+                assert_that(f.read(), is_("root 48\nroot;0x9000 56\nroot;0x9000;sub 52\n"))
+
+            trace = os.path.join(directory, "trace.json")
+            profiler.save_chrome_trace(trace)
+            with open(trace) as f:
+                events = json.load(f)["traceEvents"]
+            assert_that([(event["name"], event["dur"], event["args"]["depth"]) for event in events[:2]], is_([("sub", 26, 1), ("0x9000", 54, 0)]))
@@ -0,0 +1,82 @@
+import os
+import tempfile
+from typing import Callable
+
+import numpy as np
+from hamcrest import assert_that, is_, greater_than
+
+from spectrum.spectrum import Spectrum
+from utils.contention_report import ContentionReport
+
+
+# loop: LD A,(data) / LD (data + 1),A / LD HL,data / INC (HL) / JR loop
+def program(data: int) -> bytes:
+    lo, hi = data & 0xff, data >> 8
+    return bytes([0x3a, lo, hi, 0x32, (lo + 1) & 0xff, hi, 0x21, lo, hi, 0x34, 0x18, 0xf4])
+
+
+def profile(spectrum: Spectrum, code: int, data: int) -> ContentionReport:
+    spectrum.memory.mem[code:code + 12] = program(data)
+    spectrum.z80.regPC = code
+    spectrum.z80.ffIFF1 = False
+    spectrum.bus_access.tstates = 14000
+    spectrum.profile(20000)
+    return ContentionReport(spectrum)
+
+
+def instruction_starts(spectrum: Spectrum) -> np.ndarray:
+    instructions = spectrum.instructions
+    return np.frombuffer(instructions.tstates, dtype=np.int32, count=instructions.count)
+
+
+class TestContentionReport:
+    def test_delays_per_pc_page_and_kind(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        report = profile(spectrum, 0x6000, 0x7000)
+
+        total = report.total_delay()
+        assert_that(total, greater_than(0))
+        assert_that(int(report.per_pc().sum()), is_(total))
+        assert_that(int(report.per_page().sum()), is_(total))
+        assert_that(set(np.flatnonzero(report.per_page())) <= {0x60, 0x70}, is_(True))
+        kinds = report.per_kind()
+        assert_that(sum(kinds.values()), is_(total))
+        assert_that((kinds["fetch"] > 0, kinds["read"] > 0, kinds["write"] > 0, kinds["address on bus"] > 0, kinds["io"]), is_((True, True, True, True, 0)))
+        # Only INC (HL) has internal cycle on contended address
+        per_pc = report.per_pc()
+        assert_that(per_pc[0x6009] > 0, is_(True))
+
+    def test_replay_without_relocation_reproduces_recorded_timing(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(frames=1, rendering=False)
+        spectrum.profile()
+        report = ContentionReport(spectrum)
+
+        timeline = report.relocated(code=False, data=False)
+        assert_that(np.array_equal(timeline[:-1], instruction_starts(spectrum)), is_(True))
+        assert_that(int(timeline[-1] - timeline[0]), is_(report.total_tstates()))
+
+    def test_relocation_estimates_match_running_relocated_program(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        contended_code = profile(create_spectrum(load_snapshot=False, rendering=False), 0x6000, 0x9000)
+        timeline = contended_code.relocated(code=True, data=False)
+        relocated = create_spectrum(load_snapshot=False, rendering=False)
+        profile(relocated, 0x8000, 0x9000)
+        assert_that(np.array_equal(timeline[:-1], instruction_starts(relocated)[:len(timeline) - 1]), is_(True))
+
+        contended_data = profile(create_spectrum(load_snapshot=False, rendering=False), 0x8000, 0x6000)
+        timeline = contended_data.relocated(code=False, data=True)
+        assert_that(np.array_equal(timeline[:-1], instruction_starts(relocated)[:len(timeline) - 1]), is_(True))
+        assert_that(contended_data.relocated_tstates(code=True, data=False), is_(contended_data.total_tstates()))
+
+        assert_that(contended_data.report().splitlines()[3].startswith("data above 0x8000: "), is_(True))
+
+    def test_csv_export(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        report = profile(spectrum, 0x6000, 0x7000)
+        with tempfile.TemporaryDirectory() as directory:
+            csv = os.path.join(directory, "contention.csv")
+            report.save_csv(csv)
+            with open(csv) as f:
+                lines = f.read().splitlines()
+        assert_that(lines[0], is_("address,instruction,delay,fetch,read,write,io,address_on_bus"))
+        assert_that(lines[1].startswith('0x6000,"ld a, ($7000)",'), is_(True))
+        assert_that(len(lines), is_(6))
@@ -0,0 +1,86 @@
+import os
+import tempfile
+from io import StringIO
+from typing import Callable
+
+from hamcrest import assert_that, is_
+
+# assembler_utils and z80_assembler are top-level modules of assembler/ as in tests/assembler
+# (run with PYTHONPATH=tests:assembler, see README)
+from assembler_utils import second_pass, assembler_output
+from spectrum.spectrum import Spectrum
+from utils.coverage import Coverage
+from z80.instructions.instruction_def import Instruction
+from z80_assembler import Z80AssemblerParser
+
+SOURCE = """        org $8000
+start:  ld a, 1
+        cp 1
+        jp z, taken
+        add a, b
+taken:  ld b, 2
+loop:   jp loop
+data:   db 1, 2
+"""
+
+
+def assemble(spectrum: Spectrum) -> list:
+    parser = Z80AssemblerParser()
+    scanner = Z80AssemblerParser.SCANNER_CLASS()
+    scanner.set_reader(StringIO(SOURCE))
+    parser.parse(scanner)
+    second_pass(parser.instructions)
+    for instruction in parser.instructions:
+        if isinstance(instruction, Instruction):
+            code = instruction.encode()
+            spectrum.memory.mem[instruction.address:instruction.address + len(code)] = bytes(code)
+    return parser.instructions
+
+
+class TestCoverage:
+    def test_executed_instructions_map_to_source_lines(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        instructions = assemble(spectrum)
+        spectrum.z80.regPC = 0x8000
+        spectrum.z80.ffIFF1 = False
+        coverage = Coverage(spectrum)
+        coverage.execute(spectrum.bus_access.tstates + 1000)
+
+        assert_that(coverage.addresses().tolist(), is_([0x8000, 0x8002, 0x8004, 0x8008, 0x800a]))
+        assert_that(coverage.lines(instructions), is_({2: True, 3: True, 4: True, 5: False, 6: True, 7: True}))
+
+    def test_coverage_merges_across_runs(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        instructions = assemble(spectrum)
+        other = Coverage(spectrum)
+        spectrum.z80.regPC = 0x8007
+        other.execute(spectrum.bus_access.tstates + 100)
+
+        coverage = Coverage(spectrum)
+        spectrum.z80.regPC = 0x8000
+        coverage.execute(spectrum.bus_access.tstates + 100)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "coverage.bin")
+            other.save(filename)
+            coverage.merge_file(filename)
+
+            lcov = os.path.join(directory, "coverage.info")
+            coverage.save_lcov(lcov, instructions, "test.asm")
+            with open(lcov) as f:
+                lines = f.read().splitlines()
+
+        assert_that(len(coverage), is_(6))
+        assert_that(lines, is_(["TN:", "SF:test.asm", "DA:2,1", "DA:3,1", "DA:4,1", "DA:5,1", "DA:6,1", "DA:7,1", "LF:6", "LH:6", "end_of_record"]))
+
+    def test_annotated_listing(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        instructions = assemble(spectrum)
+        spectrum.z80.regPC = 0x8000
+        coverage = Coverage(spectrum)
+        coverage.execute(spectrum.bus_access.tstates + 100)
+
+        listing = StringIO()
+        assembler_output(instructions, coverage.executed, file=listing)
+        lines = listing.getvalue().splitlines()
+        assert_that([line[:8] for line in lines[1:7]], is_(["+ 0x8000", "+ 0x8002", "+ 0x8004", "- 0x8007", "+ 0x8008", "+ 0x800a"]))
+        assert_that(lines[7].startswith("  0x800d data"), is_(True))
@@ -0,0 +1,170 @@
+from typing import Callable
+
+import pytest
+from hamcrest import assert_that, is_, calling, raises, greater_than
+
+from spectrum.spectrum import Spectrum
+from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess as Bus
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.debugger import Debugger, compile_condition, WATCH_READ, WATCH_WRITE
+
+# DI / LD B,0 / loop: INC B / LD A,B / LD (0x9000),A / OUT (0xFE),A / JR loop
+PROGRAM = bytes.fromhex("f3 06 00 04 78 32 00 90 d3 fe 18 f7")
+LOOP = 0x03
+STORE = 0x05
+
+
+# Returns function creating Spectrum with PROGRAM at given address, about to run it
+@pytest.fixture
+def create_program_spectrum(create_spectrum: Callable[..., Spectrum]) -> Callable[..., Spectrum]:
+    def create(base: int = 0x8000) -> Spectrum:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        spectrum.memory.mem[base:base + len(PROGRAM)] = PROGRAM
+        spectrum.z80.regPC = base
+        return spectrum
+    return create
+
+
+class TestConditions:
+    def test_condition_reads_registers_and_memory(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_program_spectrum()
+        z80 = spectrum.z80
+        z80.set_reg_HL(0x4000)
+        z80.regA = 4
+        z80.carryFlag = False
+        spectrum.memory.mem[0x4002] = 7
+        condition = compile_condition("HL == 0x4000 and A > 3")
+        assert_that(condition(z80, spectrum.memory.mem), is_(True))
+        assert_that(compile_condition("mem[hl + 2] == 7 and not CF")(z80, spectrum.memory.mem), is_(True))
+        z80.regA = 3
+        assert_that(condition(z80, spectrum.memory.mem), is_(False))
+
+    def test_invalid_conditions_are_rejected(self) -> None:
+        assert_that(calling(compile_condition).with_args("XY == 1"), raises(ValueError))
+        assert_that(calling(compile_condition).with_args("__import__('os')"), raises(ValueError))
+        assert_that(calling(compile_condition).with_args("A == 'a'"), raises(ValueError))
+        assert_that(calling(compile_condition).with_args("A =="), raises(ValueError))
+
+
+class TestDebugger:
+    def test_breakpoint_stops_before_instruction(self, create_program_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        reference = create_program_spectrum()
+        while reference.z80.regPC != 0x8000 + STORE:
+            reference.z80.execute_one_cycle()
+
+        spectrum = create_program_spectrum()
+        debugger = Debugger(spectrum)
+        debugger.add_breakpoint(0x8000 + STORE)
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that(hit.kind, is_("breakpoint"))
+        assert_that(snapshot(spectrum), is_(snapshot(reference)))
+
+        # Continuing runs the loop once more and stops at the same place
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that((hit.pc, spectrum.z80.regB), is_((0x8000 + STORE, 2)))
+        assert_that(debugger.breakpoints[0x8000 + STORE].hits, is_(2))
+
+    def test_breakpoint_in_contended_memory_keeps_timing(self, create_program_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        reference = create_program_spectrum(0x6000)
+        reference.execute(TSTATES_PER_INTERRUPT)
+
+        spectrum = create_program_spectrum(0x6000)
+        debugger = Debugger(spectrum)
+        debugger.add_breakpoint(0x6000 + LOOP, "B == 200")
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that((hit.pc, spectrum.z80.regB), is_((0x6000 + LOOP, 200)))
+        debugger.remove_breakpoint(0x6000 + LOOP)
+        assert_that(debugger.execute(TSTATES_PER_INTERRUPT), is_(None))
+        assert_that(snapshot(spectrum), is_(snapshot(reference)))
+
+    def test_conditional_breakpoint(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_program_spectrum()
+        debugger = Debugger(spectrum)
+        breakpoint = debugger.add_breakpoint(0x8000 + LOOP, "B == 5")
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that(hit.breakpoint, is_(breakpoint))
+        assert_that(spectrum.z80.regB, is_(5))
+
+    def test_write_watchpoint_stops_after_instruction(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_program_spectrum()
+        debugger = Debugger(spectrum)
+        debugger.watch_memory(0x9000, access=WATCH_WRITE, condition="A == 3")
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that((hit.kind, hit.pc, hit.address, hit.value), is_(("write", 0x8000 + STORE + 3, 0x9000, 3)))
+        assert_that(spectrum.z80.regPC, is_(0x8000 + STORE + 3))
+        assert_that(spectrum.watching, is_(True))
+
+        # Nothing reads the watched page
+        debugger.remove_watchpoint(debugger.watchpoints[0])
+        debugger.watch_memory(0x9000, access=WATCH_READ)
+        assert_that(debugger.execute(TSTATES_PER_INTERRUPT), is_(None))
+
+    def test_breakpoint_on_code_written_after_it_was_added(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_program_spectrum()
+        debugger = Debugger(spectrum)
+        debugger.add_breakpoint(0xa000)
+        # JP 0xa000 instead of JR loop, then INC A there written both directly and through bus
+        spectrum.memory.mem[0x800a:0x800d] = bytes.fromhex("c3 00 a0")
+        spectrum.memory.mem[0xa000] = 0x3c
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that((hit.kind, hit.pc, spectrum.z80.regA), is_(("breakpoint", 0xa000, 1)))
+
+        spectrum.z80.regPC = 0x8000
+        spectrum.bus_access.pokeb(0xa000, 0x00)
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that((hit.kind, hit.pc, spectrum.z80.regA), is_(("breakpoint", 0xa000, 1)))
+
+    def test_watchpoint_instruments_only_watched_kinds_of_access(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_program_spectrum()
+        debugger = Debugger(spectrum)
+        watchpoint = debugger.watch_memory(0x9000, access=WATCH_WRITE)
+        debugger.execute(10)
+        bus_type = type(spectrum.bus_access)
+        assert_that((bus_type.pokeb is Bus.pokeb, bus_type.peekb is Bus.peekb, bus_type.in_port is Bus.in_port), is_((False, True, True)))
+
+        debugger.remove_watchpoint(watchpoint)
+        debugger.watch_port(0x00fe, mask=0x00ff)
+        assert_that(type(spectrum.bus_access).pokeb is Bus.pokeb, is_(True))
+        assert_that(type(spectrum.bus_access).out_port is Bus.out_port, is_(False))
+        # Execution stopped by watchpoint doesn't leave CPU stopping outside debugger
+        assert_that(debugger.execute(TSTATES_PER_INTERRUPT).kind, is_("out"))
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        assert_that(spectrum.bus_access.tstates >= TSTATES_PER_INTERRUPT, is_(True))
+
+    def test_watchpoint_keeps_accounting_bus(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        accounted = create_program_spectrum(0x6000)
+        accounted.accounting = True
+        accounted.execute(TSTATES_PER_INTERRUPT)
+        assert_that(accounted.bus_access.contention, greater_than(0))
+
+        spectrum = create_program_spectrum(0x6000)
+        spectrum.accounting = True
+        debugger = Debugger(spectrum)
+        # Nothing reads the watched page, so the whole frame runs
+        debugger.watch_memory(0x9000, access=WATCH_READ)
+        assert_that(debugger.execute(TSTATES_PER_INTERRUPT), is_(None))
+        assert_that((spectrum.watching, spectrum.accounting), is_((True, True)))
+        assert_that(spectrum.bus_access.contention, is_(accounted.bus_access.contention))
+
+        debugger.watch_memory(0x9000, access=WATCH_WRITE)
+        assert_that(debugger.execute(2 * TSTATES_PER_INTERRUPT).kind, is_("write"))
+        spectrum.watching = False
+        assert_that(spectrum.bus_access is spectrum.accounting_bus_access, is_(True))
+
+    def test_port_watchpoint(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_program_spectrum()
+        debugger = Debugger(spectrum)
+        debugger.watch_port(0x00fe, mask=0x00ff, access=WATCH_WRITE, condition="B == 2")
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        assert_that((hit.kind, hit.address & 0xff, hit.value), is_(("out", 0xfe, 2)))
+
+    def test_nothing_is_instrumented_without_breakpoints(self, create_program_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_program_spectrum()
+        debugger = Debugger(spectrum)
+        debugger.add_breakpoint(0x8000 + LOOP)
+        debugger.remove_breakpoint(0x8000 + LOOP)
+        assert_that(debugger.execute(TSTATES_PER_INTERRUPT), is_(None))
+        assert_that(spectrum.watching, is_(False))
+        main_cmds = spectrum.z80._main_cmds
+        original = spectrum.traps.original_cmds
+        assert_that([opcode for opcode in range(256) if main_cmds[opcode] is not original[opcode]], is_([0x14]))
@@ -0,0 +1,100 @@
+import json
+from typing import Callable
+
+from hamcrest import assert_that, is_, greater_than, less_than
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.call_profiler import CallProfiler
+from utils.frame_budget import FrameBudget, MAIN, INTERRUPT, HALT, CONTENTION
+
+# EI / loop: HALT / JR loop
+HALT_LOOP = bytes.fromhex("fb 76 18 fd")
+# EI / loop: INC B / JR loop
+BUSY_LOOP = bytes.fromhex("fb 04 18 fd")
+
+
+def booted_spectrum(create_spectrum: Callable[..., Spectrum], code: bytes, base: int) -> Spectrum:
+    # ROM's IM1 handler needs initialised system variables
+    spectrum = create_spectrum(load_snapshot=False, rendering=False, frames=100)
+    spectrum.memory.mem[base:base + len(code)] = code
+    spectrum.z80.regPC = base
+    return spectrum
+
+
+class TestFrameBudget:
+    def test_halt_loop_is_idle_but_for_interrupt(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = booted_spectrum(create_spectrum, HALT_LOOP, 0x8000)
+        budget = FrameBudget(spectrum)
+        start = spectrum.bus_access.tstates
+        budget.run_frames(5)
+
+        frames = budget.recent(5)
+        # Whole frames are accounted
+        assert_that(int(frames.sum()), is_(5 * TSTATES_PER_INTERRUPT + spectrum.bus_access.tstates - start))
+        # After handler returns: rest of RET (6), JR (12) and fetch of HALT (4)
+        assert_that(frames[1:, MAIN].tolist(), is_([22] * 4))
+        assert_that(frames[1:, INTERRUPT].min(), greater_than(800))
+        assert_that(frames[1:, INTERRUPT].max(), less_than(1000))
+        assert_that(frames[1:, HALT].min(), greater_than(68900))
+        assert_that(frames[:, CONTENTION].tolist(), is_([0] * 5))
+        assert_that(spectrum.accounting, is_(False))
+        assert_that(spectrum.z80.interrupt_listener is None, is_(True))
+
+    def test_contention_is_taken_out_of_main_loop(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = booted_spectrum(create_spectrum, BUSY_LOOP, 0x6000)
+        budget = FrameBudget(spectrum)
+        budget.run_frames(3)
+
+        frames = budget.recent(3)
+        assert_that(frames[:, HALT].tolist(), is_([0] * 3))
+        assert_that(frames[:, CONTENTION].min(), greater_than(14000))
+        assert_that(frames[:, MAIN].max(), less_than(TSTATES_PER_INTERRUPT - 14000))
+
+        without_contention = FrameBudget(booted_spectrum(create_spectrum, BUSY_LOOP, 0x6000), contention=False)
+        without_contention.run_frames(1)
+        assert_that(int(without_contention.recent(1)[0, CONTENTION]), is_(0))
+
+    def test_runs_together_with_call_profiler(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        alone = FrameBudget(booted_spectrum(create_spectrum, HALT_LOOP, 0x8000))
+        alone.run_frames(3)
+        profiler_alone = CallProfiler(booted_spectrum(create_spectrum, HALT_LOOP, 0x8000))
+        profiler_alone.run_frames(3)
+
+        spectrum = booted_spectrum(create_spectrum, HALT_LOOP, 0x8000)
+        budget = FrameBudget(spectrum)
+        profiler = CallProfiler(spectrum)
+        budget.start()
+        for _ in range(3):
+            profiler.execute(TSTATES_PER_INTERRUPT)
+            budget.end_frame()
+            spectrum.end_frame()
+        # Profiler leaves budget's hooks and listener in place
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        budget.end_frame()
+        budget.stop()
+
+        assert_that(budget.recent(4)[:3].tolist(), is_(alone.recent(3).tolist()))
+        assert_that(int(budget.recent(1)[0, INTERRUPT]), greater_than(800))
+        assert_that(profiler.calls, is_(profiler_alone.calls))
+        assert_that(profiler.exclusive, is_(profiler_alone.exclusive))
+        assert_that((spectrum.traps.opcode_hooks, spectrum.z80.interrupt_listener), is_(({}, None)))
+
+    def test_history_is_ring_buffer(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = booted_spectrum(create_spectrum, HALT_LOOP, 0x8000)
+        budget = FrameBudget(spectrum, history=4)
+        rows = []
+        budget.start()
+        for _ in range(6):
+            spectrum.execute(TSTATES_PER_INTERRUPT)
+            budget.end_frame()
+            spectrum.end_frame()
+            rows.append(budget.recent(1)[0].tolist())
+        budget.stop()
+
+        assert_that(budget.count, is_(6))
+        assert_that(budget.recent(10).tolist(), is_(rows[2:]))
+
+        summary = json.loads(json.dumps(budget.summary()))
+        assert_that((summary["frames"], summary["recorded"], summary["main"]["max"]), is_((6, 4, 22)))
+        assert_that(summary["frames_without_halt"], is_(0))
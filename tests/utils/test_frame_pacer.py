@@ -0,0 +1,61 @@
+from hamcrest import assert_that, is_, close_to
+
+from utils.frame_pacer import FramePacer, UNLIMITED
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000_000
+
+    def clock(self) -> int:
+        self.now += 1
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += int(seconds * 1_000_000_000)
+
+    def advance(self, ns: int) -> None:
+        self.now += ns
+
+
+class TestFramePacer:
+    def test_period_is_frame_length(self) -> None:
+        pacer = FramePacer()
+        assert_that(pacer.period_ns, is_(19_968_000.0))
+        pacer.speed = 2
+        assert_that(pacer.period_ns, is_(9_984_000.0))
+
+    def test_deadlines_do_not_drift(self) -> None:
+        fake = FakeClock()
+        pacer = FramePacer(spin_ns=100, clock=fake.clock, sleep=fake.sleep)
+        start = fake.now
+        for _ in range(1000):
+            fake.advance(5_000_000)
+            pacer.cpu_done()
+            pacer.present_done()
+            pacer.wait()
+
+        assert_that(fake.now - start, close_to(1000 * 19_968_000, 10))
+        assert_that(pacer.late_frames, is_(0))
+        assert_that(pacer.fps(), close_to(50.08, 0.01))
+        assert_that(pacer.spare_percent(), close_to(75.0, 0.1))
+
+    def test_late_frames_are_caught_up(self) -> None:
+        fake = FakeClock()
+        pacer = FramePacer(spin_ns=100, clock=fake.clock, sleep=fake.sleep)
+        start = fake.now
+        fake.advance(30_000_000)
+        pacer.wait()
+        assert_that(pacer.late_frames, is_(1))
+
+        pacer.wait()
+        assert_that(pacer.late_frames, is_(1))
+        assert_that(fake.now - start, close_to(2 * 19_968_000, 10))
+
+    def test_unlimited_does_not_wait(self) -> None:
+        fake = FakeClock()
+        pacer = FramePacer(speed=UNLIMITED, spin_ns=100, clock=fake.clock, sleep=fake.sleep)
+        fake.advance(1_000_000)
+        pacer.wait()
+        assert_that(pacer.idle_ns < 10, is_(True))
+        assert_that(pacer.speed_percent(), close_to(1996.8, 0.1))
@@ -0,0 +1,100 @@
+import os
+import tempfile
+from typing import Callable
+
+import numpy as np
+from hamcrest import assert_that, is_, greater_than
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.debugger import Debugger, WATCH_READ, WATCH_WRITE
+from utils.memory_heatmap import MemoryHeatmap, READS, WRITES, EXECUTES
+
+# DI / LD HL,0x9000 / loop: INC (HL) / LD A,(0x9100) / LD (0x9200),HL / JP loop
+LOOP = bytes.fromhex("f3 21 00 90 34 3a 00 91 22 00 92 c3 04 80")
+
+
+def load_loop(spectrum: Spectrum) -> None:
+    spectrum.memory.mem[0x8000:0x8000 + len(LOOP)] = LOOP
+    spectrum.z80.regPC = 0x8000
+
+
+class TestMemoryHeatmap:
+    def test_reads_writes_and_executes_per_address(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        other = create_spectrum(load_snapshot=False, rendering=False)
+        load_loop(spectrum)
+        load_loop(other)
+        heatmap = MemoryHeatmap(spectrum)
+        heatmap.run_frames(2)
+        for _ in range(2):
+            other.execute(TSTATES_PER_INTERRUPT)
+            other.end_frame()
+
+        assert_that(snapshot(spectrum) == snapshot(other), is_(True))
+        assert_that(spectrum.heatmap, is_(False))
+        totals = heatmap.totals
+        loops = int(totals[EXECUTES, 0x8004])
+        assert_that(loops, greater_than(2 * TSTATES_PER_INTERRUPT // 60))
+        assert_that(np.flatnonzero(totals[EXECUTES]).tolist(), is_([0x8000, 0x8001, 0x8004, 0x8005, 0x8008, 0x800b]))
+        assert_that((int(totals[READS, 0x9000]), int(totals[WRITES, 0x9000])), is_((loops, loops)))
+        stores = int(totals[EXECUTES, 0x8008])
+        assert_that((int(totals[READS, 0x9100]), int(totals[WRITES, 0x9200]), int(totals[WRITES, 0x9201])), is_((loops, stores, stores)))
+        # Operands are read, not executed
+        assert_that(int(totals[READS, 0x8006]), is_(loops))
+        assert_that(int(spectrum.heatmap_bus_access.executes[0x8004]), is_(0))
+
+    def test_counts_with_watchpoint(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        alone = create_spectrum(load_snapshot=False, rendering=False)
+        load_loop(alone)
+        alone_heatmap = MemoryHeatmap(alone)
+        alone_heatmap.run_frames(1)
+
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        load_loop(spectrum)
+        heatmap = MemoryHeatmap(spectrum)
+        debugger = Debugger(spectrum)
+        # Watched page is read every loop, but condition never holds
+        debugger.watch_memory(0x9100, access=WATCH_READ, condition="B == 0x100")
+        heatmap.start()
+        assert_that(debugger.execute(TSTATES_PER_INTERRUPT), is_(None))
+        heatmap.end_frame()
+        spectrum.end_frame()
+        assert_that((spectrum.watching, spectrum.heatmap), is_((True, True)))
+        assert_that(heatmap.totals.tolist() == alone_heatmap.totals.tolist(), is_(True))
+
+        debugger.watch_memory(0x9200, access=WATCH_WRITE)
+        hit = debugger.execute(TSTATES_PER_INTERRUPT)
+        heatmap.end_frame()
+        heatmap.stop()
+        assert_that(hit.kind, is_("write"))
+        assert_that(int(heatmap.totals[WRITES, 0x9200]), is_(int(alone_heatmap.totals[WRITES, 0x9200]) + 1))
+        assert_that(spectrum.heatmap, is_(False))
+
+    def test_heat_decays_and_is_rendered_per_page(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        load_loop(spectrum)
+        heatmap = MemoryHeatmap(spectrum, decay=0.5)
+        heatmap.run_frames(1)
+        first = float(heatmap.heat[EXECUTES, 0x8004])
+        heatmap.run_frames(1)
+        assert_that(float(heatmap.heat[EXECUTES, 0x8004]), is_(0.5 * first + int(heatmap.totals[EXECUTES, 0x8004]) - first))
+
+        image = heatmap.image()
+        assert_that(image.shape, is_((256, 256, 3)))
+        # Write to 0x9200 is red at row 0x92, column 0; execute of JP is blue
+        assert_that((image[0x92, 0, 0] > 250, image[0x92, 0, 1:].tolist()), is_((True, [0, 0])))
+        assert_that((image[0x80, 0x0b, 2] > 250, image[0x80, 0x0b, :2].tolist()), is_((True, [0, 0])))
+        assert_that(int(image[0x00, 0x00].sum()), is_(0))
+
+    def test_npy_export(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(frames=1)
+        heatmap = MemoryHeatmap(spectrum)
+        heatmap.run_frames(1)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "heatmap.npy")
+            heatmap.save_npy(filename)
+            totals = np.load(filename)
+        assert_that((totals.shape, totals.dtype == np.uint64), is_(((3, 65536), True)))
+        assert_that(np.array_equal(totals, heatmap.totals), is_(True))
+        assert_that(int(totals[WRITES, 0x4000:0x5b00].sum()), greater_than(0))
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from typing import Callable
+
+from hamcrest import assert_that, is_, greater_than
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.pc_accounting import PCAccounting
+
+# DI / loop: INC B / JR loop
+LOOP = bytes.fromhex("f3 04 18 fd")
+
+
+def load_loop(spectrum: Spectrum, base: int) -> None:
+    spectrum.memory.mem[base:base + len(LOOP)] = LOOP
+    spectrum.z80.regPC = base
+
+
+class TestPCAccounting:
+    def test_accounting_runs_like_normal_execution(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = create_spectrum(frames=1)
+        other = create_spectrum(frames=1)
+        accounting = PCAccounting(spectrum)
+        start = spectrum.bus_access.tstates
+        accounting.run_frames(3)
+        for _ in range(3):
+            other.execute(TSTATES_PER_INTERRUPT)
+            other.end_frame()
+
+        assert_that(snapshot(spectrum) == snapshot(other), is_(True))
+        assert_that(spectrum.bus_access is spectrum.accounting_bus_access, is_(False))
+        assert_that(accounting.total_tstates(), is_(3 * TSTATES_PER_INTERRUPT + spectrum.bus_access.tstates - start))
+        assert_that(accounting.contention_percentage(), greater_than(0.0))
+
+    def test_tstates_and_contention_per_address(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        accounting = PCAccounting(spectrum)
+        load_loop(spectrum, 0x8000)
+        accounting.execute(TSTATES_PER_INTERRUPT)
+        count = accounting.counts[0x8001]
+        assert_that(accounting.counts[0x8002], is_(count))
+        assert_that((accounting.tstates[0x8001], accounting.tstates[0x8002]), is_((4 * count, 12 * count)))
+        assert_that(sum(accounting.contention), is_(0))
+
+        # Same loop in contended memory waits for ULA while screen is drawn
+        accounting.clear()
+        spectrum.end_frame()
+        load_loop(spectrum, 0x6000)
+        accounting.execute(TSTATES_PER_INTERRUPT)
+        count = accounting.counts[0x6001]
+        contention = accounting.contention
+        assert_that(contention[0x6002], greater_than(0))
+        assert_that((accounting.tstates[0x6001], accounting.tstates[0x6002]), is_((4 * count + contention[0x6001], 12 * count + contention[0x6002])))
+        assert_that(accounting.contention_percentage(), greater_than(10.0))
+
+        top = accounting.top(2)
+        assert_that([(spot.address, spot.disassembly) for spot in top], is_([(0x6002, "jr $6001"), (0x6001, "inc b")]))
+
+    def test_interrupt_is_accounted_to_handler(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False, frames=100)
+        accounting = PCAccounting(spectrum)
+        accounting.run_frames(2)
+        # Handler starts with PUSH AF (11 T-states), acceptance of IM1 interrupt takes 13
+        assert_that(accounting.counts[0x0038], is_(2))
+        assert_that(accounting.tstates[0x0038], is_(2 * (13 + 11)))
+
+    def test_interrupt_left_by_accounting_bus_is_not_accounted_again(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False, frames=100)
+        spectrum.accounting = True
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        spectrum.end_frame()
+        assert_that(spectrum.accounting_bus_access.interrupt_tstates, greater_than(-1))
+
+        accounting = PCAccounting(spectrum)
+        start = spectrum.bus_access.tstates
+        accounting.execute(TSTATES_PER_INTERRUPT)
+        assert_that(accounting.total_tstates(), is_(spectrum.bus_access.tstates - start))
+        assert_that(accounting.counts[0x0038], is_(1))
+
+    def test_export(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        accounting = PCAccounting(spectrum)
+        load_loop(spectrum, 0x8000)
+        accounting.execute(1000)
+        with tempfile.TemporaryDirectory() as directory:
+            csv = os.path.join(directory, "profile.csv")
+            accounting.save_csv(csv)
+            with open(csv) as f:
+                lines = f.read().splitlines()
+            assert_that(lines[0], is_("address,instruction,count,tstates,contention"))
+            assert_that(lines[2].startswith('0x8001,"inc b",'), is_(True))
+
+            callgrind = os.path.join(directory, "callgrind.out")
+            accounting.save_callgrind(callgrind)
+            with open(callgrind) as f:
+                content = f.read()
+            assert_that("fn=0x8002 jr $8001\n0x8002 " in content, is_(True))
+            assert_that(f"summary: {accounting.total_tstates()} 0 " in content, is_(True))
@@ -0,0 +1,74 @@
+from typing import Callable
+
+import pytest
+from hamcrest import assert_that, is_, less_than
+
+from spectrum.spectrum import Spectrum
+from utils.playback import Playback
+
+
+@pytest.fixture
+def spectrum(create_spectrum: Callable[..., Spectrum]) -> Spectrum:
+    return create_spectrum(frames=3)
+
+
+def step(spectrum: Spectrum, playback: Playback, history: list, steps: int, snapshot: Callable[[Spectrum], tuple]) -> None:
+    for _ in range(steps):
+        if spectrum.execute_one_instruction():
+            spectrum.end_frame()
+        playback.record()
+        history.append(snapshot(spectrum))
+
+
+def assert_restored(restored: tuple, expected: tuple) -> None:
+    memory, cpu_state, tstates, frames = restored
+    expected_memory, expected_cpu_state, expected_tstates, expected_frames = expected
+    assert_that(memory == expected_memory, is_(True))
+    assert_that(cpu_state, is_(expected_cpu_state))
+    assert_that((tstates, frames), is_((expected_tstates, expected_frames)))
+
+
+class TestPlayback:
+    def test_restore_previous(self, spectrum: Spectrum, snapshot: Callable[[Spectrum], tuple]) -> None:
+        playback = Playback(spectrum, backlog_size=1000, keyframe_interval=16)
+        history = []
+        step(spectrum, playback, history, 300, snapshot)
+
+        playback.restore_previous()
+        assert_restored(snapshot(spectrum), history[299])
+        playback.restore_previous(37)
+        assert_restored(snapshot(spectrum), history[262])
+        playback.restore_first()
+        assert_restored(snapshot(spectrum), history[0])
+
+    def test_ring_buffer_drops_oldest_and_keeps_keyframe_first(self, spectrum: Spectrum, snapshot: Callable[[Spectrum], tuple]) -> None:
+        playback = Playback(spectrum, backlog_size=50, keyframe_interval=16)
+        history = []
+        step(spectrum, playback, history, 130, snapshot)
+
+        assert_that(len(playback), is_(50))
+        assert_that(playback.entry(0).keyframe, is_(True))
+        playback.restore_first()
+        assert_restored(snapshot(spectrum), history[80])
+
+    def test_record_after_restore_continues_from_restored_state(self, spectrum: Spectrum, snapshot: Callable[[Spectrum], tuple]) -> None:
+        playback = Playback(spectrum, backlog_size=1000, keyframe_interval=8)
+        history = []
+        step(spectrum, playback, history, 100, snapshot)
+
+        playback.restore_previous(41)
+        del history[59:]
+        step(spectrum, playback, history, 20, snapshot)
+        assert_that(len(playback), is_(79))
+
+        playback.restore_previous(3)
+        assert_restored(snapshot(spectrum), history[76])
+        playback.restore_previous(30)
+        assert_restored(snapshot(spectrum), history[46])
+
+    def test_deltas_are_small(self, spectrum: Spectrum, snapshot: Callable[[Spectrum], tuple]) -> None:
+        playback = Playback(spectrum, backlog_size=1000)
+        step(spectrum, playback, [], 1000, snapshot)
+
+        # Four keyframes of 112KB, the rest are few changed pages per instruction
+        assert_that(playback.history_bytes(), less_than(4 * 112 * 1024 + 1000 * 4 * 256))
@@ -0,0 +1,43 @@
+from typing import Callable
+
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.run_ahead import RunAhead
+
+
+def run_frames(spectrum: Spectrum, run_ahead: RunAhead, frames: int) -> None:
+    for _ in range(frames):
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        spectrum.end_frame()
+        run_ahead.run_ahead()
+
+
+class TestRunAhead:
+    def test_run_ahead_does_not_change_real_timeline(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        plain = create_spectrum()
+        run_frames(plain, RunAhead(plain, 0), 5)
+
+        ahead = create_spectrum()
+        run_ahead = RunAhead(ahead, 2)
+        run_frames(ahead, run_ahead, 5)
+
+        assert_that(snapshot(ahead) == snapshot(plain), is_(True))
+        assert_that(run_ahead.runs, is_(5))
+
+    def test_state_round_trip(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum()
+        spectrum.execute(1000)
+
+        state = spectrum.save_state()
+        cpu_state = spectrum.z80.get_state()
+        memory = bytes(spectrum.memory.mem)
+        tstates = spectrum.bus_access.tstates
+
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        spectrum.restore_state(state)
+
+        assert_that(spectrum.z80.get_state(), is_(cpu_state))
+        assert_that(bytes(spectrum.memory.mem), is_(memory))
+        assert_that(spectrum.bus_access.tstates, is_(tstates))
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import time
+from typing import Callable
+
+import pytest
+from hamcrest import assert_that, is_, calling, raises, less_than
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.savestate_store import SavestateStore, PAGES
+
+
+@pytest.fixture
+def spectrum(create_spectrum: Callable[..., Spectrum]) -> Spectrum:
+    spectrum = create_spectrum()
+    spectrum.execute(TSTATES_PER_INTERRUPT // 3)
+    return spectrum
+
+
+# Also beam position and sound, which savestates keep too
+@pytest.fixture
+def full_snapshot(snapshot: Callable[[Spectrum], tuple]) -> Callable[[Spectrum], tuple]:
+    def take(spectrum: Spectrum) -> tuple:
+        video = spectrum.video
+        return snapshot(spectrum) + (spectrum.bus_access.next_screen_byte_index, video.offs, video.pixel_byte_x,
+                                     video.pixel_byte_y, spectrum.sound_state())
+    return take
+
+
+class TestSavestateStore:
+    def test_save_and_load(self, spectrum: Spectrum, full_snapshot: Callable[[Spectrum], tuple]) -> None:
+        expected = full_snapshot(spectrum)
+        with tempfile.TemporaryDirectory() as directory:
+            store = SavestateStore(directory)
+            assert_that(store.save(spectrum, "slot1") > 0, is_(True))
+            assert_that(store.registers("slot1").regPC, is_(spectrum.z80.regPC))
+            store.close()
+
+            other = Spectrum()
+            store = SavestateStore(directory)
+            store.load(other, "slot1")
+            assert_that(full_snapshot(other) == expected, is_(True))
+            assert_that(store.names(), is_(["slot1"]))
+            store.close()
+
+    def test_only_new_pages_are_written(self, spectrum: Spectrum) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            store = SavestateStore(directory)
+            first = store.save(spectrum, "a")
+            assert_that(store.save(spectrum, "b"), is_(0))
+
+            spectrum.memory.mem[40000] ^= 0xff
+            assert_that(store.save(spectrum, "c"), is_(1))
+            assert_that(store.pack_size(), is_((first + 1) * 1024))
+
+            store.load(spectrum, "a")
+            spectrum.memory.mem[40000] ^= 0xff
+            expected = bytes(spectrum.memory.mem)
+            store.load(spectrum, "b")
+            store.load(spectrum, "c")
+            assert_that(bytes(spectrum.memory.mem) == expected, is_(True))
+
+            store.delete("b")
+            assert_that(store.names(), is_(["a", "c"]))
+            store.close()
+
+    def test_load_is_fast(self, spectrum: Spectrum) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            store = SavestateStore(directory)
+            store.save(spectrum, "slot")
+            store.load(spectrum, "slot")
+            started = time.perf_counter()
+            for _ in range(100):
+                store.load(spectrum, "slot")
+            assert_that((time.perf_counter() - started) / 100, less_than(0.001))
+            store.close()
+
+    def test_errors(self, spectrum: Spectrum) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            store = SavestateStore(directory)
+            assert_that(calling(store.save).with_args(spectrum, "../x"), raises(ValueError))
+            with open(os.path.join(directory, "states", "broken.state"), "wb") as f:
+                f.write(b"ZXSS" + bytes(PAGES))
+            assert_that(calling(store.load).with_args(spectrum, "broken"), raises(ValueError))
+            assert_that(calling(store.load).with_args(spectrum, "missing"), raises(FileNotFoundError))
+            store.close()
@@ -0,0 +1,119 @@
+import os
+import random
+import struct
+import tempfile
+from typing import Callable
+
+import pytest
+from hamcrest import assert_that, is_, calling, raises
+
+from spectrum.spectrum import Spectrum
+from utils.snapshot_codec import (
+    Z80_HEADER, SnapshotError, decode_sna, decode_szx, decode_z80, decode_z80_block,
+    encode_sna, encode_szx, encode_z80, encode_z80_block
+)
+
+
+@pytest.fixture
+def sna(snapshot_file: str) -> bytes:
+    with open(snapshot_file, "rb") as f:
+        return f.read()
+
+
+def registers(snapshot) -> tuple:
+    return (snapshot.a, snapshot.f, snapshot.bc, snapshot.de, snapshot.hl, snapshot.ax, snapshot.fx,
+            snapshot.bcx, snapshot.dex, snapshot.hlx, snapshot.ix, snapshot.iy, snapshot.sp, snapshot.pc,
+            snapshot.i, snapshot.r, snapshot.iff1, snapshot.iff2, snapshot.im, snapshot.border)
+
+
+def v3_file(snapshot, hardware: int = 0, page: int = 8) -> bytes:
+    header = bytearray(Z80_HEADER.size)
+    header[0:Z80_HEADER.size] = encode_z80(snapshot)[:Z80_HEADER.size]
+    header[6:8] = b'\x00\x00'
+    extended = bytearray(2 + 54)
+    struct.pack_into('<HHB', extended, 0, 54, snapshot.pc, hardware)
+    blocks = b''
+    for number, address in ((page, 0x4000), (4, 0x8000), (5, 0xc000)):
+        contents = snapshot.memory[address - 0x4000:address]
+        compressed = encode_z80_block(contents)
+        blocks += struct.pack('<HB', len(compressed), number) + compressed
+    return bytes(header) + bytes(extended) + blocks
+
+
+class TestZ80Block:
+    def test_decode(self) -> None:
+        assert_that(decode_z80_block(b'\x01\xed\xed\x03\x07\x02'), is_(b'\x01\x07\x07\x07\x02'))
+        assert_that(decode_z80_block(b'\xed\x01'), is_(b'\xed\x01'))
+
+    def test_encode(self) -> None:
+        assert_that(encode_z80_block(b'\x00' * 300), is_(b'\xed\xed\xff\x00\xed\xed\x2d\x00'))
+        assert_that(encode_z80_block(b'\xed\xed\x01'), is_(b'\xed\xed\x02\xed\x01'))
+        assert_that(encode_z80_block(b'\x01\x01\x01\x01'), is_(b'\x01\x01\x01\x01'))
+        # Byte after single ED is never start of a run
+        assert_that(encode_z80_block(b'\xed' + b'\x05' * 6), is_(b'\xed\x05\xed\xed\x05\x05'))
+        assert_that(encode_z80_block(b'\xed' + b'\x05' * 5), is_(b'\xed' + b'\x05' * 5))
+
+    def test_round_trip(self) -> None:
+        generator = random.Random(3)
+        for _ in range(200):
+            data = b''.join(bytes([generator.choice((0, 0xed, generator.randrange(256)))]) * generator.choice((1, 1, 2, 5, 7, 300))
+                            for _ in range(generator.randrange(1, 50)))
+            assert_that(decode_z80_block(encode_z80_block(data)), is_(data))
+
+    def test_errors(self) -> None:
+        assert_that(calling(decode_z80_block).with_args(b'\x00\xed\xed\x05'), raises(SnapshotError))
+        assert_that(calling(decode_z80_block).with_args(b'\xed\xed\x05\x00', 4), raises(SnapshotError))
+
+
+class TestSnapshotFormats:
+    def test_sna_round_trip(self, sna: bytes) -> None:
+        snapshot = decode_sna(sna)
+        assert_that(encode_sna(snapshot) == sna, is_(True))
+
+    def test_z80_round_trip(self, sna: bytes) -> None:
+        snapshot = decode_sna(sna)
+        encoded = encode_z80(snapshot)
+        assert_that(len(encoded) < 49152, is_(True))
+        decoded = decode_z80(encoded)
+        assert_that(registers(decoded), is_(registers(snapshot)))
+        assert_that(decoded.memory == snapshot.memory, is_(True))
+
+    def test_z80_v3(self, sna: bytes) -> None:
+        snapshot = decode_sna(sna)
+        decoded = decode_z80(v3_file(snapshot))
+        assert_that(registers(decoded), is_(registers(snapshot)))
+        assert_that(decoded.memory == snapshot.memory, is_(True))
+
+        assert_that(calling(decode_z80).with_args(v3_file(snapshot, hardware=4)), raises(SnapshotError))
+        assert_that(calling(decode_z80).with_args(v3_file(snapshot, page=3)), raises(SnapshotError))
+
+    def test_szx_round_trip(self, sna: bytes) -> None:
+        snapshot = decode_sna(sna)
+        snapshot.tstates = 1234
+        snapshot.memptr = 0x4321
+        decoded = decode_szx(encode_szx(snapshot))
+        assert_that(registers(decoded), is_(registers(snapshot)))
+        assert_that((decoded.tstates, decoded.memptr), is_((1234, 0x4321)))
+        assert_that(decoded.memory == snapshot.memory, is_(True))
+
+        assert_that(calling(decode_szx).with_args(b'ZXST\x01\x04\x02\x00'), raises(SnapshotError))
+        assert_that(calling(decode_sna).with_args(b'\x00' * 100), raises(SnapshotError))
+
+    def test_save_and_load_spectrum(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(frames=1)
+        expected = (bytes(spectrum.memory.mem), spectrum.z80.regPC, spectrum.z80.regSP, spectrum.z80.get_reg_R())
+
+        with tempfile.TemporaryDirectory() as directory:
+            for extension in (".z80", ".szx", ".sna"):
+                filename = os.path.join(directory, "saved" + extension)
+                spectrum.save_snapshot(filename)
+
+                loaded = create_spectrum(load_snapshot=False)
+                loaded.load_snapshot(filename)
+                if extension == ".sna":
+                    # PC is pushed to the stack
+                    assert_that((loaded.z80.regPC, loaded.z80.regSP), is_(expected[1:3]))
+                else:
+                    assert_that((bytes(loaded.memory.mem), loaded.z80.regPC, loaded.z80.regSP, loaded.z80.get_reg_R()), is_(expected))
+
+            assert_that(calling(spectrum.save_snapshot).with_args(os.path.join(directory, "x.tap")), raises(SnapshotError))
@@ -0,0 +1,101 @@
+from typing import Callable
+
+from hamcrest import assert_that, is_, calling, raises, less_than_or_equal_to
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.timeline import Timeline, KEYFRAME_BYTES, benchmark_seek, keyboard_state, record, set_keyboard_state
+
+
+KEY_PRESSED = bytes([0xff, 0xff, 0xff, 0xff, 0xfe, 0xff, 0xff, 0xff, 0])
+NO_KEYS = bytes([0xff] * 8 + [0])
+
+
+def run(spectrum: Spectrum, timeline: Timeline, frames: int, history: list, snapshot: Callable[[Spectrum], tuple]) -> None:
+    for _ in range(frames):
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        spectrum.end_frame()
+        if timeline.frame + 1 == 7:
+            set_keyboard_state(spectrum, KEY_PRESSED)
+        elif timeline.frame + 1 == 9:
+            set_keyboard_state(spectrum, NO_KEYS)
+        timeline.frame_boundary()
+        history.append(snapshot(spectrum))
+
+
+class TestTimeline:
+    def test_seek_replays_deterministically(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = create_spectrum()
+        timeline = Timeline(spectrum, keyframe_interval=4)
+        timeline.start()
+        history = [snapshot(spectrum)]
+        run(spectrum, timeline, 12, history, snapshot)
+
+        assert_that(timeline.keyframe_frames, is_([0, 4, 8, 12]))
+        assert_that(timeline.input_frames.tolist(), is_([0, 7, 9]))
+
+        for frame in (11, 3, 7, 8, 0, 12):
+            timeline.seek(frame)
+            assert_that(snapshot(spectrum) == history[frame], is_(True))
+        assert_that(keyboard_state(spectrum), is_(NO_KEYS))
+
+        timeline.seek(7)
+        assert_that(keyboard_state(spectrum), is_(KEY_PRESSED))
+
+    def test_recording_after_seek_replaces_future(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = create_spectrum()
+        timeline = Timeline(spectrum, keyframe_interval=4)
+        timeline.start()
+        run(spectrum, timeline, 10, [], snapshot)
+
+        timeline.seek(5)
+        run(spectrum, timeline, 1, [], snapshot)
+        assert_that(timeline.last_frame, is_(6))
+        assert_that(timeline.keyframe_frames, is_([0, 4]))
+        assert_that(calling(timeline.seek).with_args(7), raises(ValueError))
+
+    def test_memory_budget_thins_keyframes(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = create_spectrum(rendering=False)
+        timeline = Timeline(spectrum, keyframe_interval=1, memory_budget=3 * KEYFRAME_BYTES)
+        timeline.start()
+        run(spectrum, timeline, 10, [], snapshot)
+
+        assert_that(timeline.memory_usage(), less_than_or_equal_to(3 * KEYFRAME_BYTES + 100))
+        assert_that(timeline.keyframe_interval, is_(4))
+        assert_that(timeline.keyframe_frames, is_([0, 4, 8]))
+
+    def test_bisect_finds_first_instruction(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = create_spectrum(rendering=False)
+        timeline = Timeline(spectrum, keyframe_interval=4)
+        timeline.start()
+        record(timeline, 12)
+
+        def predicate(s: Spectrum) -> bool:
+            return s.memory.mem[0xf0c4] != 0
+
+        result = timeline.bisect(predicate)
+        assert_that(result.frame, is_(10))
+        assert_that(predicate(spectrum), is_(True))
+        after = snapshot(spectrum)
+
+        # Step through the whole frame to find the same instruction
+        timeline.seek(10)
+        instructions = 0
+        while True:
+            pc = spectrum.z80.regPC
+            tstates = spectrum.bus_access.tstates
+            spectrum.execute_one_instruction()
+            instructions += 1
+            if predicate(spectrum):
+                break
+        assert_that((result.pc, result.tstates, result.instructions), is_((pc, tstates, instructions)))
+        assert_that(snapshot(spectrum) == after, is_(True))
+
+        assert_that(timeline.bisect(predicate, 0, 9), is_(None))
+        assert_that(timeline.bisect(predicate, 11).instructions, is_(0))
+
+    def test_benchmark(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum()
+        results = benchmark_seek(spectrum, frames=6, intervals=(2, 6), seeks=3)
+        assert_that([result["keyframe_interval"] for result in results], is_([2, 6]))
+        assert_that(results[0]["memory_bytes"] > results[1]["memory_bytes"], is_(True))
@@ -0,0 +1,57 @@
+import os
+import tempfile
+from typing import Callable
+
+import numpy as np
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from utils.trace_compare import compare, file_chunks, live_chunks, npy_chunks
+from utils.trace_recorder import TraceRecorder
+
+
+def recorded(spectrum: Spectrum, frames: int) -> np.ndarray:
+    recorder = TraceRecorder(spectrum)
+    recorder.run_frames(frames)
+    return recorder.records()
+
+
+class TestTraceCompare:
+    def test_live_trace_against_recorded_one(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        reference = recorded(create_spectrum(frames=1), 3)
+        assert_that(compare(live_chunks(create_spectrum(frames=1)), npy_chunks(reference, 1000)) is None, is_(True))
+
+        reference["hl"][2500] ^= 0x10
+        reference["tstates"][2500] += 1
+        divergence = compare(live_chunks(create_spectrum(frames=1), 3), npy_chunks(reference, 2498), context=4)
+        assert_that((divergence.index, divergence.fields), is_((2500, ["hl", "tstates"])))
+        assert_that(int(divergence.reference["hl"]), is_(int(divergence.record["hl"]) ^ 0x10))
+        # Context crosses chunks
+        assert_that((len(divergence.before[0]), len(divergence.after[1])), is_((4, 5)))
+        assert_that(np.array_equal(divergence.before[1], reference[2496:2500]), is_(True))
+        lines = str(divergence).splitlines()
+        assert_that((len(lines), lines[9].startswith(">       2500 ")), is_((19, True)))
+
+    def test_text_reference_is_compared_by_its_fields(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        reference = recorded(create_spectrum(frames=1), 1)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "trace.txt")
+            with open(filename, "w") as f:
+                f.write("; trace\n")
+                for i, record in enumerate(reference[:300]):
+                    pc, af, sp = int(record["pc"]), int(record["af"]), int(record["sp"])
+                    if i % 2:
+                        f.write(f"PC={pc:04X} AF={af:04X} SP={sp:04X} T={int(record['tstates'])}\n")
+                    else:
+                        f.write(f"t: {int(record['tstates']):06} PC: 0x{pc:04x} SP: 0x{sp:04x} AF: 0x{af:04x}\n")
+
+            chunks, fields = file_chunks(filename, 64)
+            assert_that(fields, is_(("pc", "af", "sp", "tstates")))
+            assert_that(compare(live_chunks(create_spectrum(frames=1)), chunks, fields) is None, is_(True))
+
+            with open(filename, "a") as f:
+                f.write("PC=0000 AF=0000 SP=0000 T=0\n")
+            chunks, fields = file_chunks(filename, 64)
+            divergence = compare(live_chunks(create_spectrum(frames=1)), chunks, fields)
+            assert_that(divergence.index, is_(300))
+            assert_that(str(divergence).splitlines()[-1].endswith("= PC:0000 AF:0000 SP:0000 TSTATES:0000"), is_(True))
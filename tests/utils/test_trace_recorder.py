@@ -0,0 +1,67 @@
+import os
+import tempfile
+from typing import Callable
+
+import numpy as np
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.trace_recorder import TraceRecorder, TRACE_DTYPE, decode_record, load_trace
+
+# DI / LD IX,0x1234 / LD BC,0x5678 / loop: INC A / JP loop
+CODE = bytes.fromhex("f3 dd 21 34 12 01 78 56 3c c3 08 80")
+
+
+def load_code(spectrum: Spectrum) -> None:
+    spectrum.memory.mem[0x8000:0x8000 + len(CODE)] = CODE
+    spectrum.z80.regPC = 0x8000
+    spectrum.z80.regA = 0
+    spectrum.bus_access.tstates = 100
+
+
+class TestTraceRecorder:
+    def test_records_registers_before_each_instruction(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(load_snapshot=False, rendering=False)
+        load_code(spectrum)
+        recorder = TraceRecorder(spectrum)
+        recorder.execute(150)
+
+        records = recorder.records()
+        assert_that(records.dtype == TRACE_DTYPE, is_(True))
+        # Prefixed LD IX,nn is one record
+        assert_that(records["pc"][:6].tolist(), is_([0x8000, 0x8001, 0x8005, 0x8008, 0x8009, 0x8008]))
+        assert_that(records["tstates"][:6].tolist(), is_([100, 104, 118, 128, 132, 142]))
+        assert_that(records["opcode"][1].tolist(), is_([0xdd, 0x21, 0x34, 0x12]))
+        assert_that((int(records["ix"][1]), int(records["ix"][2]), int(records["bc"][3])), is_((0xffff, 0x1234, 0x5678)))
+        assert_that((records["af"][3:6] >> 8).tolist(), is_([0, 1, 1]))
+        assert_that(decode_record(records[2]).split(" IX:")[0], is_(
+            f"000118 8005 01 78 56 3c ld bc, $5678         AF:{int(records['af'][2]):04x} BC:ffff DE:ffff HL:ffff SP:ffff"
+        ))
+
+    def test_ring_buffer_keeps_last_instructions(self, create_spectrum: Callable[..., Spectrum], snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = create_spectrum(frames=1)
+        other = create_spectrum(frames=1)
+        everything = TraceRecorder(spectrum)
+        everything.run_frames(2)
+        last = TraceRecorder(other, size=1000)
+        last.run_frames(2)
+
+        assert_that(snapshot(spectrum) == snapshot(other), is_(True))
+        assert_that((last.count, len(last)), is_((everything.count, 1000)))
+        assert_that(np.array_equal(last.records(), everything.records()[-1000:]), is_(True))
+
+        other.execute(TSTATES_PER_INTERRUPT)
+        last.clear()
+        assert_that(len(last.records()), is_(0))
+
+    def test_npy_export(self, create_spectrum: Callable[..., Spectrum]) -> None:
+        spectrum = create_spectrum(frames=1)
+        recorder = TraceRecorder(spectrum, size=500)
+        recorder.run_frames(1)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "trace.npy")
+            recorder.save_npy(filename)
+            trace = load_trace(filename)
+            assert_that(np.array_equal(trace, recorder.records()), is_(True))
+            del trace
@@ -0,0 +1,100 @@
+from typing import Callable
+
+import pytest
+from hamcrest import assert_that, is_
+
+from spectrum.spectrum import Spectrum
+from utils.write_journal import WriteJournal
+
+
+@pytest.fixture
+def spectrum(create_spectrum: Callable[..., Spectrum]) -> Spectrum:
+    spectrum = create_spectrum(frames=1)
+    spectrum.journaling = True
+    return spectrum
+
+
+def step(spectrum: Spectrum, journal: WriteJournal, history: list, steps: int, snapshot: Callable[[Spectrum], tuple]) -> None:
+    for _ in range(steps):
+        history.append(snapshot(spectrum))
+        if journal.step():
+            spectrum.end_frame()
+
+
+class TestWriteJournal:
+    def test_step_back_undoes_writes_and_state(self, spectrum: Spectrum, snapshot: Callable[[Spectrum], tuple]) -> None:
+        journal = WriteJournal(spectrum)
+        history = []
+        frames = spectrum.bus_access.frames
+        # Long enough to cross the end of the frame
+        step(spectrum, journal, history, 20000, snapshot)
+        assert_that(spectrum.bus_access.frames > frames, is_(True))
+
+        assert_that(journal.step_back(), is_(1))
+        assert_that(snapshot(spectrum) == history[-1], is_(True))
+        assert_that(journal.step_back(12345), is_(12345))
+        assert_that(snapshot(spectrum) == history[-12346], is_(True))
+        assert_that(journal.step_back(100000), is_(20000 - 12346))
+        assert_that(snapshot(spectrum) == history[0], is_(True))
+        assert_that(len(spectrum.bus_access.journal), is_(0))
+
+    def test_stepping_after_step_back(self, spectrum: Spectrum, snapshot: Callable[[Spectrum], tuple]) -> None:
+        journal = WriteJournal(spectrum)
+        history = []
+        step(spectrum, journal, history, 500, snapshot)
+        journal.step_back(200)
+        del history[300:]
+        step(spectrum, journal, history, 50, snapshot)
+
+        journal.step_back(100)
+        assert_that(snapshot(spectrum) == history[250], is_(True))
+
+    def test_oldest_instructions_are_dropped(self, spectrum: Spectrum, snapshot: Callable[[Spectrum], tuple]) -> None:
+        journal = WriteJournal(spectrum, max_instructions=100)
+        history = []
+        step(spectrum, journal, history, 330, snapshot)
+
+        assert_that(len(journal) <= 100, is_(True))
+        count = journal.step_back(1000)
+        assert_that(snapshot(spectrum) == history[330 - count], is_(True))
+
+    def test_profile_keeps_journaling_bus(self, spectrum: Spectrum) -> None:
+        spectrum.profile(spectrum.bus_access.tstates + 100)
+        assert_that(spectrum.journaling, is_(True))
+        spectrum.journaling = False
+        assert_that(spectrum.journaling, is_(False))
+
+    def test_step_back_restores_screen_and_sound(self, snapshot: Callable[[Spectrum], tuple]) -> None:
+        spectrum = Spectrum(ay=True)
+        spectrum.init()
+        spectrum.journaling = True
+        code = bytes([
+            0x3c,              # INC A
+            0x77,              # LD (HL),A
+            0x23,              # INC HL
+            0xd3, 0xfe,        # OUT (0xFE),A
+            0x01, 0xfd, 0xff,  # LD BC,0xFFFD
+            0xed, 0x79,        # OUT (C),A
+            0x06, 0xbf,        # LD B,0xBF
+            0xed, 0x79,        # OUT (C),A
+            0x18, 0xf0         # JR 0x8000
+        ])
+        spectrum.memory.mem[0x8000:0x8000 + len(code)] = code
+        spectrum.z80.regPC = 0x8000
+        spectrum.z80.set_reg_HL(0x4000)
+        spectrum.z80.ffIFF1 = spectrum.z80.ffIFF2 = False
+
+        def full_snapshot() -> tuple:
+            return snapshot(spectrum) + (bytes(spectrum.video.buffer_m), spectrum.sound_state(), tuple(spectrum.ay.registers))
+
+        journal = WriteJournal(spectrum)
+        history = {}
+        for i in range(30000):
+            if i in (0, 5000, 12345, 25000, 29999):
+                history[i] = full_snapshot()
+            if journal.step():
+                spectrum.end_frame()
+
+        for i in (29999, 25000, 12345, 5000, 0):
+            journal.step_back(len(journal) - i)
+            assert_that(full_snapshot() == history[i], is_(True))
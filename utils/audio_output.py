@@ -0,0 +1,96 @@
+import numpy as np
+import pygame
+
+from spectrum.beeper import DEFAULT_SAMPLE_RATE
+
+
+# Fixed size ring buffer of int16 samples. Writes that don't fit are dropped (overrun)
+# and reads that can't be satisfied are padded with last sample (underrun).
+class AudioRingBuffer:
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.read_index = 0
+        self.write_index = 0
+        self.available = 0
+
+        self.overruns = 0
+        self.overrun_samples = 0
+        self.underruns = 0
+        self.underrun_samples = 0
+
+    def write(self, samples: np.ndarray) -> None:
+        count = len(samples)
+        free = self.capacity - self.available
+        if count > free:
+            self.overruns += 1
+            self.overrun_samples += count - free
+            samples = samples[:free]
+            count = free
+
+        first = min(count, self.capacity - self.write_index)
+        self.buffer[self.write_index:self.write_index + first] = samples[:first]
+        self.buffer[:count - first] = samples[first:]
+        self.write_index = (self.write_index + count) % self.capacity
+        self.available += count
+
+    def read(self, count: int) -> np.ndarray:
+        result = np.empty(count, dtype=np.int16)
+        to_read = min(count, self.available)
+
+        first = min(to_read, self.capacity - self.read_index)
+        result[:first] = self.buffer[self.read_index:self.read_index + first]
+        result[first:to_read] = self.buffer[:to_read - first]
+        self.read_index = (self.read_index + to_read) % self.capacity
+        self.available -= to_read
+
+        if to_read < count:
+            self.underruns += 1
+            self.underrun_samples += count - to_read
+            result[to_read:] = result[to_read - 1] if to_read > 0 else 0
+        return result
+
+
+# Feeds PCM blocks produced by emulation into pygame.mixer. Samples are collected in ring buffer
+# and handed to mixer channel in chunks of fixed size whenever channel's queue is free.
+class AudioOutput:
+    def __init__(self, sample_rate: int = DEFAULT_SAMPLE_RATE, chunk_size: int = 1024, buffered_chunks: int = 8) -> None:
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.ring = AudioRingBuffer(chunk_size * buffered_chunks)
+        self.channel = None
+        self.channels = 1
+        self.chunks_played = 0
+
+    def init(self) -> None:
+        pygame.mixer.init(frequency=self.sample_rate, size=-16, channels=1, buffer=self.chunk_size)
+        frequency, _, self.channels = pygame.mixer.get_init()
+        if frequency != self.sample_rate:
+            print(f"Warning: mixer initialised with {frequency}Hz instead of {self.sample_rate}Hz")
+        self.channel = pygame.mixer.Channel(0)
+
+    def write(self, block: np.ndarray) -> None:
+        self.ring.write((np.clip(block, -1.0, 1.0) * 32767).astype(np.int16))
+
+    # Should be called at least once per frame
+    def pump(self) -> None:
+        if self.channel is None:
+            return
+
+        # Keep one chunk playing and one queued; start only when there is something to play
+        while self.channel.get_queue() is None and (self.channel.get_busy() or self.ring.available >= self.chunk_size):
+            samples = self.ring.read(self.chunk_size)
+            if self.channels > 1:
+                samples = np.repeat(samples, self.channels)
+            sound = pygame.mixer.Sound(buffer=samples.tobytes())
+            if self.channel.get_busy():
+                self.channel.queue(sound)
+            else:
+                self.channel.play(sound)
+            self.chunks_played += 1
+
+    def close(self) -> None:
+        if self.channel is not None:
+            self.channel.stop()
+            pygame.mixer.quit()
+            self.channel = None
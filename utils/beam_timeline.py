@@ -0,0 +1,121 @@
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import NUMBER_OF_LINES, SCREEN_HEIGHT, TSTATES_VERTICAL_RETRACE_LINES, raster_position
+from z80.instructions.profile import POKE_B, POKE_W, DELAY_BITS, DELAY_MASK
+
+# When write to screen memory landed relative to ULA fetching the byte: before it (shows in
+# this frame), after it (shows in the next frame) or, for attributes which are fetched on eight
+# lines, between the first and the last fetch (character cell is split)
+AHEAD = 0
+BEHIND = 1
+TORN = 2
+
+SCREEN_START = 0x4000
+ATTRIBUTES_START = 0x5800
+SCREEN_END = 0x5b00
+WORDS_PER_LINE = 16
+
+
+# Beam position of every instruction of the last profiled frame (spectrum.profile()) and
+# timing of its writes to screen memory against ULA fetches of written bytes, computed with
+# NumPy from ProfiledInstructions and AccessRecords columns. Lines and T-states in line
+# are those of video.raster_position(); histogram rows are lines counted from the interrupt.
+class BeamTimeline:
+    def __init__(self, spectrum: Spectrum) -> None:
+        instructions = spectrum.instructions
+        records = instructions.records
+        count = instructions.count
+
+        self.addresses = np.frombuffer(instructions.addresses, dtype=np.int32, count=count)
+        self.start = np.frombuffer(instructions.tstates, dtype=np.int32, count=count)
+        self.end = np.empty(count, dtype=np.int32)
+        if count > 0:
+            # Interrupt acceptance is part of the instruction it follows
+            self.end[:-1] = self.start[1:]
+            self.end[-1] = self.start[-1] + records.total_tstates(*instructions.record_range(count - 1))
+        self.start_line, self.start_x = raster_position(self.start)
+        self.end_line, self.end_x = raster_position(self.end)
+
+        kinds = np.frombuffer(records.kinds, dtype=np.int32, count=records.count)
+        addresses = np.frombuffer(records.addresses, dtype=np.int32, count=records.count)
+        at_tstates = np.frombuffer(records.at_tstates, dtype=np.int32, count=records.count)
+        delays = np.frombuffer(records.delays, dtype=np.int32, count=records.count)
+
+        # Memory is written at the end of write cycle. Word is recorded at its end, after second byte.
+        byte_writes = np.flatnonzero(kinds == POKE_B)
+        word_writes = np.flatnonzero(kinds == POKE_W)
+        write_records = np.concatenate((byte_writes, word_writes, word_writes))
+        write_addresses = np.concatenate((
+            addresses[byte_writes], addresses[word_writes], (addresses[word_writes] + 1) & 0xffff
+        ))
+        write_tstates = np.concatenate((
+            at_tstates[byte_writes] + (delays[byte_writes] & DELAY_MASK) + 3,
+            at_tstates[word_writes] - ((delays[word_writes] >> DELAY_BITS) & DELAY_MASK) - 3,
+            at_tstates[word_writes]
+        ))
+        screen = (write_addresses >= SCREEN_START) & (write_addresses < SCREEN_END)
+        order = np.argsort(write_records[screen], kind="stable")
+        record_starts = np.frombuffer(instructions.record_starts, dtype=np.int32, count=count)
+
+        self.write_addresses = write_addresses[screen][order]
+        self.write_tstates = write_tstates[screen][order]
+        self.write_instructions = np.searchsorted(record_starts, write_records[screen][order], side="right") - 1
+        self.first_fetch, self.last_fetch = self._fetch_tstates(self.write_addresses, spectrum.bus_access.screen_byte_tstate)
+        self.status = np.where(
+            self.write_tstates < self.first_fetch, AHEAD,
+            np.where(self.write_tstates >= self.last_fetch, BEHIND, TORN)
+        )
+        # T-states to spare before ULA fetches the byte, negative when write is late
+        self.margin = self.first_fetch - self.write_tstates
+
+    @staticmethod
+    def _fetch_tstates(addresses: np.ndarray, screen_byte_tstate: list[int]) -> tuple[np.ndarray, np.ndarray]:
+        fetches = np.array(screen_byte_tstate[:SCREEN_HEIGHT * WORDS_PER_LINE], dtype=np.int32)
+        column = (addresses & 0x1f) >> 1
+        bitmap = addresses < ATTRIBUTES_START
+        y = ((addresses & 0x1800) >> 5) | ((addresses & 0x0700) >> 8) | ((addresses & 0x00e0) >> 2)
+        row = ((addresses - ATTRIBUTES_START) >> 5) & 0x1f
+        first_line = np.where(bitmap, y, row * 8)
+        last_line = np.where(bitmap, y, row * 8 + 7)
+        return fetches[first_line * WORDS_PER_LINE + column], fetches[last_line * WORDS_PER_LINE + column]
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    # Writes to screen memory with given status per instruction
+    def writes_per_instruction(self, status: int) -> np.ndarray:
+        return np.bincount(self.write_instructions[self.status == status], minlength=len(self))
+
+    # Per line from interrupt: instructions started, screen writes ahead of, behind and torn by ULA
+    def scanline_histogram(self) -> np.ndarray:
+        histogram = np.zeros((NUMBER_OF_LINES, 4), dtype=np.int32)
+        lines = np.clip(self.start_line + TSTATES_VERTICAL_RETRACE_LINES, 0, NUMBER_OF_LINES - 1)
+        histogram[:, 0] = np.bincount(lines, minlength=NUMBER_OF_LINES)
+        write_lines = np.clip(raster_position(self.write_tstates)[0] + TSTATES_VERTICAL_RETRACE_LINES, 0, NUMBER_OF_LINES - 1)
+        for status in (AHEAD, BEHIND, TORN):
+            histogram[:, 1 + status] = np.bincount(write_lines[self.status == status], minlength=NUMBER_OF_LINES)
+        return histogram
+
+    def save_csv(self, filename: str) -> None:
+        table = np.column_stack((
+            np.arange(len(self)), self.addresses, self.start, self.end,
+            self.start_line, self.start_x, self.end_line, self.end_x,
+            self.writes_per_instruction(AHEAD), self.writes_per_instruction(BEHIND), self.writes_per_instruction(TORN)
+        ))
+        np.savetxt(filename, table, fmt="%d", delimiter=",", comments="",
+                   header="index,address,start,end,start_line,start_x,end_line,end_x,writes_ahead,writes_behind,writes_torn")
+
+    def save_writes_csv(self, filename: str) -> None:
+        line, x = raster_position(self.write_tstates)
+        table = np.column_stack((
+            self.write_instructions, self.addresses[self.write_instructions], self.write_addresses, self.write_tstates,
+            line, x, self.first_fetch, self.last_fetch, self.margin, self.status
+        ))
+        np.savetxt(filename, table, fmt="%d", delimiter=",", comments="",
+                   header="instruction,pc,address,tstates,line,x,first_fetch,last_fetch,margin,status")
+
+    def save_histogram_csv(self, filename: str) -> None:
+        table = np.column_stack((np.arange(NUMBER_OF_LINES), self.scanline_histogram()))
+        np.savetxt(filename, table, fmt="%d", delimiter=",", comments="",
+                   header="line,instructions,writes_ahead,writes_behind,writes_torn")
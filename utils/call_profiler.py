@@ -0,0 +1,207 @@
+import json
+from typing import Callable, Optional
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from z80.z80_cpu import IM2, CARRY_MASK, PARITY_MASK, SIGN_MASK, ZERO_MASK
+
+ROOT = "root"
+
+# Flag tested by each of condition codes NZ, Z, NC, C, PO, PE, P, M and value it has to have
+CONDITIONS = (
+    (ZERO_MASK, 0), (ZERO_MASK, ZERO_MASK), (CARRY_MASK, 0), (CARRY_MASK, CARRY_MASK),
+    (PARITY_MASK, 0), (PARITY_MASK, PARITY_MASK), (SIGN_MASK, 0), (SIGN_MASK, SIGN_MASK)
+)
+
+_CALL = 0xcd
+_CALL_CC = (0xc4, 0xcc, 0xd4, 0xdc, 0xe4, 0xec, 0xf4, 0xfc)
+_RST = (0xc7, 0xcf, 0xd7, 0xdf, 0xe7, 0xef, 0xf7, 0xff)
+RET = 0xc9
+RET_CC = (0xc0, 0xc8, 0xd0, 0xd8, 0xe0, 0xe8, 0xf0, 0xf8)
+# Second bytes of ED prefixed RETN (and its undocumented copies) and RETI
+RETN_RETI = frozenset((0x45, 0x4d, 0x55, 0x5d, 0x65, 0x6d, 0x75, 0x7d))
+
+
+class CallFrame:
+    def __init__(self, address: int, return_sp: int, start: int, interrupt: bool) -> None:
+        self.address = address
+        self.return_sp = return_sp
+        self.start = start
+        self.interrupt = interrupt
+
+
+# Call path profile built from shadow call stack. Entering subroutine is seen through opcode
+# hooks of CALL/RST (before instruction, condition evaluated from flags) and interrupt listener
+# of CPU; leaving through hooks of RET/RETI/RETN. Frames are matched by SP, not by order:
+# each frame keeps SP it will have after returning, so RET pops every frame at or below SP
+# it leaves - routines which dropped their return address (POP and JP, stack switch) are
+# unwound with first RET above them and PUSH/RET used as jump doesn't pop anything.
+# T-states between two events are exclusive time of current path (tuple of entry addresses);
+# inclusive time of a path is the sum of exclusive times of paths it prefixes.
+# Time base is absolute T-state (frames * T-states per frame + T-state in frame).
+class CallProfiler:
+    def __init__(self, spectrum: Spectrum, names: Optional[dict[int, str]] = None, max_events: int = 1_000_000) -> None:
+        self.spectrum = spectrum
+        self.z80 = spectrum.z80
+        self.mem = spectrum.memory.mem
+        self.names = names if names is not None else {}
+        self.max_events = max_events
+        self.exclusive: dict[tuple[int, ...], int] = {}
+        self.calls: dict[tuple[int, ...], int] = {}
+        # Completed calls (address, start, end, depth, interrupt) for trace export
+        self.events: list[tuple[int, int, int, int, bool]] = []
+        self.stack: list[CallFrame] = []
+        self._path: tuple[int, ...] = ()
+        self._last = -1
+
+    def clear(self) -> None:
+        self.exclusive.clear()
+        self.calls.clear()
+        del self.events[:]
+        self.stack.clear()
+        self._path = ()
+        self._last = -1
+
+    def execute(self, tstate_limit: int) -> None:
+        traps = self.spectrum.traps
+        hooks = {_CALL: self._call, RET: self._ret, 0xed: self._ed}
+        for opcode in _CALL_CC:
+            hooks[opcode] = self._conditional(opcode, self._call)
+        for opcode in RET_CC:
+            hooks[opcode] = self._conditional(opcode, self._ret)
+        for opcode in _RST:
+            hooks[opcode] = self._rst(opcode & 0x38)
+
+        if self._last < 0:
+            self._last = self._now()
+        for opcode, hook in hooks.items():
+            traps.hook_opcode(opcode, hook)
+        traps.listen_interrupts(self._interrupt)
+        try:
+            self.spectrum.execute(tstate_limit)
+        finally:
+            traps.unlisten_interrupts(self._interrupt)
+            for opcode, hook in hooks.items():
+                traps.unhook_opcode(opcode, hook)
+            self._account(self._now())
+
+    def run_frames(self, frames: int) -> None:
+        for _ in range(frames):
+            self.execute(TSTATES_PER_INTERRUPT)
+            self.spectrum.end_frame()
+
+    def name(self, address: int) -> str:
+        return self.names.get(address, f"0x{address:04x}")
+
+    def inclusive(self) -> dict[tuple[int, ...], int]:
+        result: dict[tuple[int, ...], int] = {}
+        for path, tstates in self.exclusive.items():
+            for depth in range(len(path) + 1):
+                prefix = path[:depth]
+                result[prefix] = result.get(prefix, 0) + tstates
+        return result
+
+    def total_tstates(self) -> int:
+        return sum(self.exclusive.values())
+
+    # Call paths which took most T-states including their callees
+    def report(self, n: int = 20) -> str:
+        inclusive = self.inclusive()
+        lines = [f"{self.total_tstates()} T-states"]
+        for path in sorted(inclusive, key=inclusive.__getitem__, reverse=True)[:n]:
+            lines.append(f"{inclusive[path]:>10} {self.exclusive.get(path, 0):>10} {self.calls.get(path, 0):>7}x {self._folded_path(path)}")
+        return "\n".join(lines)
+
+    # Input of flamegraph.pl, speedscope, inferno...: call path and its exclusive T-states per line
+    def save_folded(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            for path, tstates in sorted(self.exclusive.items()):
+                if tstates:
+                    f.write(f"{self._folded_path(path)} {tstates}\n")
+
+    # Trace event format of chrome://tracing and Perfetto; one time unit is one T-state.
+    # Calls still in progress end at the current T-state.
+    def save_chrome_trace(self, filename: str) -> None:
+        now = self._now()
+        open_calls = [(frame.address, frame.start, now, depth, frame.interrupt) for depth, frame in enumerate(self.stack)]
+        trace_events = [
+            {
+                "name": self.name(address), "cat": "interrupt" if interrupt else "call", "ph": "X",
+                "ts": start, "dur": end - start, "pid": 1, "tid": 1, "args": {"depth": depth}
+            }
+            for address, start, end, depth, interrupt in self.events + open_calls
+        ]
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": trace_events, "otherData": {"timebase": "T-states"}}, f)
+
+    def _folded_path(self, path: tuple[int, ...]) -> str:
+        return ";".join([ROOT] + [self.name(address) for address in path])
+
+    def _now(self) -> int:
+        bus_access = self.z80.bus_access
+        return bus_access.frames * TSTATES_PER_INTERRUPT + bus_access.tstates
+
+    def _account(self, now: int) -> None:
+        self.exclusive[self._path] = self.exclusive.get(self._path, 0) + now - self._last
+        self._last = now
+
+    def _enter(self, address: int, sp: int, interrupt: bool) -> None:
+        now = self._now()
+        self._account(now)
+        # Stack is full downwards from return SP of frame, so frames at or below SP are gone
+        self._unwind(sp or 0x10000, now)
+        self.stack.append(CallFrame(address, sp or 0x10000, now, interrupt))
+        self._path += (address,)
+        self.calls[self._path] = self.calls.get(self._path, 0) + 1
+
+    def _leave(self, sp: int) -> None:
+        now = self._now()
+        self._account(now)
+        self._unwind(sp + 2, now)
+
+    def _unwind(self, sp: int, now: int) -> None:
+        stack = self.stack
+        while stack and stack[-1].return_sp <= sp:
+            frame = stack.pop()
+            if len(self.events) < self.max_events:
+                self.events.append((frame.address, frame.start, now, len(stack), frame.interrupt))
+            self._path = self._path[:-1]
+
+    def _call(self) -> None:
+        z80 = self.z80
+        mem = self.mem
+        address = mem[z80.regPC] | (mem[(z80.regPC + 1) & 0xffff] << 8)
+        self._enter(address, z80.regSP, False)
+
+    def _rst(self, address: int) -> Callable[[], None]:
+        def rst() -> None:
+            self._enter(address, self.z80.regSP, False)
+        return rst
+
+    def _ret(self) -> None:
+        self._leave(self.z80.regSP)
+
+    def _ed(self) -> None:
+        z80 = self.z80
+        if self.mem[z80.regPC] in RETN_RETI:
+            self._leave(z80.regSP)
+
+    def _conditional(self, opcode: int, hook: Callable[[], None]) -> Callable[[], None]:
+        mask, value = CONDITIONS[(opcode >> 3) & 0x07]
+        z80 = self.z80
+
+        def conditional() -> None:
+            if z80.get_flags() & mask == value:
+                hook()
+        return conditional
+
+    def _interrupt(self, nmi: bool) -> None:
+        z80 = self.z80
+        if nmi:
+            address = 0x0066
+        elif z80.modeINT == IM2:
+            vector = (z80.regI << 8) | 0xff
+            address = self.mem[vector] | (self.mem[(vector + 1) & 0xffff] << 8)
+        else:
+            address = 0x0038
+        self._enter(address, z80.regSP, True)
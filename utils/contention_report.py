@@ -0,0 +1,167 @@
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from utils.beam_timeline import SCREEN_START, SCREEN_END
+from utils.pc_accounting import disassemble
+from z80.instructions.profile import FETCH_OPCODE, PEEK_W, POKE_W, ADDR_ON_BUS, IN_PORT, OUT_PORT, DELAY_BITS, DELAY_MASK
+
+FETCH = 0
+READ = 1
+WRITE = 2
+IO = 3
+ADDRESS_ON_BUS = 4
+ACCESS_KINDS = ("fetch", "read", "write", "io", "address on bus")
+
+# Access kind of each AccessRecords kind, -1 for records without bus cycles
+_ACCESS_KIND = np.array([FETCH, READ, WRITE, READ, WRITE, ADDRESS_ON_BUS, IO, IO, -1], dtype=np.int8)
+
+# Longest instruction; reads and address on bus cycles within this many bytes from PC are of code
+_CODE_BYTES = 4
+
+
+# Contention delays of the last profiled frame (spectrum.profile()) summed per PC, per 256 byte
+# page of accessed memory and per kind of access, all from AccessRecords with NumPy.
+# relocated() estimates timing if code (fetches and operands) and/or data accesses (but those
+# of screen) were in uncontended memory by replaying recorded bus cycles against the contention
+# table - exact while the program would take the same path, which it may not if it polls the
+# beam or time.
+class ContentionReport:
+    def __init__(self, spectrum: Spectrum) -> None:
+        self.mem = spectrum.memory.mem
+        self.delay_tstates = spectrum.bus_access.delay_tstates
+        instructions = spectrum.instructions
+        records = instructions.records
+        count = records.count
+        self.instruction_count = instructions.count
+
+        self.kinds = np.frombuffer(records.kinds, dtype=np.int32, count=count)
+        self.addresses = np.frombuffer(records.addresses, dtype=np.int32, count=count)
+        self.at_tstates = np.frombuffer(records.at_tstates, dtype=np.int32, count=count)
+        self.base_tstates = np.frombuffer(records.tstates, dtype=np.int32, count=count)
+        packed = np.frombuffer(records.delays, dtype=np.int32, count=count)
+        # Address on bus may take up to five cycles, all of them delayed
+        self.delays = sum((packed >> (i * DELAY_BITS)) & DELAY_MASK for i in range(32 // DELAY_BITS))
+
+        self.record_starts = np.frombuffer(instructions.record_starts, dtype=np.int32, count=instructions.count)
+        instruction_addresses = np.frombuffer(instructions.addresses, dtype=np.int32, count=instructions.count)
+        self.record_instructions = np.searchsorted(self.record_starts, np.arange(count), side="right") - 1
+        self.pcs = instruction_addresses[self.record_instructions]
+        self.access_kinds = _ACCESS_KIND[self.kinds]
+
+        # Fetches and operands (reads or internal cycles on bytes following PC) move with code
+        offsets = (self.addresses - self.pcs) & 0xffff
+        self.code = (self.kinds == FETCH_OPCODE) | (
+            ((self.access_kinds == READ) | (self.access_kinds == ADDRESS_ON_BUS)) & (offsets < _CODE_BYTES)
+        )
+        # Screen memory can't be moved
+        memory = (self.access_kinds != IO) & (self.access_kinds >= 0)
+        self.data = memory & ~self.code & ((self.addresses < SCREEN_START) | (self.addresses >= SCREEN_END))
+
+        # Word, address on bus and port records are kept with T-state after their last cycle
+        cycles = np.where((self.kinds == PEEK_W) | (self.kinds == POKE_W), 2 * self.base_tstates, self.base_tstates)
+        starts_at_end = (self.kinds == PEEK_W) | (self.kinds == POKE_W) | (self.kinds == ADDR_ON_BUS) | (self.access_kinds == IO)
+        self.starts = np.where(starts_at_end, self.at_tstates - cycles - self.delays, self.at_tstates)
+        self.ends = self.starts + cycles + self.delays
+
+    def total_delay(self) -> int:
+        return int(self.delays.sum())
+
+    # T-states from the first to the end of the last recorded access
+    def total_tstates(self) -> int:
+        return int(self.ends[-1] - self.starts[0]) if len(self.kinds) else 0
+
+    def per_pc(self) -> np.ndarray:
+        return np.bincount(self.pcs, weights=self.delays, minlength=65536).astype(np.int64)
+
+    # Delay per page of memory accessed (port accesses are not included)
+    def per_page(self) -> np.ndarray:
+        memory = (self.access_kinds >= 0) & (self.access_kinds != IO)
+        return np.bincount(self.addresses[memory] >> 8, weights=self.delays[memory], minlength=256).astype(np.int64)
+
+    def per_kind(self) -> dict[str, int]:
+        valid = self.access_kinds >= 0
+        totals = np.bincount(self.access_kinds[valid], weights=self.delays[valid], minlength=len(ACCESS_KINDS))
+        return {name: int(total) for name, total in zip(ACCESS_KINDS, totals)}
+
+    # Start T-state of every instruction (and end of the last one) if code and/or data accesses
+    # were not contended; everything else - interrupt acceptance, port accesses - stays as recorded
+    def relocated(self, code: bool = True, data: bool = True) -> np.ndarray:
+        delay_tstates = self.delay_tstates
+        table_length = len(delay_tstates)
+        moved = (self.code if code else np.zeros(len(self.kinds), dtype=bool)) | (self.data if data else False)
+        kinds = self.kinds.tolist()
+        addresses = self.addresses.tolist()
+        base_tstates = self.base_tstates.tolist()
+        starts = self.starts.tolist()
+        ends = self.ends.tolist()
+        moved = moved.tolist()
+
+        def delay(t: int) -> int:
+            return delay_tstates[t] if 0 <= t < table_length else 0
+
+        new_starts = []
+        shift = 0
+        for i, kind in enumerate(kinds):
+            t = starts[i] + shift
+            new_starts.append(t)
+            address = addresses[i]
+            if kind == IN_PORT or kind == OUT_PORT:
+                contended = 16384 <= address < 32768
+                t += (delay(t) if contended else 0) + 1
+                if address & 0x0001 != 0:
+                    if contended:
+                        for _ in range(3):
+                            t += delay(t) + 1
+                    else:
+                        t += 3
+                else:
+                    t += delay(t) + 3
+            else:
+                contended = not moved[i]
+                if kind == PEEK_W or kind == POKE_W:
+                    t += (delay(t) if contended and 16384 <= address < 32768 else 0) + 3
+                    address = (address + 1) & 0xffff
+                    t += (delay(t) if contended and 16384 <= address < 32768 else 0) + 3
+                elif kind == ADDR_ON_BUS:
+                    if contended and 16384 <= address < 32768:
+                        for _ in range(base_tstates[i]):
+                            t += delay(t) + 1
+                    else:
+                        t += base_tstates[i]
+                else:
+                    t += (delay(t) if contended and 16384 <= address < 32768 else 0) + base_tstates[i]
+            shift = t - ends[i]
+
+        timeline = np.array(new_starts, dtype=np.int64)[self.record_starts] if self.instruction_count else np.zeros(0, dtype=np.int64)
+        end = (ends[-1] + shift) if kinds else 0
+        return np.append(timeline, end)
+
+    def relocated_tstates(self, code: bool = True, data: bool = True) -> int:
+        timeline = self.relocated(code, data)
+        return int(timeline[-1] - timeline[0]) if len(timeline) > 1 else 0
+
+    def report(self, n: int = 20) -> str:
+        total = self.total_tstates()
+        lines = [f"{total} T-states, {self.total_delay()} in contention"]
+        lines.append(", ".join(f"{name}: {delay}" for name, delay in self.per_kind().items()))
+        for label, code, data in (("code", True, False), ("data", False, True), ("code and data", True, True)):
+            relocated = self.relocated_tstates(code, data)
+            lines.append(f"{label} above 0x8000: {relocated} T-states ({total - relocated} saved)")
+        per_page = self.per_page()
+        pages = np.argsort(per_page, kind="stable")[::-1]
+        lines.append("pages: " + ", ".join(f"0x{page << 8:04x}: {per_page[page]}" for page in pages[:8] if per_page[page]))
+        per_pc = self.per_pc()
+        for address in np.argsort(per_pc, kind="stable")[::-1][:n]:
+            if per_pc[address]:
+                lines.append(f"0x{address:04x} {disassemble(self.mem, int(address))}: {per_pc[address]}T")
+        return "\n".join(lines)
+
+    def save_csv(self, filename: str) -> None:
+        per_pc = self.per_pc()
+        kinds = np.zeros((65536, len(ACCESS_KINDS)), dtype=np.int64)
+        valid = self.access_kinds >= 0
+        np.add.at(kinds, (self.pcs[valid], self.access_kinds[valid]), self.delays[valid])
+        with open(filename, "w") as f:
+            f.write("address,instruction,delay," + ",".join(name.replace(" ", "_") for name in ACCESS_KINDS) + "\n")
+            for address in np.flatnonzero(per_pc):
+                f.write(f"0x{address:04x},\"{disassemble(self.mem, int(address))}\",{per_pc[address]},{','.join(str(d) for d in kinds[address])}\n")
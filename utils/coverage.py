@@ -0,0 +1,72 @@
+from typing import Iterable, Union
+
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from z80.instructions.instruction_def import Instruction
+
+
+# Which addresses instructions were executed from: a byte per address, set to 1 when an
+# instruction starts there (prefixed instructions at their first prefix). Coverage of any
+# number of runs, also from other processes through save() and merge_file(), is merged by OR.
+# Marked in own execution loop rather than by wrapping opcode handlers as PCTraps does: the
+# loop runs about as fast as Z80CPU.execute(), a wrapper costs a call per instruction (~25%).
+class Coverage:
+    def __init__(self, spectrum: Spectrum) -> None:
+        self.spectrum = spectrum
+        self.executed = bytearray(65536)
+
+    def clear(self) -> None:
+        self.executed = bytearray(65536)
+
+    def execute(self, tstate_limit: int) -> None:
+        z80 = self.spectrum.z80
+        bus_access = self.spectrum.bus_access
+        execute_one_cycle = z80.execute_one_cycle
+        executed = self.executed
+        while bus_access.tstates < tstate_limit:
+            if not z80._prefixOpcode:
+                executed[z80.regPC] = 1
+            execute_one_cycle()
+
+    def run_frames(self, frames: int) -> None:
+        for _ in range(frames):
+            self.execute(TSTATES_PER_INTERRUPT)
+            self.spectrum.end_frame()
+
+    def merge(self, other: Union['Coverage', bytes, bytearray]) -> None:
+        executed = other.executed if isinstance(other, Coverage) else other
+        merged = np.frombuffer(self.executed, dtype=np.uint8) | np.frombuffer(executed, dtype=np.uint8)
+        self.executed[:] = merged.tobytes()
+
+    def save(self, filename: str) -> None:
+        with open(filename, "wb") as f:
+            f.write(self.executed)
+
+    def merge_file(self, filename: str) -> None:
+        with open(filename, "rb") as f:
+            self.merge(f.read())
+
+    def addresses(self) -> np.ndarray:
+        return np.flatnonzero(np.frombuffer(self.executed, dtype=np.uint8))
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(np.frombuffer(self.executed, dtype=np.uint8)))
+
+    # Executed or not per source line of every instruction, with addresses from second_pass()
+    def lines(self, instructions: Iterable[object]) -> dict[int, bool]:
+        executed = self.executed
+        return {
+            instruction.line: executed[instruction.address & 0xffff] != 0
+            for instruction in instructions if isinstance(instruction, Instruction)
+        }
+
+    # Line coverage in lcov tracefile format, for genhtml or editor plugins
+    def save_lcov(self, filename: str, instructions: Iterable[object], source_file: str, test_name: str = "") -> None:
+        lines = self.lines(instructions)
+        with open(filename, "w") as f:
+            f.write(f"TN:{test_name}\nSF:{source_file}\n")
+            for line in sorted(lines):
+                f.write(f"DA:{line},{int(lines[line])}\n")
+            f.write(f"LF:{len(lines)}\nLH:{sum(lines.values())}\nend_of_record\n")
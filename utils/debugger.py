@@ -0,0 +1,252 @@
+import ast
+from typing import Callable, Optional
+
+from spectrum.spectrum import Spectrum
+from z80.pc_traps import BREAK, ExecutionBreak
+from z80.z80_cpu import Z80CPU
+
+
+Condition = Callable[[Z80CPU, memoryview], bool]
+
+# Names usable in conditions and Python expressions they are replaced with
+REGISTERS = {
+    "A": "z80.regA", "B": "z80.regB", "C": "z80.regC", "D": "z80.regD", "E": "z80.regE",
+    "H": "z80.regH", "L": "z80.regL", "F": "z80.get_flags()",
+    "AF": "((z80.regA << 8) | z80.get_flags())", "BC": "((z80.regB << 8) | z80.regC)",
+    "DE": "((z80.regD << 8) | z80.regE)", "HL": "((z80.regH << 8) | z80.regL)",
+    "IX": "z80.regIX", "IY": "z80.regIY", "SP": "z80.regSP", "PC": "z80.regPC",
+    "I": "z80.regI", "R": "z80.get_reg_R()", "IFF1": "z80.ffIFF1",
+    "CF": "z80.carryFlag", "ZF": "((z80.get_flags() & 0x40) != 0)",
+}
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.Compare, ast.BinOp, ast.UnaryOp, ast.Constant,
+    ast.Name, ast.Load, ast.Subscript, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod, ast.BitAnd, ast.BitOr, ast.BitXor,
+    ast.LShift, ast.RShift, ast.Not, ast.Invert, ast.USub
+)
+
+
+# Replaces register names with reads from the CPU and 'mem[x]' with memory access
+class _ConditionTransformer(ast.NodeTransformer):
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id == "mem":
+            return node
+        replacement = REGISTERS.get(node.id.upper())
+        if replacement is None:
+            raise ValueError(f"Unknown name '{node.id}' in condition")
+        return ast.parse(replacement, mode="eval").body
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        self.generic_visit(node)
+        if not isinstance(node.value, ast.Name) or node.value.id != "mem":
+            raise ValueError("Only 'mem' can be indexed in condition")
+        node.slice = ast.BinOp(left=node.slice, op=ast.BitAnd(), right=ast.Constant(0xffff))
+        return node
+
+
+# Compiles condition like "HL == 0x4000 and A > 3" or "mem[IX + 2] == 0" to a closure,
+# once - evaluating it is just a call.
+def compile_condition(expression: str) -> Condition:
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid condition '{expression}': {e.msg}") from e
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES) or isinstance(node, ast.Constant) and not isinstance(node.value, int):
+            raise ValueError(f"Unsupported element '{type(node).__name__}' in condition '{expression}'")
+
+    body = _ConditionTransformer().visit(tree).body
+    arguments = ast.arguments(posonlyargs=[], args=[ast.arg("z80"), ast.arg("mem")], kwonlyargs=[], kw_defaults=[], defaults=[])
+    function = ast.Expression(ast.Lambda(arguments, body))
+    ast.fix_missing_locations(function)
+    return eval(compile(function, f"<condition {expression}>", "eval"), {"__builtins__": {}})
+
+
+class Breakpoint:
+    def __init__(self, address: int, condition: Optional[str] = None) -> None:
+        self.address = address
+        self.condition = condition
+        self.compiled = compile_condition(condition) if condition else None
+        self.enabled = True
+        self.hits = 0
+
+
+WATCH_READ = 1
+WATCH_WRITE = 2
+
+
+# Watches memory range (address, length) or, when 'port_mask' is given, ports matching
+# port & port_mask == address & port_mask
+class Watchpoint:
+    def __init__(self, address: int, length: int = 1, access: int = WATCH_WRITE,
+                 condition: Optional[str] = None, port_mask: Optional[int] = None) -> None:
+        if length < 1 or port_mask is None and address + length > 0x10000:
+            raise ValueError(f"Invalid watched range 0x{address:04x} length {length}")
+        self.address = address
+        self.length = length
+        self.access = access
+        self.port_mask = port_mask
+        self.condition = condition
+        self.compiled = compile_condition(condition) if condition else None
+        self.enabled = True
+        self.hits = 0
+
+    @property
+    def pages(self) -> range:
+        return range(self.address >> 8, ((self.address + self.length - 1) >> 8) + 1)
+
+    def matches(self, address: int) -> bool:
+        if self.port_mask is not None:
+            return (address & self.port_mask) == (self.address & self.port_mask)
+        return self.address <= address < self.address + self.length
+
+
+# pc is where execution stopped: breakpoint address, or for watchpoints address of
+# the instruction following the one which did the access
+class Hit:
+    def __init__(self, kind: str, pc: int, address: int, value: Optional[int] = None,
+                 breakpoint: Optional[Breakpoint] = None, watchpoint: Optional[Watchpoint] = None) -> None:
+        self.kind = kind
+        self.pc = pc
+        self.address = address
+        self.value = value
+        self.breakpoint = breakpoint
+        self.watchpoint = watchpoint
+
+    def __repr__(self) -> str:
+        value = f" value 0x{self.value:02x}" if self.value is not None else ""
+        return f"{self.kind} at 0x{self.pc:04x}: 0x{self.address:04x}{value}"
+
+
+# Breakpoints are PC traps (see z80.pc_traps) so code without breakpoints runs at full speed
+# and conditions are only evaluated when their address is reached. Watchpoints switch to
+# watching bus which checks only watched kinds of access, and reports accesses of watched pages
+# only; without watchpoints normal bus is used. Nothing is done per instruction in either case.
+class Debugger:
+    def __init__(self, spectrum: Spectrum) -> None:
+        self.spectrum = spectrum
+        self.breakpoints: dict[int, Breakpoint] = {}
+        self.watchpoints: list[Watchpoint] = []
+        self.hit: Optional[Hit] = None
+        # Breakpoints stop only execution started by execute() - not stepping or profiling
+        self._active = False
+        self._resume_address: Optional[int] = None
+
+        watches = spectrum.watches
+        watches.on_read = self._on_read
+        watches.on_write = self._on_write
+        watches.on_in = self._on_in
+        watches.on_out = self._on_out
+
+    def add_breakpoint(self, address: int, condition: Optional[str] = None) -> Breakpoint:
+        breakpoint = Breakpoint(address, condition)
+        self.breakpoints[address] = breakpoint
+        self.spectrum.traps.add(address, lambda z80: self._on_breakpoint(breakpoint, z80))
+        return breakpoint
+
+    def remove_breakpoint(self, address: int) -> None:
+        if address in self.breakpoints:
+            del self.breakpoints[address]
+            self.spectrum.traps.remove(address)
+
+    def toggle_breakpoint(self, address: int) -> bool:
+        if address in self.breakpoints:
+            self.remove_breakpoint(address)
+            return False
+        self.add_breakpoint(address)
+        return True
+
+    def add_watchpoint(self, watchpoint: Watchpoint) -> Watchpoint:
+        self.watchpoints.append(watchpoint)
+        self._update_watched()
+        return watchpoint
+
+    def watch_memory(self, address: int, length: int = 1, access: int = WATCH_WRITE, condition: Optional[str] = None) -> Watchpoint:
+        return self.add_watchpoint(Watchpoint(address, length, access, condition))
+
+    def watch_port(self, port: int, mask: int = 0xffff, access: int = WATCH_READ | WATCH_WRITE, condition: Optional[str] = None) -> Watchpoint:
+        return self.add_watchpoint(Watchpoint(port, 1, access, condition, mask))
+
+    def remove_watchpoint(self, watchpoint: Watchpoint) -> None:
+        self.watchpoints.remove(watchpoint)
+        self._update_watched()
+
+    def _update_watched(self) -> None:
+        watches = self.spectrum.watches
+        watches.read_pages[:] = bytes(256)
+        watches.write_pages[:] = bytes(256)
+        ports = False
+        for watchpoint in self.watchpoints:
+            if watchpoint.port_mask is not None:
+                ports = True
+                continue
+            for page in watchpoint.pages:
+                if watchpoint.access & WATCH_READ:
+                    watches.read_pages[page] = 1
+                if watchpoint.access & WATCH_WRITE:
+                    watches.write_pages[page] = 1
+        self.spectrum.watch(any(watches.read_pages), any(watches.write_pages), ports)
+
+    # Runs like Spectrum.execute() but stops at breakpoints and after instructions which
+    # triggered a watchpoint. Returns the hit, or None if tstate_limit is reached.
+    def execute(self, tstate_limit: int) -> Optional[Hit]:
+        spectrum = self.spectrum
+        spectrum.watching = len(self.watchpoints) > 0
+        z80 = spectrum.z80
+        # Continuing from a breakpoint must not stop at it again straight away
+        self._resume_address = z80.regPC if z80.regPC in self.breakpoints else None
+        self.hit = None
+        self._active = True
+        # Code could have been written directly into memory (not through bus) since
+        spectrum.traps.refresh()
+        try:
+            z80.execute(tstate_limit)
+        except ExecutionBreak:
+            pass
+        finally:
+            self._active = False
+            # Watchpoint could have been hit by the last instruction before the limit
+            spectrum.traps.cancel_break()
+        self._resume_address = None
+        if self.hit is not None and self.hit.watchpoint is not None:
+            self.hit.pc = z80.regPC
+        return self.hit
+
+    def _on_breakpoint(self, breakpoint: Breakpoint, z80: Z80CPU) -> Optional[int]:
+        if not self._active:
+            return None
+        if self._resume_address == z80.regPC:
+            self._resume_address = None
+            return None
+        if not breakpoint.enabled or breakpoint.compiled is not None and not breakpoint.compiled(z80, self.spectrum.memory.mem):
+            return None
+        breakpoint.hits += 1
+        self.hit = Hit("breakpoint", z80.regPC, z80.regPC, breakpoint=breakpoint)
+        return BREAK
+
+    # Conditions of watchpoints are evaluated in the middle of the instruction doing the access
+    def _check(self, kind: str, access: int, address: int, value: int, ports: bool) -> None:
+        if not self._active:
+            return
+        z80 = self.spectrum.z80
+        for watchpoint in self.watchpoints:
+            if watchpoint.enabled and watchpoint.access & access and (watchpoint.port_mask is not None) == ports \
+                    and watchpoint.matches(address) \
+                    and (watchpoint.compiled is None or watchpoint.compiled(z80, self.spectrum.memory.mem)):
+                watchpoint.hits += 1
+                if self.hit is None:
+                    self.hit = Hit(kind, z80.regPC, address, value, watchpoint=watchpoint)
+                self.spectrum.traps.break_next()
+
+    def _on_read(self, address: int, value: int) -> None:
+        self._check("read", WATCH_READ, address, value, False)
+
+    def _on_write(self, address: int, value: int) -> None:
+        self._check("write", WATCH_WRITE, address, value, False)
+
+    def _on_in(self, port: int, value: int) -> None:
+        self._check("in", WATCH_READ, port, value, True)
+
+    def _on_out(self, port: int, value: int) -> None:
+        self._check("out", WATCH_WRITE, port, value, True)
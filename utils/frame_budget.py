@@ -0,0 +1,191 @@
+from typing import Callable
+
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.call_profiler import CONDITIONS, RET, RET_CC, RETN_RETI
+
+MAIN = 0
+INTERRUPT = 1
+HALT = 2
+CONTENTION = 3
+CATEGORIES = ("main", "interrupt", "halt", "contention")
+
+_HALT = 0x76
+
+
+# Splits T-states of every frame into main loop, interrupt handler, HALT idle time and
+# contention stalls (taken out of the other three). Category changes only when interrupt is
+# accepted (CPU's interrupt listener), HALT is executed and interrupt handler returns -
+# RET/RETI/RETN with SP above one interrupt was accepted at - so time is added up a few times
+# per frame and not per instruction. Contention is known only while spectrum.accounting is on
+# (start() turns it on unless contention is False).
+# Each frame is one row of 'history', ring buffer of the last len(history) frames.
+class FrameBudget:
+    def __init__(self, spectrum: Spectrum, history: int = 512, contention: bool = True) -> None:
+        self.spectrum = spectrum
+        self.z80 = spectrum.z80
+        self.contention = contention
+        self.history = np.zeros((history, len(CATEGORIES)), dtype=np.int32)
+        self.count = 0
+        self.active = False
+        self._tstates = [0, 0, 0]
+        self._delays = [0, 0, 0]
+        self._category = MAIN
+        self._mark = 0
+        self._bus_access = spectrum.bus_access
+        self._delays_mark = 0
+        # SP interrupted code will have after handler returns, per nested interrupt
+        self._interrupts: list[int] = []
+        self._hooks: dict[int, Callable[[], None]] = {}
+        self._previous_accounting = False
+
+    def clear(self) -> None:
+        self.history[:] = 0
+        self.count = 0
+        self._tstates = [0, 0, 0]
+        self._delays = [0, 0, 0]
+        self._mark_now()
+
+    def start(self) -> None:
+        if self.active:
+            return
+        spectrum = self.spectrum
+        traps = spectrum.traps
+        hooks = {_HALT: self._halt, RET: self._ret, 0xed: self._ed}
+        for opcode in RET_CC:
+            hooks[opcode] = self._conditional_ret(opcode)
+        for opcode, hook in hooks.items():
+            traps.hook_opcode(opcode, hook)
+        self._hooks = hooks
+        traps.listen_interrupts(self._interrupt)
+        self._previous_accounting = spectrum.accounting
+        if self.contention:
+            spectrum.accounting = True
+        self._mark_now()
+        self.active = True
+
+    def stop(self) -> None:
+        if not self.active:
+            return
+        self._switch(self._category)
+        traps = self.spectrum.traps
+        for opcode, hook in self._hooks.items():
+            traps.unhook_opcode(opcode, hook)
+        self._hooks = {}
+        traps.unlisten_interrupts(self._interrupt)
+        self.spectrum.accounting = self._previous_accounting
+        self.active = False
+
+    # Closes current frame: call it before (or instead of) spectrum.end_frame()
+    def end_frame(self) -> None:
+        self._switch(self._category)
+        row = self.history[self.count % len(self.history)]
+        tstates = self._tstates
+        delays = self._delays
+        row[MAIN] = tstates[MAIN] - delays[MAIN]
+        row[INTERRUPT] = tstates[INTERRUPT] - delays[INTERRUPT]
+        row[HALT] = tstates[HALT] - delays[HALT]
+        row[CONTENTION] = delays[MAIN] + delays[INTERRUPT] + delays[HALT]
+        self.count += 1
+        self._tstates = [0, 0, 0]
+        self._delays = [0, 0, 0]
+
+    def run_frames(self, frames: int) -> None:
+        active = self.active
+        self.start()
+        try:
+            for _ in range(frames):
+                self.spectrum.execute(TSTATES_PER_INTERRUPT)
+                self.end_frame()
+                self.spectrum.end_frame()
+        finally:
+            if not active:
+                self.stop()
+
+    # Last (up to) n frames, oldest first
+    def recent(self, n: int) -> np.ndarray:
+        size = len(self.history)
+        n = min(n, self.count, size)
+        indices = np.arange(self.count - n, self.count) % size
+        return self.history[indices]
+
+    def summary(self) -> dict:
+        frames = self.recent(len(self.history))
+        result: dict = {"frames": int(self.count), "recorded": len(frames), "frame_tstates": TSTATES_PER_INTERRUPT}
+        if len(frames) == 0:
+            return result
+        for i, category in enumerate(CATEGORIES):
+            column = frames[:, i]
+            result[category] = {
+                "mean": float(column.mean()),
+                "min": int(column.min()),
+                "max": int(column.max()),
+                "percent": float(100.0 * column.mean() / TSTATES_PER_INTERRUPT)
+            }
+        busy = frames[:, MAIN] + frames[:, INTERRUPT] + frames[:, CONTENTION]
+        result["busy_max"] = int(busy.max())
+        # Frames in which CPU never got to HALT
+        result["frames_without_halt"] = int(np.count_nonzero(frames[:, HALT] == 0))
+        return result
+
+    def _now(self) -> int:
+        bus_access = self.z80.bus_access
+        return bus_access.frames * TSTATES_PER_INTERRUPT + bus_access.tstates
+
+    def _mark_now(self) -> None:
+        self._mark = self._now()
+        self._bus_access = self.z80.bus_access
+        self._delays_mark = getattr(self._bus_access, "contention", 0)
+
+    def _switch(self, category: int) -> None:
+        now = self._now()
+        bus_access = self.z80.bus_access
+        # Time goes backwards when machine state is restored and bus may be switched meanwhile
+        if now > self._mark:
+            self._tstates[self._category] += now - self._mark
+            if bus_access is self._bus_access:
+                delays = getattr(bus_access, "contention", 0) - self._delays_mark
+                if delays > 0:
+                    self._delays[self._category] += delays
+        self._mark = now
+        self._bus_access = bus_access
+        self._delays_mark = getattr(bus_access, "contention", 0)
+        self._category = category
+
+    def _interrupt(self, _nmi: bool) -> None:
+        sp = self.z80.regSP or 0x10000
+        interrupts = self._interrupts
+        # Handlers which never returned (reset SP and jumped away) are gone
+        while interrupts and interrupts[-1] <= sp:
+            interrupts.pop()
+        interrupts.append(sp)
+        self._switch(INTERRUPT)
+
+    def _halt(self) -> None:
+        if not self._interrupts:
+            self._switch(HALT)
+
+    def _ret(self) -> None:
+        interrupts = self._interrupts
+        if interrupts:
+            sp = self.z80.regSP + 2
+            if interrupts[-1] <= sp:
+                while interrupts and interrupts[-1] <= sp:
+                    interrupts.pop()
+                if not interrupts:
+                    self._switch(MAIN)
+
+    def _ed(self) -> None:
+        if self._interrupts and self.spectrum.memory.mem[self.z80.regPC] in RETN_RETI:
+            self._ret()
+
+    def _conditional_ret(self, opcode: int) -> Callable[[], None]:
+        mask, value = CONDITIONS[(opcode >> 3) & 0x07]
+        z80 = self.z80
+
+        def conditional_ret() -> None:
+            if self._interrupts and z80.get_flags() & mask == value:
+                self._ret()
+        return conditional_ret
@@ -0,0 +1,172 @@
+import time
+
+from array import array
+from typing import Callable
+
+from spectrum.video import TSTATES_PER_INTERRUPT
+
+
+CPU_FREQUENCY = 3_500_000
+UNLIMITED = 0
+
+DEFAULT_SPIN_NS = 1_500_000
+DEFAULT_MAX_LAG_FRAMES = 5
+
+
+# Schedules emulated frames against monotonic clock. Deadlines are calculated from
+# the start of the schedule (epoch + n * period) so rounding errors never accumulate,
+# waiting is done by sleeping most of the remaining time and spinning the rest.
+#
+# Usage per frame:
+#   ... execute frame ...
+#   pacer.cpu_done()
+#   ... present frame ...
+#   pacer.present_done()
+#   pacer.wait()
+class FramePacer:
+    def __init__(self,
+                 speed: int = 1,
+                 frame_tstates: int = TSTATES_PER_INTERRUPT,
+                 cpu_frequency: int = CPU_FREQUENCY,
+                 history_size: int = 50,
+                 spin_ns: int = DEFAULT_SPIN_NS,
+                 max_lag_frames: int = DEFAULT_MAX_LAG_FRAMES,
+                 clock: Callable[[], int] = time.perf_counter_ns,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        self.frame_tstates = frame_tstates
+        self.cpu_frequency = cpu_frequency
+        self.spin_ns = spin_ns
+        self.max_lag_frames = max_lag_frames
+        self._clock = clock
+        self._sleep = sleep
+
+        # Period is kept as a fraction (numerator / denominator) in nanoseconds
+        self._period_num = 0
+        self._period_den = 1
+        self._speed = UNLIMITED
+
+        self.frames = 0
+        self.late_frames = 0
+        self.dropped_frames = 0
+
+        self.cpu_ns = 0
+        self.present_ns = 0
+        self.idle_ns = 0
+        self.frame_ns = 0
+
+        self.history_size = history_size
+        self.cpu_history = array('q', [0] * history_size)
+        self.present_history = array('q', [0] * history_size)
+        self.idle_history = array('q', [0] * history_size)
+        self.frame_history = array('q', [0] * history_size)
+        self._history_index = 0
+        self._history_count = 0
+
+        self._epoch = 0
+        self._scheduled = 0
+        self._frame_start = 0
+        self._cpu_done = 0
+        self._present_done = 0
+
+        self.speed = speed
+
+    @property
+    def speed(self) -> int: return self._speed
+
+    @speed.setter
+    def speed(self, speed: int) -> None:
+        if speed < 0:
+            raise ValueError(f"Speed must be positive or UNLIMITED; got {speed}")
+        self._speed = speed
+        self._period_num = self.frame_tstates * 1_000_000_000
+        self._period_den = self.cpu_frequency * (speed if speed != UNLIMITED else 1)
+        self.restart()
+
+    @property
+    def period_ns(self) -> float:
+        return self._period_num / self._period_den
+
+    def restart(self) -> None:
+        now = self._clock()
+        self._epoch = now
+        self._scheduled = 0
+        self._frame_start = now
+        self._cpu_done = 0
+        self._present_done = 0
+
+    def _deadline(self, scheduled: int) -> int:
+        return self._epoch + (scheduled * self._period_num) // self._period_den
+
+    def cpu_done(self) -> None:
+        self._cpu_done = self._clock()
+
+    def present_done(self) -> None:
+        self._present_done = self._clock()
+
+    def wait(self) -> None:
+        now = self._clock()
+        cpu_done = self._cpu_done if self._cpu_done else now
+        present_done = self._present_done if self._present_done >= cpu_done else cpu_done
+
+        if self._speed != UNLIMITED:
+            self._scheduled += 1
+            deadline = self._deadline(self._scheduled)
+            if now > deadline:
+                self.late_frames += 1
+                if now - deadline > self.max_lag_frames * self.period_ns:
+                    # Too far behind to catch up - drop accumulated debt and start new schedule from now
+                    self.dropped_frames += 1
+                    self._epoch = now
+                    self._scheduled = 0
+            else:
+                remaining = deadline - now
+                if remaining > self.spin_ns:
+                    self._sleep((remaining - self.spin_ns) / 1_000_000_000)
+                now = self._clock()
+                while now < deadline:
+                    now = self._clock()
+
+        self.cpu_ns = cpu_done - self._frame_start
+        self.present_ns = present_done - cpu_done
+        self.idle_ns = now - present_done
+        self.frame_ns = now - self._frame_start
+
+        i = self._history_index
+        self.cpu_history[i] = self.cpu_ns
+        self.present_history[i] = self.present_ns
+        self.idle_history[i] = self.idle_ns
+        self.frame_history[i] = self.frame_ns
+        self._history_index = (i + 1) % self.history_size
+        if self._history_count < self.history_size:
+            self._history_count += 1
+
+        self.frames += 1
+        self._frame_start = now
+        self._cpu_done = 0
+        self._present_done = 0
+
+    def _total(self, history: array) -> int:
+        if self._history_count < self.history_size:
+            return sum(history[:self._history_count])
+        return sum(history)
+
+    def fps(self) -> float:
+        total = self._total(self.frame_history)
+        return self._history_count * 1_000_000_000 / total if total > 0 else 0.0
+
+    def speed_percent(self) -> float:
+        total = self._total(self.frame_history)
+        nominal = self._period_num * self._history_count / self.cpu_frequency
+        return nominal * 100 / total if total > 0 else 0.0
+
+    def cpu_percent(self) -> float:
+        total = self._total(self.frame_history)
+        return self._total(self.cpu_history) * 100 / total if total > 0 else 0.0
+
+    def present_percent(self) -> float:
+        total = self._total(self.frame_history)
+        return self._total(self.present_history) * 100 / total if total > 0 else 0.0
+
+    def spare_percent(self) -> float:
+        total = self._total(self.frame_history)
+        return self._total(self.idle_history) * 100 / total if total > 0 else 0.0
@@ -0,0 +1,87 @@
+from typing import Optional
+
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+
+READS = 0
+WRITES = 1
+EXECUTES = 2
+KINDS = ("reads", "writes", "executes")
+
+# Fixed regions of 48K memory labelled on heatmap (stack is labelled where SP is)
+REGIONS = (
+    ("ROM", 0x0000, 0x4000),
+    ("screen", 0x4000, 0x5800),
+    ("attributes", 0x5800, 0x5b00),
+    ("printer buffer", 0x5b00, 0x5c00),
+    ("system variables", 0x5c00, 0x5cb6),
+)
+
+
+# Reads, writes and executes (opcode fetches) per address counted by heatmap bus, collected
+# at the end of each frame into totals (for export) and heat, which decays every frame so
+# heatmap shows what is accessed now. Counters of the bus are cleared after every frame.
+class MemoryHeatmap:
+    def __init__(self, spectrum: Spectrum, decay: float = 0.9) -> None:
+        self.spectrum = spectrum
+        self.decay = decay
+        bus_access = spectrum.heatmap_bus_access
+        self._counts = (
+            np.frombuffer(bus_access.reads, dtype=np.uint32),
+            np.frombuffer(bus_access.writes, dtype=np.uint32),
+            np.frombuffer(bus_access.executes, dtype=np.uint32)
+        )
+        self.totals = np.zeros((len(KINDS), 65536), dtype=np.uint64)
+        self.heat = np.zeros((len(KINDS), 65536), dtype=np.float32)
+        self.frames = 0
+        self._previous_heatmap: Optional[bool] = None
+
+    def clear(self) -> None:
+        self.spectrum.heatmap_bus_access.clear_counts()
+        self.totals[:] = 0
+        self.heat[:] = 0
+        self.frames = 0
+
+    def start(self) -> None:
+        self._previous_heatmap = self.spectrum.heatmap
+        self.spectrum.heatmap = True
+
+    def stop(self) -> None:
+        if self._previous_heatmap is not None:
+            self.spectrum.heatmap = self._previous_heatmap
+            self._previous_heatmap = None
+
+    # Takes accesses counted since the last call
+    def end_frame(self) -> None:
+        heat = self.heat
+        heat *= self.decay
+        for kind, counts in enumerate(self._counts):
+            self.totals[kind] += counts
+            heat[kind] += counts
+        self.spectrum.heatmap_bus_access.clear_counts()
+        self.frames += 1
+
+    def run_frames(self, frames: int) -> None:
+        self.start()
+        try:
+            for _ in range(frames):
+                self.spectrum.execute(TSTATES_PER_INTERRUPT)
+                self.end_frame()
+                self.spectrum.end_frame()
+        finally:
+            self.stop()
+
+    # 256x256 RGB image, row per 256 byte page, writes red, reads green and executes blue,
+    # each scaled logarithmically to its own maximum
+    def image(self) -> np.ndarray:
+        scaled = np.log1p(self.heat)
+        maximum = scaled.max(axis=1, keepdims=True)
+        scaled = np.divide(scaled, maximum, out=np.zeros_like(scaled), where=maximum > 0)
+        channels = (scaled * 255).astype(np.uint8)
+        return np.stack((channels[WRITES], channels[READS], channels[EXECUTES]), axis=-1).reshape(256, 256, 3)
+
+    # Total reads, writes and executes per address as (3, 65536) array
+    def save_npy(self, filename: str) -> None:
+        np.save(filename, self.totals)
@@ -0,0 +1,134 @@
+import heapq
+from array import array
+from typing import Optional
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from z80.instructions.instruction_def import decode_instruction
+
+
+# Instruction at address as it is in memory now
+def disassemble(mem: memoryview, address: int) -> str:
+    ptr = [address]
+
+    def next_byte() -> int:
+        b = mem[ptr[0]]
+        ptr[0] = (ptr[0] + 1) & 0xffff
+        return b
+
+    return decode_instruction(address, next_byte).to_str().strip()
+
+
+class HotSpot:
+    def __init__(self, address: int, count: int, tstates: int, contention: int, disassembly: str) -> None:
+        self.address = address
+        self.count = count
+        self.tstates = tstates
+        self.contention = contention
+        self.disassembly = disassembly
+
+    def __repr__(self) -> str:
+        return f"0x{self.address:04x} {self.disassembly}: {self.count}x {self.tstates}T ({self.contention}T contention)"
+
+
+# Executions, T-states and contention delays per PC, summed over any number of frames.
+# Execution runs on accounting bus (which sums contention only on contended accesses) so
+# per instruction there are just three counter updates. Interrupt acceptance is accounted
+# to the handler's address; while CPU is halted its cycles count at the address after HALT.
+class PCAccounting:
+    def __init__(self, spectrum: Spectrum) -> None:
+        self.spectrum = spectrum
+        self.counts = array('Q', bytes(8 * 65536))
+        self.tstates = array('Q', bytes(8 * 65536))
+        self.contention = array('Q', bytes(8 * 65536))
+
+    def clear(self) -> None:
+        self.counts = array('Q', bytes(8 * 65536))
+        self.tstates = array('Q', bytes(8 * 65536))
+        self.contention = array('Q', bytes(8 * 65536))
+
+    def execute(self, tstate_limit: int) -> None:
+        spectrum = self.spectrum
+        z80 = spectrum.z80
+        bus_access = spectrum.accounting_bus_access
+        previous_bus_access = spectrum.bus_access
+        bus_access.copy_from_bus_access(previous_bus_access)
+        spectrum.bus_access = bus_access
+
+        execute_one_cycle = z80.execute_one_cycle
+        counts = self.counts
+        tstates = self.tstates
+        contention = self.contention
+        start = bus_access.tstates
+        try:
+            while start < tstate_limit:
+                pc = z80.regPC
+                delays = bus_access.contention
+                execute_one_cycle()
+                end = bus_access.tstates
+                counts[pc] += 1
+                if bus_access.interrupt_tstates < 0:
+                    tstates[pc] += end - start
+                    contention[pc] += bus_access.contention - delays
+                else:
+                    interrupt = bus_access.interrupt_tstates
+                    tstates[pc] += interrupt - start
+                    contention[pc] += bus_access.interrupt_contention - delays
+                    tstates[z80.regPC] += end - interrupt
+                    contention[z80.regPC] += bus_access.contention - bus_access.interrupt_contention
+                    bus_access.interrupt_tstates = -1
+                start = end
+        finally:
+            previous_bus_access.copy_from_bus_access(bus_access)
+            spectrum.bus_access = previous_bus_access
+
+    def run_frames(self, frames: int) -> None:
+        for _ in range(frames):
+            self.execute(TSTATES_PER_INTERRUPT)
+            self.spectrum.end_frame()
+
+    def total_tstates(self) -> int:
+        return sum(self.tstates)
+
+    # Share of accounted T-states the CPU waited for ULA
+    def contention_percentage(self) -> float:
+        total = self.total_tstates()
+        return 100.0 * sum(self.contention) / total if total else 0.0
+
+    def disassemble(self, address: int) -> str:
+        return disassemble(self.spectrum.memory.mem, address)
+
+    def hot_spot(self, address: int) -> HotSpot:
+        return HotSpot(address, self.counts[address], self.tstates[address], self.contention[address], self.disassemble(address))
+
+    # Addresses which took most T-states
+    def top(self, n: int = 20) -> list[HotSpot]:
+        addresses = heapq.nlargest(n, (address for address in range(65536) if self.tstates[address]), key=self.tstates.__getitem__)
+        return [self.hot_spot(address) for address in addresses]
+
+    def report(self, n: int = 20) -> str:
+        lines = [f"{self.total_tstates()} T-states, {self.contention_percentage():.2f}% in contention"]
+        lines += [str(spot) for spot in self.top(n)]
+        return "\n".join(lines)
+
+    def save_csv(self, filename: str) -> None:
+        with open(filename, "w") as f:
+            f.write("address,instruction,count,tstates,contention\n")
+            for address in range(65536):
+                if self.counts[address] or self.tstates[address]:
+                    spot = self.hot_spot(address)
+                    f.write(f"0x{address:04x},\"{spot.disassembly}\",{spot.count},{spot.tstates},{spot.contention}\n")
+
+    # Every address is its own function so flat profile in KCachegrind lists instructions
+    def save_callgrind(self, filename: str, command: Optional[str] = None) -> None:
+        with open(filename, "w") as f:
+            f.write("# callgrind format\nversion: 1\ncreator: py-speccy\n")
+            if command is not None:
+                f.write(f"cmd: {command}\n")
+            f.write("positions: instr\nevents: Tstates Contention Executions\n")
+            f.write(f"summary: {self.total_tstates()} {sum(self.contention)} {sum(self.counts)}\n\n")
+            for address in range(65536):
+                if self.counts[address] or self.tstates[address]:
+                    spot = self.hot_spot(address)
+                    f.write(f"fn=0x{address:04x} {spot.disassembly}\n")
+                    f.write(f"0x{address:04x} {spot.tstates} {spot.contention} {spot.count}\n")
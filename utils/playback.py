@@ -1,3 +1,7 @@
+from typing import Optional
+
+import numpy as np
+
 from spectrum.spectrum import Spectrum
 from spectrum.spectrum_bus_access import ZXSpectrum48ClockAndBusAccess
 from spectrum.video import SCREEN_WIDTH, SCREEN_HEIGHT, Video
@@ -109,41 +113,169 @@ class SpectrumState:
         )
 
 
+PAGE_SIZE = 256
+DEFAULT_KEYFRAME_INTERVAL = 256
+
+
+def changed_pages(current: memoryview, previous: bytearray) -> np.ndarray:
+    # Compared as 64 bit words; memoryview's own == compares byte by byte in Python
+    current_pages = np.frombuffer(current, dtype=np.uint64).reshape(-1, PAGE_SIZE // 8)
+    previous_pages = np.frombuffer(previous, dtype=np.uint64).reshape(-1, PAGE_SIZE // 8)
+    return np.flatnonzero((current_pages != previous_pages).any(axis=1))
+
+
+# One step of history. Keyframes hold complete memory and video buffer, other entries
+# only 256 byte pages that changed since the previous entry.
+class HistoryEntry:
+    __slots__ = ("keyframe", "memory", "video_buffer", "memory_pages", "video_pages", "core_state", "sound_state")
+
+    def __init__(self) -> None:
+        self.keyframe = False
+        self.memory = b""
+        self.video_buffer = b""
+        self.memory_pages: tuple[tuple[int, bytes], ...] = ()
+        self.video_pages: tuple[tuple[int, bytes], ...] = ()
+        self.core_state: tuple = ()
+        self.sound_state: tuple = ()
+
+    def size(self) -> int:
+        return (len(self.memory) + len(self.video_buffer)
+                + sum(len(page) for _, page in self.memory_pages) + sum(len(page) for _, page in self.video_pages))
+
+
+def _apply_pages(buffer, pages: tuple[tuple[int, bytes], ...]) -> None:
+    for page, data in pages:
+        offset = page * PAGE_SIZE
+        buffer[offset:offset + PAGE_SIZE] = data
+
+
+# Ring buffer of delta compressed states. The oldest entry is always a keyframe;
+# restoring any entry costs at most one keyframe copy plus keyframe_interval deltas.
 class Playback:
-    def __init__(self, spectrum: Spectrum, backlog_size: int = 20000) -> None:
+    def __init__(self, spectrum: Spectrum, backlog_size: int = 20000, keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL) -> None:
         self.spectrum = spectrum
         self.backlog_size = backlog_size
-        self.backlog: list[SpectrumState] = []
+        self.keyframe_interval = keyframe_interval
+        self.entries: list[Optional[HistoryEntry]] = [None] * backlog_size
+        self.first = 0
+        self.count = 0
         self.top = 0
+        self.since_keyframe = 0
+
+        # Memory and video buffer as they were in the last entry - base for the next delta
+        self.memory = bytearray(65536)
+        self.video_buffer = bytearray(SCREEN_WIDTH * SCREEN_HEIGHT)
 
     def reset(self) -> None:
         self.top = 0
 
+    def __len__(self) -> int:
+        return self.count
+
+    def entry(self, index: int) -> HistoryEntry:
+        return self.entries[(self.first + index) % self.backlog_size]
+
+    def history_bytes(self) -> int:
+        return sum(self.entry(i).size() for i in range(self.count))
+
     def record(self) -> None:
-        if self.top == len(self.backlog):
-            if len(self.backlog) >= self.backlog_size:
-                state = self.backlog[0]
-                self.backlog[0:-1] = self.backlog[1:]
-                self.backlog[-1] = state
-
-                state.update_from(self.spectrum)
-            else:
-                state = SpectrumState.create(self.spectrum)
-                self.backlog.append(state)
-                self.top = len(self.backlog)
+        if self.top < self.count:
+            self._truncate(self.top)
+        if self.count == self.backlog_size:
+            self._drop_oldest()
+
+        spectrum = self.spectrum
+        mem = spectrum.memory.mem
+        video_buffer = spectrum.video.buffer_m
+
+        entry = HistoryEntry()
+        if self.count == 0 or self.since_keyframe >= self.keyframe_interval - 1:
+            entry.keyframe = True
+            entry.memory = mem.tobytes()
+            entry.video_buffer = video_buffer.tobytes()
+            self.memory[:] = entry.memory
+            self.video_buffer[:] = entry.video_buffer
+            self.since_keyframe = 0
         else:
-            state = self.backlog[self.top]
-            state.update_from(self.spectrum)
-            self.top += 1
+            entry.memory_pages = self._delta(mem, self.memory)
+            entry.video_pages = self._delta(video_buffer, self.video_buffer)
+            self.since_keyframe += 1
+
+        entry.core_state = spectrum.core_state()
+        entry.sound_state = spectrum.sound_state()
+
+        self.entries[(self.first + self.count) % self.backlog_size] = entry
+        self.count += 1
+        self.top = self.count
+
+    @staticmethod
+    def _delta(current: memoryview, previous: bytearray) -> tuple[tuple[int, bytes], ...]:
+        pages = []
+        for page in changed_pages(current, previous).tolist():
+            offset = page * PAGE_SIZE
+            data = current[offset:offset + PAGE_SIZE].tobytes()
+            previous[offset:offset + PAGE_SIZE] = data
+            pages.append((page, data))
+        return tuple(pages)
+
+    def _drop_oldest(self) -> None:
+        oldest = self.entry(0)
+        if self.count > 1:
+            following = self.entry(1)
+            if not following.keyframe:
+                memory = bytearray(oldest.memory)
+                video_buffer = bytearray(oldest.video_buffer)
+                _apply_pages(memory, following.memory_pages)
+                _apply_pages(video_buffer, following.video_pages)
+                following.keyframe = True
+                following.memory = bytes(memory)
+                following.video_buffer = bytes(video_buffer)
+                following.memory_pages = ()
+                following.video_pages = ()
+        self.entries[self.first] = None
+        self.first = (self.first + 1) % self.backlog_size
+        self.count -= 1
+        self.top = max(self.top - 1, 0)
+
+    def _truncate(self, count: int) -> None:
+        for i in range(count, self.count):
+            self.entries[(self.first + i) % self.backlog_size] = None
+        self.count = count
+        if count > 0:
+            keyframe = self._materialise(count - 1, self.memory, self.video_buffer)
+            self.since_keyframe = count - 1 - keyframe
+
+    def _materialise(self, index: int, memory, video_buffer) -> int:
+        keyframe = index
+        while not self.entry(keyframe).keyframe:
+            keyframe -= 1
+        entry = self.entry(keyframe)
+        memory[:] = entry.memory
+        video_buffer[:] = entry.video_buffer
+        for i in range(keyframe + 1, index + 1):
+            entry = self.entry(i)
+            _apply_pages(memory, entry.memory_pages)
+            _apply_pages(video_buffer, entry.video_pages)
+        return keyframe
+
+    def _restore(self, index: int) -> None:
+        spectrum = self.spectrum
+        self._materialise(index, spectrum.memory.mem, spectrum.video.buffer_m)
+
+        entry = self.entry(index)
+        spectrum.set_core_state(entry.core_state)
+        spectrum.set_sound_state(entry.sound_state)
+        spectrum.traps.refresh()
+        spectrum.update_screen()
 
     def restore_first(self) -> None:
         self.top = 0
 
-        self.backlog[self.top].restore_to(self.spectrum)
+        self._restore(self.top)
 
     def restore_previous(self, skip_count: int = 1) -> None:
         self.top -= skip_count
         if self.top < 0: self.top = 0
 
-        if self.top < len(self.backlog):
-            self.backlog[self.top].restore_to(self.spectrum)
+        if self.top < self.count:
+            self._restore(self.top)
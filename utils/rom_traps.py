@@ -0,0 +1,33 @@
+from typing import Optional
+
+from spectrum.spectrum import Spectrum
+from z80.z80_cpu import Z80CPU
+
+
+PRINT_OUT = 0x09f4
+
+# Where Spectrum's character set differs from ASCII
+SPECTRUM_CHARACTERS = {0x60: "\u00a3", 0x7f: "\u00a9", 13: "\n"}
+
+
+# Collects everything ROM prints through channels 'K' and 'S' (RST 10 ends up in PRINT-OUT
+# with character in A). Codes are kept as they are; text() converts only printable characters
+# and ENTER.
+class PrintCapture:
+    def __init__(self, spectrum: Spectrum) -> None:
+        self.spectrum = spectrum
+        self.codes = bytearray()
+        spectrum.traps.add(PRINT_OUT, self._print_out)
+
+    def _print_out(self, z80: Z80CPU) -> Optional[int]:
+        self.codes.append(z80.regA)
+        return None
+
+    def text(self) -> str:
+        return "".join(SPECTRUM_CHARACTERS.get(c, chr(c) if 32 <= c < 128 else "") for c in self.codes)
+
+    def clear(self) -> None:
+        del self.codes[:]
+
+    def close(self) -> None:
+        self.spectrum.traps.remove(PRINT_OUT)
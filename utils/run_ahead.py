@@ -0,0 +1,102 @@
+import time
+
+from spectrum.machine_state import MachineState
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.frame_pacer import CPU_FREQUENCY
+
+
+FRAME_MS = TSTATES_PER_INTERRUPT * 1000 / CPU_FREQUENCY
+
+
+# Run-ahead hides input latency of the emulated program. Real frames are executed
+# without rendering; after input is read at frame boundary machine state is saved,
+# 'frames' frames are executed ahead (only last of them rendered) and state is restored.
+# What is presented is what the game would show 'frames' frames later, with input
+# it already saw.
+class RunAhead:
+    def __init__(self, spectrum: Spectrum, frames: int = 0) -> None:
+        self.spectrum = spectrum
+        self.state = MachineState()
+        self._frames = 0
+
+        self.runs = 0
+        self.ahead_ns = 0
+        self.total_ahead_ns = 0
+
+        self.frames = frames
+
+    @property
+    def frames(self) -> int: return self._frames
+
+    @frames.setter
+    def frames(self, frames: int) -> None:
+        if frames < 0:
+            raise ValueError(f"Run-ahead frames must be 0 or more; got {frames}")
+        self._frames = frames
+        self.spectrum.rendering = frames == 0
+        self.runs = 0
+        self.total_ahead_ns = 0
+
+    def latency_reduction_ms(self) -> float:
+        return self._frames * FRAME_MS
+
+    def average_ahead_ms(self) -> float:
+        return self.total_ahead_ns / (self.runs * 1_000_000) if self.runs > 0 else 0.0
+
+    # To be called at frame boundary, after spectrum.end_frame() and processing input
+    def run_ahead(self) -> None:
+        if self._frames == 0:
+            return
+
+        started = time.perf_counter_ns()
+
+        spectrum = self.spectrum
+        spectrum.save_state(self.state)
+        audio_sink = spectrum.audio_sink
+        spectrum.audio_sink = None
+
+        for i in range(self._frames):
+            spectrum.rendering = i == self._frames - 1
+            spectrum.execute(TSTATES_PER_INTERRUPT)
+            spectrum.end_frame()
+
+        spectrum.rendering = False
+        spectrum.audio_sink = audio_sink
+        spectrum.restore_state(self.state)
+
+        self.ahead_ns = time.perf_counter_ns() - started
+        self.total_ahead_ns += self.ahead_ns
+        self.runs += 1
+
+
+# Runs given number of frames headless with and without run-ahead and returns
+# average time of one frame in both cases along with latency saved.
+def measure_run_ahead(spectrum: Spectrum, frames: int = 100, ahead_frames: int = 1) -> dict[str, float]:
+    run_ahead = RunAhead(spectrum)
+
+    def run() -> float:
+        started = time.perf_counter_ns()
+        for _ in range(frames):
+            spectrum.execute(TSTATES_PER_INTERRUPT)
+            spectrum.end_frame()
+            run_ahead.run_ahead()
+        return (time.perf_counter_ns() - started) / (frames * 1_000_000)
+
+    initial_state = spectrum.save_state()
+    baseline_ms = run()
+
+    spectrum.restore_state(initial_state)
+    run_ahead.frames = ahead_frames
+    run_ahead_ms = run()
+
+    run_ahead.frames = 0
+    spectrum.restore_state(initial_state)
+
+    return {
+        "frame_ms": baseline_ms,
+        "run_ahead_frame_ms": run_ahead_ms,
+        "cpu_cost_percent": (run_ahead_ms - baseline_ms) * 100 / baseline_ms if baseline_ms > 0 else 0.0,
+        "latency_reduction_ms": ahead_frames * FRAME_MS,
+        "frame_budget_ms": FRAME_MS
+    }
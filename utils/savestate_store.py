@@ -0,0 +1,153 @@
+import ast
+import hashlib
+import mmap
+import os
+import re
+import struct
+from typing import Optional
+
+from spectrum.spectrum import Spectrum
+from spectrum.machine_state import STATE_STRUCT
+from z80.z80_state import Z80State
+
+
+PAGE_SIZE = 1024
+PAGES = 65536 // PAGE_SIZE
+
+MANIFEST_MAGIC = b"ZXSS"
+MANIFEST_VERSION = 1
+MANIFEST_HEADER = struct.Struct("<4sH32s")
+MANIFEST_PAGES = struct.Struct(f"<{PAGES}I")
+MANIFEST_SIZE = MANIFEST_HEADER.size + STATE_STRUCT.size + MANIFEST_PAGES.size
+
+INDEX_ENTRY = struct.Struct("<16sI")
+
+_NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+
+def page_hash(page) -> bytes:
+    return hashlib.blake2b(page, digest_size=16).digest()
+
+
+# On-disk store of savestates. Memory is split into 1K pages which are kept once, by their
+# hash, in an append-only pack file that is read through mmap. Each savestate is a small
+# manifest: Z80State registers (as in snapshot formats), exact CPU/bus/video beam state,
+# pack page numbers for all 64 pages and sound state (as Python literal). ROM and unchanged
+# RAM cost nothing after the first save.
+class SavestateStore:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.states_directory = os.path.join(directory, "states")
+        os.makedirs(self.states_directory, exist_ok=True)
+
+        self.pack_path = os.path.join(directory, "pages.pack")
+        self.index_path = os.path.join(directory, "pages.idx")
+
+        self.pages: dict[bytes, int] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                index = f.read()
+            for digest, page in INDEX_ENTRY.iter_unpack(index[:len(index) - len(index) % INDEX_ENTRY.size]):
+                self.pages[digest] = page
+
+        self.pack = open(self.pack_path, "a+b")
+        self.page_count = os.path.getsize(self.pack_path) // PAGE_SIZE
+        self._map: Optional[mmap.mmap] = None
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.pack.close()
+
+    def _path(self, name: str) -> str:
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid savestate name '{name}'")
+        return os.path.join(self.states_directory, name + ".state")
+
+    def names(self) -> list[str]:
+        return sorted(filename[:-6] for filename in os.listdir(self.states_directory) if filename.endswith(".state"))
+
+    def pack_size(self) -> int:
+        return self.page_count * PAGE_SIZE
+
+    # Returns number of pages that were not in the store yet
+    def save(self, spectrum: Spectrum, name: str) -> int:
+        path = self._path(name)
+        mem = spectrum.memory.mem
+
+        page_numbers = []
+        new_pages = []
+        new_entries = []
+        for i in range(PAGES):
+            page = mem[i * PAGE_SIZE:(i + 1) * PAGE_SIZE]
+            digest = page_hash(page)
+            number = self.pages.get(digest)
+            if number is None:
+                number = self.page_count + len(new_pages)
+                self.pages[digest] = number
+                new_pages.append(page.tobytes())
+                new_entries.append(INDEX_ENTRY.pack(digest, number))
+            page_numbers.append(number)
+
+        if new_pages:
+            self.pack.write(b"".join(new_pages))
+            self.pack.flush()
+            self.page_count += len(new_pages)
+            with open(self.index_path, "ab") as index:
+                index.write(b"".join(new_entries))
+
+        border = spectrum.bus_access.ports.current_border
+        manifest = (
+            MANIFEST_HEADER.pack(MANIFEST_MAGIC, MANIFEST_VERSION, Z80State.create_from(spectrum.z80, border).state.tobytes())
+            + STATE_STRUCT.pack(*spectrum.core_state())
+            + MANIFEST_PAGES.pack(*page_numbers)
+            + repr(spectrum.sound_state()).encode("ascii")
+        )
+        # Manifest is replaced atomically so a slot is never half written
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(manifest)
+        os.replace(temporary, path)
+        return len(new_pages)
+
+    def _pack_map(self, size: int) -> mmap.mmap:
+        if self._map is None or len(self._map) < size:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.pack.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def load(self, spectrum: Spectrum, name: str) -> None:
+        path = self._path(name)
+        with open(path, "rb") as f:
+            manifest = f.read()
+        if len(manifest) < MANIFEST_SIZE:
+            raise ValueError(f"Savestate '{name}' has unexpected size {len(manifest)}")
+        magic, version, _ = MANIFEST_HEADER.unpack_from(manifest, 0)
+        if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+            raise ValueError(f"Savestate '{name}' is not in supported format")
+
+        state = STATE_STRUCT.unpack_from(manifest, MANIFEST_HEADER.size)
+        page_numbers = MANIFEST_PAGES.unpack_from(manifest, MANIFEST_HEADER.size + STATE_STRUCT.size)
+        if max(page_numbers) >= self.page_count:
+            raise ValueError(f"Savestate '{name}' refers to pages missing from the pack")
+
+        pack = self._pack_map(self.page_count * PAGE_SIZE)
+        mem = spectrum.memory.mem
+        for i, number in enumerate(page_numbers):
+            offset = number * PAGE_SIZE
+            mem[i * PAGE_SIZE:(i + 1) * PAGE_SIZE] = pack[offset:offset + PAGE_SIZE]
+
+        spectrum.set_core_state(state)
+        spectrum.traps.refresh()
+        spectrum.set_sound_state(ast.literal_eval(manifest[MANIFEST_SIZE:].decode("ascii")))
+
+    def registers(self, name: str) -> Z80State:
+        with open(self._path(name), "rb") as f:
+            manifest = f.read(MANIFEST_HEADER.size)
+        return Z80State(memoryview(bytearray(MANIFEST_HEADER.unpack(manifest)[2])))
+
+    def delete(self, name: str) -> None:
+        # Pages stay in the pack - other savestates are likely to share them
+        os.remove(self._path(name))
@@ -0,0 +1,357 @@
+import struct
+import zlib
+from typing import Optional
+
+import numpy as np
+
+from z80.z80_cpu import Z80CPU, IM0, IM1, IM2
+
+
+RAM_START = 16384
+RAM_SIZE = 49152
+
+SNA_HEADER = struct.Struct('<BHHHHHHHHHBBHHBB')
+Z80_HEADER = struct.Struct('<BBHHHHBBBHHHHBBHHBBB')
+Z80_V1_END_MARKER = b'\x00\xed\xed\x00'
+Z80_BLOCK_HEADER = struct.Struct('<HB')
+
+# .z80 v2/v3 page numbers of 48K RAM
+Z80_PAGES_48K = {8: 0x4000, 4: 0x8000, 5: 0xc000}
+# Hardware modes meaning 48K machine for each extended header length
+Z80_48K_HARDWARE = {23: (0, 1), 54: (0, 1, 2), 55: (0, 1, 2)}
+
+SZX_HEADER = struct.Struct('<4sBBBB')
+SZX_BLOCK_HEADER = struct.Struct('<4sI')
+SZX_Z80R = struct.Struct('<HHHHHHHHHHHHBBBBBIBBH')
+SZX_SPCR = struct.Struct('<BBBB4s')
+SZX_RAMP = struct.Struct('<HB')
+SZX_MACHINE_48K = 1
+SZX_RAMP_COMPRESSED = 1
+SZX_PAGES_48K = {5: 0x4000, 2: 0x8000, 0: 0xc000}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# Machine state as stored in snapshot files: registers, border and 48K of RAM
+class Snapshot:
+    def __init__(self) -> None:
+        self.a = 0
+        self.f = 0
+        self.bc = 0
+        self.de = 0
+        self.hl = 0
+        self.ax = 0
+        self.fx = 0
+        self.bcx = 0
+        self.dex = 0
+        self.hlx = 0
+        self.ix = 0
+        self.iy = 0
+        self.sp = 0
+        self.pc = 0
+        self.i = 0
+        self.r = 0
+        self.iff1 = False
+        self.iff2 = False
+        self.im = 0
+        self.border = 0
+        self.memptr = 0
+        self.tstates: Optional[int] = None
+        self.memory = bytes(RAM_SIZE)
+
+
+def capture(z80: Z80CPU, border: int, tstates: Optional[int] = None) -> Snapshot:
+    snapshot = Snapshot()
+    snapshot.a = z80.regA
+    snapshot.f = z80.get_flags()
+    snapshot.bc = z80.get_reg_BC()
+    snapshot.de = z80.get_reg_DE()
+    snapshot.hl = z80.get_reg_HL()
+    snapshot.ax = z80.regAx
+    snapshot.fx = z80.regFx
+    snapshot.bcx = z80.get_reg_BCx()
+    snapshot.dex = z80.get_reg_DEx()
+    snapshot.hlx = z80.get_reg_HLx()
+    snapshot.ix = z80.regIX
+    snapshot.iy = z80.regIY
+    snapshot.sp = z80.regSP
+    snapshot.pc = z80.regPC
+    snapshot.i = z80.regI
+    snapshot.r = z80.get_reg_R()
+    snapshot.iff1 = bool(z80.ffIFF1)
+    snapshot.iff2 = bool(z80.ffIFF2)
+    snapshot.im = z80.modeINT
+    snapshot.border = border & 0x07
+    snapshot.memptr = z80.memptr
+    snapshot.tstates = tstates
+    snapshot.memory = z80.bus_access.memory.mem[RAM_START:].tobytes()
+    return snapshot
+
+
+def apply(snapshot: Snapshot, z80: Z80CPU) -> None:
+    z80.regA = snapshot.a
+    z80.set_flags(snapshot.f)
+    z80.set_reg_BC(snapshot.bc)
+    z80.set_reg_DE(snapshot.de)
+    z80.set_reg_HL(snapshot.hl)
+    z80.regAx = snapshot.ax
+    z80.set_reg_Fx(snapshot.fx)
+    z80.set_reg_BCx(snapshot.bcx)
+    z80.set_reg_DEx(snapshot.dex)
+    z80.set_reg_HLx(snapshot.hlx)
+    z80.set_reg_IX(snapshot.ix)
+    z80.set_reg_IY(snapshot.iy)
+    z80.set_reg_SP(snapshot.sp)
+    z80.set_reg_PC(snapshot.pc)
+    z80.set_reg_I(snapshot.i)
+    z80.set_reg_R(snapshot.r)
+    z80.ffIFF1 = snapshot.iff1
+    z80.ffIFF2 = snapshot.iff2
+    z80.modeINT = (IM0, IM1, IM2, IM2)[snapshot.im & 0x03]
+    z80.memptr = snapshot.memptr
+    z80.halted = False
+    z80.pendingEI = False
+    z80.bus_access.memory.mem[RAM_START:] = snapshot.memory
+
+
+def decode_z80_block(data: bytes, length: Optional[int] = None) -> bytes:
+    # 'ED ED count value' is a run; everything between runs is copied as is
+    data = bytes(data)
+    parts = []
+    position = 0
+    find = data.find
+    end = len(data)
+    while True:
+        marker = find(b'\xed\xed', position)
+        if marker < 0:
+            parts.append(data[position:])
+            break
+        if marker + 4 > end:
+            raise SnapshotError(f"Truncated run at offset {marker}")
+        parts.append(data[position:marker])
+        parts.append(data[marker + 3:marker + 4] * data[marker + 2])
+        position = marker + 4
+
+    result = b''.join(parts)
+    if length is not None and len(result) != length:
+        raise SnapshotError(f"Block decompressed to {len(result)} bytes instead of {length}")
+    return result
+
+
+def _runs(data: bytes) -> list[tuple[int, int]]:
+    # Runs worth compressing: any two or more 0xED or five or more of any other byte
+    values = np.frombuffer(data, dtype=np.uint8)
+    starts = np.flatnonzero(np.diff(values)) + 1
+    starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], len(values))
+    lengths = ends - starts
+    selected = (lengths >= 5) | ((lengths >= 2) & (values[starts] == 0xed))
+    return list(zip(starts[selected].tolist(), ends[selected].tolist()))
+
+
+def encode_z80_block(data: bytes) -> bytes:
+    data = bytes(data)
+    if not data:
+        return data
+    parts = []
+    position = 0
+    for start, end in _runs(data):
+        if start > position and data[start - 1] == 0xed:
+            # Byte following single 0xED can't start a run
+            start += 1
+            if end - start < 5:
+                continue
+        parts.append(data[position:start])
+        value = data[start]
+        length = end - start
+        while length > 0:
+            count = min(length, 255)
+            parts.append(bytes((0xed, 0xed, count, value)))
+            length -= count
+        position = end
+    parts.append(data[position:])
+    return b''.join(parts)
+
+
+def decode_sna(data: bytes) -> Snapshot:
+    if len(data) != SNA_HEADER.size + RAM_SIZE:
+        raise SnapshotError(f"48K .sna must be {SNA_HEADER.size + RAM_SIZE} bytes long; got {len(data)}")
+    snapshot = Snapshot()
+    snapshot.i, snapshot.hlx, snapshot.dex, snapshot.bcx, afx, snapshot.hl, snapshot.de, snapshot.bc, \
+        snapshot.iy, snapshot.ix, iff2, snapshot.r, af, sp, snapshot.im, border = SNA_HEADER.unpack_from(data, 0)
+    snapshot.ax, snapshot.fx = afx >> 8, afx & 0xff
+    snapshot.a, snapshot.f = af >> 8, af & 0xff
+    snapshot.iff2 = (iff2 & 0x04) != 0
+    snapshot.iff1 = snapshot.iff2
+    snapshot.border = border & 0x07
+    snapshot.memory = bytes(data[SNA_HEADER.size:])
+
+    # PC is on the stack as if RETN was about to be executed
+    memory = snapshot.memory
+    low = memory[sp - RAM_START] if sp >= RAM_START else 0
+    high_address = (sp + 1) & 0xffff
+    high = memory[high_address - RAM_START] if high_address >= RAM_START else 0
+    snapshot.pc = (high << 8) | low
+    snapshot.sp = (sp + 2) & 0xffff
+    return snapshot
+
+
+def encode_sna(snapshot: Snapshot) -> bytes:
+    memory = bytearray(snapshot.memory)
+    sp = (snapshot.sp - 2) & 0xffff
+    for address, value in ((sp, snapshot.pc & 0xff), ((sp + 1) & 0xffff, snapshot.pc >> 8)):
+        if address >= RAM_START:
+            memory[address - RAM_START] = value
+    header = SNA_HEADER.pack(
+        snapshot.i, snapshot.hlx, snapshot.dex, snapshot.bcx, (snapshot.ax << 8) | snapshot.fx,
+        snapshot.hl, snapshot.de, snapshot.bc, snapshot.iy, snapshot.ix,
+        0x04 if snapshot.iff2 else 0, snapshot.r & 0xff, (snapshot.a << 8) | snapshot.f, sp, snapshot.im, snapshot.border)
+    return header + memory
+
+
+def decode_z80(data: bytes) -> Snapshot:
+    data = bytes(data)
+    if len(data) < Z80_HEADER.size:
+        raise SnapshotError("File is too short for .z80 header")
+    snapshot = Snapshot()
+    snapshot.a, snapshot.f, snapshot.bc, snapshot.hl, snapshot.pc, snapshot.sp, snapshot.i, r, flags, snapshot.de, \
+        snapshot.bcx, snapshot.dex, snapshot.hlx, snapshot.ax, snapshot.fx, snapshot.iy, snapshot.ix, \
+        iff1, iff2, im = Z80_HEADER.unpack_from(data, 0)
+    if flags == 255:
+        flags = 1
+    snapshot.r = (r & 0x7f) | ((flags & 0x01) << 7)
+    snapshot.border = (flags >> 1) & 0x07
+    snapshot.iff1 = iff1 != 0
+    snapshot.iff2 = iff2 != 0
+    snapshot.im = im & 0x03
+
+    if snapshot.pc != 0:
+        body = data[Z80_HEADER.size:]
+        if flags & 0x20:
+            if body.endswith(Z80_V1_END_MARKER):
+                body = body[:-len(Z80_V1_END_MARKER)]
+            snapshot.memory = decode_z80_block(body, RAM_SIZE)
+        elif len(body) != RAM_SIZE:
+            raise SnapshotError(f"Uncompressed .z80 memory must be {RAM_SIZE} bytes; got {len(body)}")
+        else:
+            snapshot.memory = body
+        return snapshot
+
+    extended_length, snapshot.pc, hardware = struct.unpack_from('<HHB', data, Z80_HEADER.size)
+    if extended_length not in Z80_48K_HARDWARE:
+        raise SnapshotError(f"Unsupported .z80 extended header length {extended_length}")
+    if hardware not in Z80_48K_HARDWARE[extended_length]:
+        raise SnapshotError(f"Unsupported .z80 hardware mode {hardware}; only 48K snapshots are supported")
+
+    memory = bytearray(RAM_SIZE)
+    offset = Z80_HEADER.size + 2 + extended_length
+    while offset < len(data):
+        if offset + Z80_BLOCK_HEADER.size > len(data):
+            raise SnapshotError(f"Truncated memory block header at offset {offset}")
+        length, page = Z80_BLOCK_HEADER.unpack_from(data, offset)
+        offset += Z80_BLOCK_HEADER.size
+        address = Z80_PAGES_48K.get(page)
+        if address is None:
+            raise SnapshotError(f"Unsupported page {page} in 48K .z80 snapshot")
+        if length == 0xffff:
+            block = data[offset:offset + 16384]
+            offset += 16384
+            if len(block) != 16384:
+                raise SnapshotError(f"Truncated uncompressed page {page}")
+        else:
+            block = decode_z80_block(data[offset:offset + length], 16384)
+            offset += length
+        memory[address - RAM_START:address - RAM_START + 16384] = block
+    snapshot.memory = bytes(memory)
+    return snapshot
+
+
+def encode_z80(snapshot: Snapshot) -> bytes:
+    # Version 1 format with compressed memory - understood by every emulator
+    flags = ((snapshot.r >> 7) & 0x01) | (snapshot.border << 1) | 0x20
+    header = Z80_HEADER.pack(
+        snapshot.a, snapshot.f, snapshot.bc, snapshot.hl, snapshot.pc, snapshot.sp, snapshot.i, snapshot.r & 0x7f, flags,
+        snapshot.de, snapshot.bcx, snapshot.dex, snapshot.hlx, snapshot.ax, snapshot.fx, snapshot.iy, snapshot.ix,
+        1 if snapshot.iff1 else 0, 1 if snapshot.iff2 else 0, snapshot.im & 0x03)
+    if snapshot.pc == 0:
+        raise SnapshotError("PC of 0 can't be stored in version 1 .z80 file")
+    return header + encode_z80_block(snapshot.memory) + Z80_V1_END_MARKER
+
+
+def decode_szx(data: bytes) -> Snapshot:
+    data = bytes(data)
+    if len(data) < SZX_HEADER.size:
+        raise SnapshotError("File is too short for .szx header")
+    magic, _major, _minor, machine, _flags = SZX_HEADER.unpack_from(data, 0)
+    if magic != b'ZXST':
+        raise SnapshotError("Not a .szx file")
+    if machine != SZX_MACHINE_48K:
+        raise SnapshotError(f"Unsupported .szx machine {machine}; only 48K snapshots are supported")
+
+    snapshot = Snapshot()
+    memory = bytearray(RAM_SIZE)
+    registers_found = False
+    offset = SZX_HEADER.size
+    while offset + SZX_BLOCK_HEADER.size <= len(data):
+        block_id, size = SZX_BLOCK_HEADER.unpack_from(data, offset)
+        offset += SZX_BLOCK_HEADER.size
+        block = data[offset:offset + size]
+        offset += size
+        if len(block) != size:
+            raise SnapshotError(f"Truncated .szx block {block_id!r}")
+
+        if block_id == b'Z80R':
+            af, snapshot.bc, snapshot.de, snapshot.hl, afx, snapshot.bcx, snapshot.dex, snapshot.hlx, \
+                snapshot.ix, snapshot.iy, snapshot.sp, snapshot.pc, snapshot.i, snapshot.r, iff1, iff2, snapshot.im, \
+                snapshot.tstates, _hold_int, _flags, snapshot.memptr = SZX_Z80R.unpack_from(block, 0)
+            snapshot.a, snapshot.f = af >> 8, af & 0xff
+            snapshot.ax, snapshot.fx = afx >> 8, afx & 0xff
+            snapshot.iff1 = iff1 != 0
+            snapshot.iff2 = iff2 != 0
+            registers_found = True
+        elif block_id == b'SPCR':
+            snapshot.border = block[0] & 0x07
+        elif block_id == b'RAMP':
+            flags, page = SZX_RAMP.unpack_from(block, 0)
+            address = SZX_PAGES_48K.get(page)
+            if address is None:
+                raise SnapshotError(f"Unsupported page {page} in 48K .szx snapshot")
+            contents = block[SZX_RAMP.size:]
+            if flags & SZX_RAMP_COMPRESSED:
+                try:
+                    contents = zlib.decompress(contents)
+                except zlib.error as e:
+                    raise SnapshotError(f"Can't decompress page {page}: {e}") from e
+            if len(contents) != 16384:
+                raise SnapshotError(f"Page {page} has {len(contents)} bytes instead of 16384")
+            memory[address - RAM_START:address - RAM_START + 16384] = contents
+    if not registers_found:
+        raise SnapshotError("No Z80R block in .szx file")
+    snapshot.memory = bytes(memory)
+    return snapshot
+
+
+def encode_szx(snapshot: Snapshot, compression_level: int = 6) -> bytes:
+    def block(block_id: bytes, contents: bytes) -> bytes:
+        return SZX_BLOCK_HEADER.pack(block_id, len(contents)) + contents
+
+    parts = [
+        SZX_HEADER.pack(b'ZXST', 1, 4, SZX_MACHINE_48K, 0),
+        block(b'Z80R', SZX_Z80R.pack(
+            (snapshot.a << 8) | snapshot.f, snapshot.bc, snapshot.de, snapshot.hl,
+            (snapshot.ax << 8) | snapshot.fx, snapshot.bcx, snapshot.dex, snapshot.hlx,
+            snapshot.ix, snapshot.iy, snapshot.sp, snapshot.pc, snapshot.i, snapshot.r & 0xff,
+            1 if snapshot.iff1 else 0, 1 if snapshot.iff2 else 0, snapshot.im,
+            snapshot.tstates or 0, 0, 0, snapshot.memptr & 0xffff)),
+        block(b'SPCR', SZX_SPCR.pack(snapshot.border, 0, 0, snapshot.border, bytes(4))),
+    ]
+    for page, address in SZX_PAGES_48K.items():
+        contents = snapshot.memory[address - RAM_START:address - RAM_START + 16384]
+        parts.append(block(b'RAMP', SZX_RAMP.pack(SZX_RAMP_COMPRESSED, page) + zlib.compress(contents, compression_level)))
+    return b''.join(parts)
+
+
+DECODERS = {".sna": decode_sna, ".z80": decode_z80, ".szx": decode_szx}
+ENCODERS = {".sna": encode_sna, ".z80": encode_z80, ".szx": encode_szx}
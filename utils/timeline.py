@@ -0,0 +1,257 @@
+import random
+import time
+from array import array
+from bisect import bisect_right
+from typing import Callable, Optional
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT, SCREEN_WIDTH, SCREEN_HEIGHT
+from spectrum.machine_state import MachineState
+
+
+DEFAULT_KEYFRAME_INTERVAL = 50
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+KEYFRAME_BYTES = 65536 + SCREEN_WIDTH * SCREEN_HEIGHT
+
+
+def keyboard_state(spectrum: Spectrum) -> bytes:
+    keyboard = spectrum.keyboard
+    return bytes(keyboard.keyboard) + bytes([keyboard.joy[0]])
+
+
+def set_keyboard_state(spectrum: Spectrum, state: bytes) -> None:
+    keyboard = spectrum.keyboard
+    keyboard.keyboard[:] = state[:8]
+    keyboard.joy[0] = state[8]
+    keyboard.update_row_table()
+
+
+# Where predicate first became true: instruction at pc, started at frame relative tstates,
+# was instructions-th instruction executed in frame (counted from 1). If predicate already
+# held at the start of the searched range pc and tstates are of the next instruction and instructions is 0.
+class BisectResult:
+    def __init__(self, frame: int, pc: int, tstates: int, instructions: int) -> None:
+        self.frame = frame
+        self.pc = pc
+        self.tstates = tstates
+        self.instructions = instructions
+
+    def __repr__(self) -> str:
+        return f"BisectResult(frame={self.frame}, pc=0x{self.pc:04x}, tstates={self.tstates}, instructions={self.instructions})"
+
+
+# Recording of a session that can be seeked to any frame. Full MachineState is kept
+# every keyframe_interval frames and keyboard state whenever it changes; seeking restores
+# the nearest keyframe before the target and re-executes frames without rendering.
+# When keyframes don't fit into memory_budget every other one is dropped and interval doubled.
+class Timeline:
+    def __init__(self, spectrum: Spectrum,
+                 keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET) -> None:
+        if memory_budget < 2 * KEYFRAME_BYTES:
+            raise ValueError(f"Memory budget must allow at least two keyframes ({2 * KEYFRAME_BYTES} bytes); got {memory_budget}")
+        self.spectrum = spectrum
+        self.keyframe_interval = keyframe_interval
+        self.memory_budget = memory_budget
+
+        self.frame = 0
+        self.last_frame = 0
+        self.keyframe_frames: list[int] = []
+        self.keyframes: list[MachineState] = []
+        self.input_frames = array('q')
+        self.inputs: list[bytes] = []
+
+    def start(self) -> None:
+        self.frame = 0
+        self.last_frame = 0
+        self.keyframe_frames = [0]
+        self.keyframes = [self.spectrum.save_state()]
+        self.input_frames = array('q', [0])
+        self.inputs = [keyboard_state(self.spectrum)]
+
+    def memory_usage(self) -> int:
+        return len(self.keyframes) * KEYFRAME_BYTES + len(self.inputs) * (9 + 8)
+
+    # To be called after spectrum.end_frame() and processing input, before the next frame is executed
+    def frame_boundary(self) -> None:
+        self.frame += 1
+        if self.frame <= self.last_frame:
+            self._truncate()
+        self.last_frame = self.frame
+
+        state = keyboard_state(self.spectrum)
+        if state != self.inputs[-1]:
+            self.input_frames.append(self.frame)
+            self.inputs.append(state)
+
+        if self.frame % self.keyframe_interval == 0:
+            self.keyframe_frames.append(self.frame)
+            self.keyframes.append(self.spectrum.save_state())
+            if len(self.keyframes) * KEYFRAME_BYTES > self.memory_budget:
+                self._thin_keyframes()
+
+    def _truncate(self) -> None:
+        # Execution continues from earlier point (after seek) - recorded future is no longer valid
+        keep = bisect_right(self.keyframe_frames, self.frame - 1)
+        del self.keyframe_frames[keep:]
+        del self.keyframes[keep:]
+        keep = bisect_right(self.input_frames, self.frame - 1)
+        del self.input_frames[keep:]
+        del self.inputs[keep:]
+
+    def _thin_keyframes(self) -> None:
+        self.keyframe_interval *= 2
+        kept = [(frame, state) for frame, state in zip(self.keyframe_frames, self.keyframes) if frame % self.keyframe_interval == 0]
+        self.keyframe_frames = [frame for frame, _ in kept]
+        self.keyframes = [state for _, state in kept]
+
+    def input_at(self, frame: int) -> bytes:
+        return self.inputs[bisect_right(self.input_frames, frame) - 1]
+
+    def seek(self, frame: int) -> None:
+        if not 0 <= frame <= self.last_frame:
+            raise ValueError(f"Frame {frame} is not in recorded range 0..{self.last_frame}")
+
+        spectrum = self.spectrum
+        index = bisect_right(self.keyframe_frames, frame) - 1
+        current = self.keyframe_frames[index]
+        spectrum.restore_state(self.keyframes[index])
+        spectrum.update_screen()
+
+        rendering = spectrum.rendering
+        audio_sink = spectrum.audio_sink
+        spectrum.audio_sink = None
+        try:
+            while current < frame:
+                set_keyboard_state(spectrum, self.input_at(current))
+                # Only the frame just before the target needs to be drawn
+                spectrum.rendering = current == frame - 1 and rendering
+                spectrum.execute(TSTATES_PER_INTERRUPT)
+                spectrum.end_frame()
+                current += 1
+        finally:
+            spectrum.rendering = rendering
+            spectrum.audio_sink = audio_sink
+        set_keyboard_state(spectrum, self.input_at(frame))
+        self.frame = frame
+
+    # Finds the first instruction after which predicate holds, assuming that once true it stays true.
+    # Keyframes are bisected first, then frames between two keyframes are replayed one by one
+    # and only inside of the found frame instructions are stepped. Machine is left just after
+    # that instruction (or at the end if predicate never holds, in which case None is returned).
+    def bisect(self, predicate: Callable[[Spectrum], bool], start: int = 0, end: Optional[int] = None) -> Optional[BisectResult]:
+        end = self.last_frame if end is None else end
+        if not 0 <= start <= end <= self.last_frame:
+            raise ValueError(f"Range {start}..{end} is not in recorded range 0..{self.last_frame}")
+
+        spectrum = self.spectrum
+        self.seek(start)
+        if predicate(spectrum):
+            return BisectResult(start, spectrum.z80.regPC, spectrum.bus_access.tstates, 0)
+        self.seek(end)
+        if not predicate(spectrum):
+            return None
+
+        low = start
+        high = end
+        first = bisect_right(self.keyframe_frames, low)
+        last = bisect_right(self.keyframe_frames, high - 1)
+        while first < last:
+            middle = (first + last) // 2
+            spectrum.restore_state(self.keyframes[middle])
+            if predicate(spectrum):
+                high = self.keyframe_frames[middle]
+                last = middle
+            else:
+                low = self.keyframe_frames[middle]
+                first = middle + 1
+
+        rendering = spectrum.rendering
+        audio_sink = spectrum.audio_sink
+        spectrum.audio_sink = None
+        spectrum.rendering = False
+        try:
+            self.seek(low)
+            state = MachineState()
+            frame = low
+            while frame < high - 1:
+                spectrum.save_state(state)
+                spectrum.execute(TSTATES_PER_INTERRUPT)
+                spectrum.end_frame()
+                frame += 1
+                set_keyboard_state(spectrum, self.input_at(frame))
+                if predicate(spectrum):
+                    frame -= 1
+                    spectrum.restore_state(state)
+                    set_keyboard_state(spectrum, self.input_at(frame))
+                    break
+
+            self.frame = frame
+            instructions = 0
+            z80 = spectrum.z80
+            bus_access = spectrum.bus_access
+            while True:
+                pc = z80.regPC
+                tstates = bus_access.tstates
+                end_of_frame = spectrum.execute_one_instruction()
+                instructions += 1
+                if predicate(spectrum):
+                    return BisectResult(frame, pc, tstates, instructions)
+                if end_of_frame:
+                    # Predicate isn't monotonic - it held at the frame boundary only
+                    spectrum.end_frame()
+                    self.frame = frame + 1
+                    set_keyboard_state(spectrum, self.input_at(self.frame))
+                    return BisectResult(self.frame, z80.regPC, bus_access.tstates, 0)
+        finally:
+            spectrum.rendering = rendering
+            spectrum.audio_sink = audio_sink
+
+    def nearest_keyframe(self, frame: int) -> int:
+        return self.keyframe_frames[bisect_right(self.keyframe_frames, frame) - 1]
+
+
+def record(timeline: Timeline, frames: int, inputs: Optional[dict[int, bytes]] = None) -> None:
+    spectrum = timeline.spectrum
+    for frame in range(frames):
+        spectrum.execute(TSTATES_PER_INTERRUPT)
+        spectrum.end_frame()
+        if inputs is not None and frame + 1 in inputs:
+            set_keyboard_state(spectrum, inputs[frame + 1])
+        timeline.frame_boundary()
+
+
+# Records the same run headless with each keyframe interval and measures
+# average latency of seeking to random frames and memory used by keyframes.
+def benchmark_seek(spectrum: Spectrum,
+                   frames: int = 500,
+                   intervals: tuple[int, ...] = (10, 25, 50, 100),
+                   seeks: int = 20,
+                   seed: int = 0) -> list[dict[str, float]]:
+    initial_state = spectrum.save_state()
+    rendering = spectrum.rendering
+    spectrum.rendering = False
+    targets = random.Random(seed).sample(range(frames + 1), min(seeks, frames + 1))
+
+    results = []
+    try:
+        for interval in intervals:
+            spectrum.restore_state(initial_state)
+            timeline = Timeline(spectrum, interval)
+            timeline.start()
+            record(timeline, frames)
+
+            started = time.perf_counter_ns()
+            for target in targets:
+                timeline.seek(target)
+            seek_ms = (time.perf_counter_ns() - started) / (len(targets) * 1_000_000)
+            results.append({
+                "keyframe_interval": interval,
+                "seek_ms": seek_ms,
+                "memory_bytes": timeline.memory_usage(),
+            })
+    finally:
+        spectrum.restore_state(initial_state)
+        spectrum.rendering = rendering
+    return results
@@ -0,0 +1,155 @@
+import mmap
+import re
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from utils.trace_recorder import TRACE_DTYPE, REGISTERS, TraceRecorder, decode_record, load_trace
+
+FIELDS = ("pc", "opcode") + REGISTERS + ("tstates",)
+
+# Register fields of text traces: 'PC=8000', 'PC: 0x8000', 'af:$0044' and T-state in decimal as 't: 000123' or 'T=123'
+_TEXT_FIELD = re.compile(rb"\b(PC|AF|BC|DE|HL|SP|IX|IY|TSTATES|T)\s*[:=]\s*(?:0x|\$)?([0-9A-F]+)\b", re.IGNORECASE)
+
+
+# Chunks of an in-memory or memory mapped .npy trace
+def npy_chunks(trace: np.ndarray, chunk: int = 100_000) -> Iterator[np.ndarray]:
+    for start in range(0, len(trace), chunk):
+        yield np.asarray(trace[start:start + chunk])
+
+
+# Trace of a text log (Fuse, JSpeccy or show_registers like): a line per instruction with
+# fields as name and hexadecimal value. File is memory mapped and parsed chunk by chunk.
+# Returns chunks and fields found in the first instruction line (others are not compared).
+def text_chunks(filename: str, chunk: int = 100_000) -> tuple[Iterator[np.ndarray], tuple[str, ...]]:
+    def parse(line: bytes) -> dict[str, int]:
+        values = {}
+        for name, value in _TEXT_FIELD.findall(line):
+            name = name.lower().decode()
+            if name in ("t", "tstates"):
+                values["tstates"] = int(value)
+            else:
+                values[name] = int(value, 16)
+        return values
+
+    f = open(filename, "rb")
+    lines = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    fields: tuple[str, ...] = ()
+    first: Optional[dict[str, int]] = None
+    for line in iter(lines.readline, b""):
+        first = parse(line)
+        if "pc" in first:
+            fields = tuple(name for name in FIELDS if name in first)
+            break
+
+    def chunks() -> Iterator[np.ndarray]:
+        try:
+            records = np.zeros(chunk, dtype=TRACE_DTYPE)
+            count = 0
+            values = first
+            while values is not None:
+                if "pc" in values:
+                    record = records[count]
+                    for name in fields:
+                        record[name] = values.get(name, 0)
+                    count += 1
+                    if count == chunk:
+                        yield records.copy()
+                        count = 0
+                line = lines.readline()
+                values = parse(line) if line else None
+            if count > 0:
+                yield records[:count].copy()
+        finally:
+            lines.close()
+            f.close()
+
+    return chunks(), fields
+
+
+# Runs spectrum and yields its trace frame by frame
+def live_chunks(spectrum: Spectrum, frames: Optional[int] = None) -> Iterator[np.ndarray]:
+    # No frame has more instructions than HALT's fetches
+    recorder = TraceRecorder(spectrum, TSTATES_PER_INTERRUPT // 4 + 1)
+    frame = 0
+    while frames is None or frame < frames:
+        recorder.clear()
+        recorder.run_frames(1)
+        yield recorder.records()
+        frame += 1
+
+
+# Chunks of trace in a file: binary .npy (TraceRecorder.save_npy()) or text log
+def file_chunks(filename: str, chunk: int = 100_000) -> tuple[Iterator[np.ndarray], tuple[str, ...]]:
+    if filename.endswith(".npy"):
+        return npy_chunks(load_trace(filename), chunk), FIELDS
+    return text_chunks(filename, chunk)
+
+
+class Divergence:
+    def __init__(self, index: int, fields: list[str], before: tuple[np.ndarray, np.ndarray], after: tuple[np.ndarray, np.ndarray],
+                 compared: Sequence[str]) -> None:
+        # Number of the first instruction which differs, from the start of both traces
+        self.index = index
+        self.fields = fields
+        self.before = before
+        self.after = after
+        self.compared = compared
+
+    @property
+    def record(self) -> np.void: return self.after[0][0]
+
+    @property
+    def reference(self) -> np.void: return self.after[1][0]
+
+    def _format_reference(self, record: np.void) -> str:
+        if "opcode" in self.compared:
+            return decode_record(record)
+        return " ".join(f"{name.upper()}:{int(record[name]):04x}" for name in self.compared)
+
+    def __str__(self) -> str:
+        lines = [f"Traces differ at instruction {self.index} in {', '.join(self.fields)}"]
+        for offset in range(-len(self.before[0]), len(self.after[0])):
+            # Records before are indexed from the end
+            trace, reference = self.before if offset < 0 else self.after
+            marker = ">" if offset == 0 else " "
+            lines.append(f"{marker} {self.index + offset:10}   {decode_record(trace[offset])}")
+            lines.append(f"{marker} {'':10} = {self._format_reference(reference[offset])}")
+        return "\n".join(lines)
+
+
+# Compares two traces chunk by chunk and stops at the first record with a compared field
+# different. Returns None if they are the same until one of them ends.
+def compare(trace: Iterator[np.ndarray], reference: Iterator[np.ndarray], fields: Sequence[str] = FIELDS,
+            context: int = 10) -> Optional[Divergence]:
+    empty = np.zeros(0, dtype=TRACE_DTYPE)
+    left, right = empty, empty
+    left_before, right_before = empty, empty
+    index = 0
+    while True:
+        if len(left) == 0:
+            left = next(trace, None)
+        if len(right) == 0:
+            right = next(reference, None)
+        if left is None or right is None:
+            return None
+        length = min(len(left), len(right))
+        a, b = left[:length], right[:length]
+        different = np.zeros(length, dtype=bool)
+        for name in fields:
+            field_different = a[name] != b[name]
+            different |= field_different.any(axis=1) if field_different.ndim > 1 else field_different
+        if different.any():
+            i = int(np.argmax(different))
+            mismatched = [name for name in fields if np.any(a[i][name] != b[i][name])]
+            before = (np.concatenate((left_before, a[:i]))[-context:] if context else empty,
+                      np.concatenate((right_before, b[:i]))[-context:] if context else empty)
+            after = (a[i:i + context + 1], b[i:i + context + 1])
+            return Divergence(index + i, mismatched, before, after, fields)
+        index += length
+        if context:
+            left_before = np.concatenate((left_before, a))[-context:]
+            right_before = np.concatenate((right_before, b))[-context:]
+        left, right = left[length:], right[length:]
@@ -0,0 +1,104 @@
+import struct
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+from z80.instructions.instruction_def import decode_instruction
+
+# Record of one instruction, taken before it is executed: PC, four bytes at PC, registers
+# and T-state in frame. Fields are little endian and unaligned, same as in TRACE_DTYPE.
+RECORD = struct.Struct("<H4BHHHHHHHI")
+TRACE_DTYPE = np.dtype([
+    ("pc", "<u2"), ("opcode", "u1", (4,)),
+    ("af", "<u2"), ("bc", "<u2"), ("de", "<u2"), ("hl", "<u2"),
+    ("sp", "<u2"), ("ix", "<u2"), ("iy", "<u2"),
+    ("tstates", "<u4")
+])
+REGISTERS = ("af", "bc", "de", "hl", "sp", "ix", "iy")
+
+
+# Binary trace of the last 'size' executed instructions in a preallocated ring buffer, a fixed
+# size record per instruction (prefixed instructions are one record at the first prefix,
+# HALT has a record per repeated fetch). Records are kept as bytes while running and turned
+# into NumPy structured array only by records() or save_npy(), for decoding with decode_trace().
+class TraceRecorder:
+    def __init__(self, spectrum: Spectrum, size: int = 1_000_000) -> None:
+        self.spectrum = spectrum
+        self.size = size
+        self.buffer = bytearray(size * RECORD.size)
+        # Instructions recorded in total, including those already overwritten
+        self.count = 0
+        self._position = 0
+
+    def clear(self) -> None:
+        self.count = 0
+        self._position = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.size)
+
+    def execute(self, tstate_limit: int) -> None:
+        z80 = self.spectrum.z80
+        bus_access = z80.bus_access
+        mem = self.spectrum.memory.mem
+        execute_one_cycle = z80.execute_one_cycle
+        pack_into = RECORD.pack_into
+        buffer = self.buffer
+        record_size = RECORD.size
+        end = len(buffer)
+        position = self._position
+        count = self.count
+        try:
+            while bus_access.tstates < tstate_limit:
+                if not z80._prefixOpcode:
+                    pc = z80.regPC
+                    pack_into(
+                        buffer, position, pc,
+                        mem[pc], mem[(pc + 1) & 0xffff], mem[(pc + 2) & 0xffff], mem[(pc + 3) & 0xffff],
+                        z80.get_reg_AF(), (z80.regB << 8) | z80.regC, (z80.regD << 8) | z80.regE, (z80.regH << 8) | z80.regL,
+                        z80.regSP, z80.regIX, z80.regIY, bus_access.tstates
+                    )
+                    position += record_size
+                    if position == end:
+                        position = 0
+                    count += 1
+                execute_one_cycle()
+        finally:
+            self._position = position
+            self.count = count
+
+    def run_frames(self, frames: int) -> None:
+        for _ in range(frames):
+            self.execute(TSTATES_PER_INTERRUPT)
+            self.spectrum.end_frame()
+
+    # Recorded instructions, oldest first
+    def records(self) -> np.ndarray:
+        records = np.frombuffer(self.buffer, dtype=TRACE_DTYPE)
+        if self.count <= self.size:
+            return records[:self.count].copy()
+        start = self._position // RECORD.size
+        return np.concatenate((records[start:], records[:start]))
+
+    def save_npy(self, filename: str) -> None:
+        np.save(filename, self.records())
+
+
+# Memory mapped, so traces bigger than memory can be decoded or compared in parts
+def load_trace(filename: str) -> np.ndarray:
+    return np.load(filename, mmap_mode="r")
+
+
+def decode_record(record: np.void) -> str:
+    opcode = record["opcode"].tolist()
+    opcode_iter = iter(opcode)
+    instruction = decode_instruction(int(record["pc"]), lambda: next(opcode_iter)).to_str().strip()
+    registers = " ".join(f"{name.upper()}:{int(record[name]):04x}" for name in REGISTERS)
+    return f"{int(record['tstates']):06} {int(record['pc']):04x} {' '.join(f'{b:02x}' for b in opcode)} {instruction:20} {registers}"
+
+
+def decode_trace(records: Iterable[np.void]) -> Iterator[str]:
+    for record in records:
+        yield decode_record(record)
@@ -0,0 +1,42 @@
+import time
+import wave
+
+import numpy as np
+
+from spectrum.spectrum import Spectrum
+from spectrum.video import TSTATES_PER_INTERRUPT
+
+
+# Runs emulation without rendering or pacing and writes beeper and AY output to 16bit mono WAV file.
+# Returns ratio of rendered audio length to time it took (> 1 means faster than real time).
+def render_to_wav(spectrum: Spectrum, filename: str, frames: int) -> float:
+    blocks: list[np.ndarray] = []
+    spectrum.audio_sink = blocks.append
+    spectrum.rendering = False
+
+    started = time.perf_counter()
+    try:
+        for _ in range(frames):
+            spectrum.execute(TSTATES_PER_INTERRUPT)
+            spectrum.end_frame()
+    finally:
+        spectrum.audio_sink = None
+        spectrum.rendering = True
+    elapsed = time.perf_counter() - started
+
+    samples = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    with wave.open(filename, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(spectrum.beeper.sample_rate)
+        wav.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+
+    audio_length = len(samples) / spectrum.beeper.sample_rate
+    return audio_length / elapsed if elapsed > 0 else 0.0
+
+
+def render_snapshot_to_wav(snapshot: str, filename: str, seconds: float, ay: bool = True) -> float:
+    spectrum = Spectrum(ay=ay)
+    spectrum.init()
+    spectrum.load_sna(snapshot)
+    return render_to_wav(spectrum, filename, int(seconds * 50))
@@ -0,0 +1,142 @@
+import struct
+from array import array
+
+import numpy as np
+
+from spectrum.machine_state import STATE_STRUCT, CPU_STATE_LENGTH
+from spectrum.spectrum import Spectrum
+
+
+# Core state (see spectrum.machine_state) followed by beeper level, number of beeper events,
+# number of AY writes and selected AY register - sound events of a frame are only appended
+# so restoring their count is enough within a frame
+JOURNAL_STRUCT = struct.Struct(STATE_STRUCT.format + "Biii")
+CORE_STATE_LENGTH = len(STATE_STRUCT.unpack(bytes(STATE_STRUCT.size)))
+SCREEN_WORD_BYTES = 16
+
+DEFAULT_MAX_INSTRUCTIONS = 1_000_000
+
+
+# Reverse stepping for the debugger. Before each instruction its packed machine state
+# (about 100 bytes) and current length of the bus' write journal are stored; stepping
+# back undoes only the writes made since and unpacks the state. Needs spectrum.journaling on.
+# Video buffer as it was before each frame was drawn and video buffer and sound state at the
+# end of each frame (kept by step()) make restoring of screen and sound exact too.
+class WriteJournal:
+    def __init__(self, spectrum: Spectrum, max_instructions: int = DEFAULT_MAX_INSTRUCTIONS) -> None:
+        self.spectrum = spectrum
+        self.max_instructions = max_instructions
+        self.states = bytearray()
+        self.marks = array('q')
+        self.frame_start_buffers: dict[int, bytes] = {}
+        self.frame_ends: dict[int, tuple[bytes, tuple]] = {}
+
+    def __len__(self) -> int:
+        return len(self.marks)
+
+    def clear(self) -> None:
+        del self.states[:]
+        del self.marks[:]
+        self.frame_start_buffers.clear()
+        self.frame_ends.clear()
+        if self.spectrum.journaling:
+            del self.spectrum.bus_access.journal[:]
+
+    def record(self) -> None:
+        if len(self.marks) >= self.max_instructions:
+            self._drop_oldest(max(self.max_instructions // 4, 1))
+
+        spectrum = self.spectrum
+        bus_access = spectrum.bus_access
+        if bus_access.frames not in self.frame_start_buffers:
+            self.frame_start_buffers[bus_access.frames] = spectrum.video.buffer_m.tobytes()
+        beeper = spectrum.beeper
+        ay = spectrum.ay
+        self.marks.append(len(bus_access.journal))
+        self.states += JOURNAL_STRUCT.pack(
+            *spectrum.core_state(),
+            beeper.level, beeper.count, ay.count if ay is not None else 0, ay.selected if ay is not None else 0
+        )
+
+    # Records state and executes one instruction; returns True at the end of the frame
+    def step(self) -> bool:
+        self.record()
+        end_of_frame = self.spectrum.execute_one_instruction()
+        if end_of_frame:
+            spectrum = self.spectrum
+            self.frame_ends[spectrum.bus_access.frames] = (spectrum.video.buffer_m.tobytes(), spectrum.sound_state())
+        return end_of_frame
+
+    def step_back(self, count: int = 1) -> int:
+        count = min(count, len(self.marks))
+        if count == 0:
+            return 0
+
+        spectrum = self.spectrum
+        bus_access = spectrum.bus_access
+        journal = bus_access.journal
+        mem = spectrum.memory.mem
+
+        index = len(self.marks) - count
+        mark = self.marks[index]
+        for i in range(len(journal) - 1, mark - 1, -1):
+            entry = journal[i]
+            mem[entry >> 8] = entry & 0xff
+        del journal[mark:]
+
+        state = JOURNAL_STRUCT.unpack_from(self.states, index * JOURNAL_STRUCT.size)
+        del self.states[index * JOURNAL_STRUCT.size:]
+        del self.marks[index:]
+
+        current_frame = bus_access.frames
+        spectrum.set_core_state(state[:CORE_STATE_LENGTH])
+        self._restore_frame(current_frame, *state[CORE_STATE_LENGTH:])
+        spectrum.traps.refresh()
+        spectrum.update_screen()
+        return count
+
+    def _restore_frame(self, current_frame: int, beeper_level: int, beeper_count: int, ay_count: int, ay_selected: int) -> None:
+        spectrum = self.spectrum
+        frame = spectrum.bus_access.frames
+        video_buffer = spectrum.video.buffer_m
+        if frame != current_frame and frame in self.frame_ends:
+            end_buffer, sound = self.frame_ends[frame]
+            video_buffer[:] = end_buffer
+            spectrum.set_sound_state(sound)
+
+        # Screen words not drawn yet are as they were before the frame
+        drawn = min(spectrum.bus_access.next_screen_byte_index * SCREEN_WORD_BYTES, len(video_buffer))
+        start_buffer = self.frame_start_buffers.get(frame)
+        if start_buffer is not None:
+            video_buffer[drawn:] = start_buffer[drawn:]
+        # Frames from this one on are going to be executed again
+        for later in [later for later in self.frame_ends if later >= frame]:
+            del self.frame_ends[later]
+        for later in [later for later in self.frame_start_buffers if later > frame]:
+            del self.frame_start_buffers[later]
+
+        beeper = spectrum.beeper
+        beeper.level = beeper_level
+        beeper.count = beeper_count
+        ay = spectrum.ay
+        if ay is not None:
+            ay.count = ay_count
+            ay.selected = ay_selected
+            registers = list(ay.frame_registers)
+            for i in range(ay_count):
+                value = ay.write_values[i]
+                registers[value >> 8] = value & 0xff
+            ay.registers = registers
+
+    def _drop_oldest(self, count: int) -> None:
+        journal = self.spectrum.bus_access.journal
+        offset = self.marks[count]
+        del journal[:offset]
+        del self.states[:count * JOURNAL_STRUCT.size]
+        del self.marks[:count]
+        marks = np.frombuffer(self.marks, dtype=np.int64)
+        marks -= offset
+        oldest_frame = JOURNAL_STRUCT.unpack_from(self.states, 0)[CPU_STATE_LENGTH + 1]
+        for frames in (self.frame_start_buffers, self.frame_ends):
+            for frame in [frame for frame in frames if frame < oldest_frame]:
+                del frames[frame]
@@ -20,6 +20,10 @@ class ClockAndBusAccess:
         self.tstates += 4
         return t
 
+    # Takes back T-states of opcode fetch at given address (see z80.pc_traps)
+    def undo_fetch_opcode(self, address: int) -> None:
+        self.tstates -= 4
+
     def peekb(self, address: int) -> int:
         self.tstates += 3
         return self.memory.peekb(address)
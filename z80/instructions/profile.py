@@ -1,4 +1,8 @@
 from abc import ABC
+from array import array
+from bisect import bisect_left
+
+from z80.instructions.instruction_def import Instruction, decode_instruction
 
 
 class MemoryAccess(ABC):
@@ -108,3 +112,151 @@ class OutPort(MemoryAccess):
 
     def to_str(self) -> str:
         return f"out {self.tstates}{''.join(str(d) for d in self.delays)}"
+
+
+FETCH_OPCODE = 0
+PEEK_B = 1
+POKE_B = 2
+PEEK_W = 3
+POKE_W = 4
+ADDR_ON_BUS = 5
+IN_PORT = 6
+OUT_PORT = 7
+NO_MEMORY_ACCESS = 8
+
+# Contention delays of one record are packed in 4 bits each (a delay is at most 6 T-states)
+DELAY_BITS = 4
+DELAY_MASK = 0xf
+
+
+# Bus accesses stored in preallocated columns so recording does not allocate any objects.
+# Record is kind, address (port for port accesses), T-state (start of opcode fetch and byte accesses, end of word, address
+# on bus and port accesses - as in MemoryAccess objects), base T-states (of each cycle for word accesses),
+# number of contention delays and the delays packed by DELAY_BITS.
+# MemoryAccess objects are created only on request, by access(index).
+class AccessRecords:
+    def __init__(self, capacity: int = 32768) -> None:
+        self.count = 0
+        self.kinds = array('i', bytes(4 * capacity))
+        self.addresses = array('i', bytes(4 * capacity))
+        self.at_tstates = array('i', bytes(4 * capacity))
+        self.tstates = array('i', bytes(4 * capacity))
+        self.delay_counts = array('i', bytes(4 * capacity))
+        self.delays = array('i', bytes(4 * capacity))
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def add(self, kind: int, address: int, at_tstates: int, tstates: int, delay_count: int = 0, delays: int = 0) -> None:
+        i = self.count
+        if i == len(self.kinds):
+            self._grow()
+        self.kinds[i] = kind
+        self.addresses[i] = address
+        self.at_tstates[i] = at_tstates
+        self.tstates[i] = tstates
+        self.delay_counts[i] = delay_count
+        self.delays[i] = delays
+        self.count = i + 1
+
+    def _grow(self) -> None:
+        for column in (self.kinds, self.addresses, self.at_tstates, self.tstates, self.delay_counts, self.delays):
+            column.extend(column)
+
+    def delays_of(self, index: int) -> list[int]:
+        packed = self.delays[index]
+        return [(packed >> (i * DELAY_BITS)) & DELAY_MASK for i in range(self.delay_counts[index])]
+
+    def total_tstates(self, start: int, end: int) -> int:
+        total = 0
+        for i in range(start, end):
+            kind = self.kinds[i]
+            total += self.tstates[i] * (2 if kind == PEEK_W or kind == POKE_W else 1) + sum(self.delays_of(i))
+        return total
+
+    def access(self, index: int) -> MemoryAccess:
+        kind = self.kinds[index]
+        at_tstates = self.at_tstates[index]
+        tstates = self.tstates[index]
+        delays = self.delays_of(index)
+        if kind == PEEK_W:
+            return PeekW(at_tstates, tstates, tstates, *delays)
+        if kind == POKE_W:
+            return PokeW(at_tstates, tstates, tstates, *delays)
+        if kind == ADDR_ON_BUS:
+            return AddrOnBus(at_tstates, tstates, *delays)
+        if kind == IN_PORT:
+            return InPort(at_tstates, tstates, *delays)
+        if kind == OUT_PORT:
+            return OutPort(at_tstates, tstates, *delays)
+        return SINGLE_ACCESSES[kind](at_tstates, tstates, delays[0] if delays else 0)
+
+    def accesses(self, start: int, end: int) -> list[MemoryAccess]:
+        return [self.access(i) for i in range(start, end)]
+
+
+SINGLE_ACCESSES = {
+    FETCH_OPCODE: FetchOpcode,
+    PEEK_B: PeekB,
+    POKE_B: PokeB,
+    NO_MEMORY_ACCESS: NoMemoryAccess
+}
+
+
+# Instructions executed while profiling: address, T-state they started at, their first
+# (up to) four bytes and index of their first access record. Instruction objects (with
+# profile of MemoryAccess objects) are decoded only when an instruction is looked up.
+class ProfiledInstructions:
+    def __init__(self, records: AccessRecords, mem: memoryview, capacity: int = 20000) -> None:
+        self.records = records
+        self.mem = mem
+        self.count = 0
+        self.addresses = array('i', bytes(4 * capacity))
+        self.tstates = array('i', bytes(4 * capacity))
+        self.codes = array('q', bytes(8 * capacity))
+        self.record_starts = array('i', bytes(4 * capacity))
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def add(self, address: int, tstates: int, code: int, record_start: int) -> None:
+        i = self.count
+        if i == len(self.addresses):
+            for column in (self.addresses, self.tstates, self.codes, self.record_starts):
+                column.extend(column)
+        self.addresses[i] = address
+        self.tstates[i] = tstates
+        self.codes[i] = code
+        self.record_starts[i] = record_start
+        self.count = i + 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    # Index of instruction which started at given T-state or -1
+    def index_of(self, tstates: int) -> int:
+        i = bisect_left(self.tstates, tstates, 0, self.count)
+        return i if i < self.count and self.tstates[i] == tstates else -1
+
+    def record_range(self, index: int) -> tuple[int, int]:
+        end = self.record_starts[index + 1] if index + 1 < self.count else self.records.count
+        return self.record_starts[index], end
+
+    def __getitem__(self, index: int) -> Instruction:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        address = self.addresses[index]
+        code = self.codes[index]
+        ptr = [0]
+
+        def next_byte() -> int:
+            p = ptr[0]
+            ptr[0] += 1
+            return (code >> (p * 8)) & 0xff if p < 4 else self.mem[(address + p) & 0xffff]
+
+        instruction = decode_instruction(address, next_byte)
+        instruction.tstates = self.tstates[index]
+        instruction.profile = self.records.accesses(*self.record_range(index))
+        return instruction
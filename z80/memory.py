@@ -1,4 +1,9 @@
 import struct
+from typing import Callable
+
+
+def _ignore_write(_address: int) -> None:
+    pass
 
 
 # This implemnetation is from PyZX
@@ -14,7 +19,12 @@ class Memory:
         # Signed byte access
         self.signedbyte = struct.Struct('<b')
 
+        # 256 byte pages with PC traps (see z80.pc_traps) - writes there are reported
+        self.trap_pages = bytearray(256)
+        self.on_trap_page_write: Callable[[int], None] = _ignore_write
+
     def pokew(self, addr: int, word):
+        first = addr
         if addr % 0x4000 == 0x3fff:
             if self.mem_rw[addr//0x4000]:
                 self.mem[addr] = word % 256
@@ -25,6 +35,10 @@ class Memory:
             # if self.mem_rw[addr//0x4000]:  # It seems that simple comparison is faster
             if addr >= 16384:
                 self.wstruct.pack_into(self.mem, addr, word)
+        second = (first + 1) & 0xffff
+        if self.trap_pages[first >> 8] or self.trap_pages[second >> 8]:
+            self.on_trap_page_write(first)
+            self.on_trap_page_write(second)
 
     def peekw(self, addr: int) -> int:
         if addr == 65535:
@@ -37,6 +51,8 @@ class Memory:
             # if self.mem_rw[addr//0x4000]:  # It seems that simple comparison is faster
             if addr >= 16384:
                 self.mem[addr] = byte
+                if self.trap_pages[addr >> 8]:
+                    self.on_trap_page_write(addr)
         except Exception as error:
             print(addr, byte, type(addr), type(byte))
             raise error
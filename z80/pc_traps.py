@@ -0,0 +1,191 @@
+from typing import Callable, Optional
+
+from z80.z80_cpu import Z80CPU
+
+
+# Called with PC at trapped address. Returning None lets the instruction at that address
+# execute; returning an address skips it and continues from there. Returning BREAK takes back
+# the opcode fetch and stops execution (raises ExecutionBreak) before the instruction.
+TrapHandler = Callable[[Z80CPU], Optional[int]]
+
+BREAK = -1
+
+
+# Raised out of Z80CPU.execute() to stop it between two instructions
+class ExecutionBreak(Exception):
+    pass
+
+
+# Traps on program counter. There is no check of PC per instruction: only handlers of opcodes
+# found at trapped addresses are replaced (with ones that compare PC) so untrapped code runs
+# as fast as without traps. Trap is invoked after opcode fetch, so its M1 cycle (T-states and R)
+# is already accounted when handler runs.
+# Opcodes are read when trap is added. Writes through Memory to pages with traps re-arm
+# changed traps; after memory is replaced directly (snapshot loaded, state restored) call refresh().
+# break_next() stops execution before the next instruction, wherever it is, by switching CPU
+# to table of opcode handlers which all break - again without any check per instruction
+# (and, while CPU is halted, by its halted listener).
+# Traps and hooks are only for unprefixed opcodes: opcodes after DD/FD which are not IX/IY
+# instructions run from the original handlers.
+class PCTraps:
+    def __init__(self, z80: Z80CPU) -> None:
+        self.z80 = z80
+        self.cmds = z80._main_cmds
+        self.original_cmds = dict(z80._main_cmds)
+        z80._unprefixed_cmds = self.original_cmds
+        self._break_cmds = {opcode: self._break for opcode in self.original_cmds}
+        self.traps: dict[int, TrapHandler] = {}
+        self.opcode_hooks: dict[int, list[Callable[[], None]]] = {}
+        self.interrupt_listeners: list[Callable[[bool], None]] = []
+        self._opcodes: dict[int, int] = {}
+        self.hits = 0
+        self.memory = z80.bus_access.memory
+        self.memory.on_trap_page_write = self._written
+
+    def add(self, address: int, handler: TrapHandler) -> None:
+        self.remove(address)
+        self.traps[address] = handler
+        self._opcodes[address] = self.memory.mem[address]
+        self._update(self._opcodes[address])
+        self.memory.trap_pages[address >> 8] = 1
+
+    def remove(self, address: int) -> None:
+        if address in self.traps:
+            del self.traps[address]
+            self._update(self._opcodes.pop(address))
+            page = address >> 8
+            self.memory.trap_pages[page] = any(trapped >> 8 == page for trapped in self.traps)
+
+    # Hook is called before every execution of given (unprefixed) opcode, wherever it is.
+    # Any number of hooks can share an opcode, they are called in order they were added.
+    def hook_opcode(self, opcode: int, hook: Callable[[], None]) -> None:
+        hooks = self.opcode_hooks.setdefault(opcode, [])
+        if hook not in hooks:
+            hooks.append(hook)
+            self._update(opcode)
+
+    def unhook_opcode(self, opcode: int, hook: Callable[[], None]) -> None:
+        hooks = self.opcode_hooks.get(opcode)
+        if hooks is not None and hook in hooks:
+            hooks.remove(hook)
+            if not hooks:
+                del self.opcode_hooks[opcode]
+            self._update(opcode)
+
+    # Listener is called when CPU accepts interrupt (see Z80CPU.interrupt_listener); as with
+    # opcode hooks, any number of them can listen
+    def listen_interrupts(self, listener: Callable[[bool], None]) -> None:
+        if listener not in self.interrupt_listeners:
+            self.interrupt_listeners.append(listener)
+            self._update_interrupt_listener()
+
+    def unlisten_interrupts(self, listener: Callable[[bool], None]) -> None:
+        if listener in self.interrupt_listeners:
+            self.interrupt_listeners.remove(listener)
+            self._update_interrupt_listener()
+
+    def refresh(self) -> None:
+        mem = self.memory.mem
+        changed = [address for address, opcode in self._opcodes.items() if mem[address] != opcode]
+        for address in changed:
+            self.add(address, self.traps[address])
+
+    def break_next(self) -> None:
+        self.z80._main_cmds = self._break_cmds
+        self.z80.halted_listener = self._break_halted
+
+    def cancel_break(self) -> None:
+        self.z80._main_cmds = self.cmds
+        self.z80.halted_listener = None
+
+    def _break(self) -> None:
+        self.cancel_break()
+        self._take_back_fetch((self.z80.regPC - 1) & 0xffff)
+        raise ExecutionBreak()
+
+    # PC is not incremented while halted; CPU stays halted after the break
+    def _break_halted(self) -> None:
+        self.cancel_break()
+        self._take_back_fetch(self.z80.regPC)
+        raise ExecutionBreak()
+
+    def _take_back_fetch(self, address: int) -> None:
+        z80 = self.z80
+        z80.regPC = address
+        z80.regR -= 1
+        z80.bus_access.undo_fetch_opcode(address)
+
+    def clear(self) -> None:
+        self.traps.clear()
+        self._opcodes.clear()
+        self.opcode_hooks.clear()
+        self.interrupt_listeners.clear()
+        self._update_interrupt_listener()
+        self.cmds.update(self.original_cmds)
+        self.memory.trap_pages[:] = bytes(256)
+
+    def _written(self, address: int) -> None:
+        opcode = self._opcodes.get(address)
+        if opcode is not None and self.memory.mem[address] != opcode:
+            self.add(address, self.traps[address])
+
+    def _update_interrupt_listener(self) -> None:
+        listeners = tuple(self.interrupt_listeners)
+        if len(listeners) < 2:
+            self.z80.interrupt_listener = listeners[0] if listeners else None
+            return
+
+        def all_listeners(nmi: bool) -> None:
+            for listener in listeners:
+                listener(nmi)
+
+        self.z80.interrupt_listener = all_listeners
+
+    def _update(self, opcode: int) -> None:
+        z80 = self.z80
+        original = self.original_cmds[opcode]
+        hooks = self.opcode_hooks.get(opcode, [])
+        hook: Optional[Callable[[], None]] = None
+        if len(hooks) == 1:
+            hook = hooks[0]
+        elif hooks:
+            hook = self._all(tuple(hooks))
+        traps = {address: self.traps[address] for address, trap_opcode in self._opcodes.items() if trap_opcode == opcode}
+
+        if not traps:
+            self.cmds[opcode] = original if hook is None else self._hooked(hook, original)
+            return
+
+        def trapped() -> None:
+            address = (z80.regPC - 1) & 0xffff
+            handler = traps.get(address)
+            if handler is not None:
+                self.hits += 1
+                z80.regPC = address
+                target = handler(z80)
+                if target == BREAK:
+                    self._take_back_fetch(address)
+                    raise ExecutionBreak()
+                if target is not None:
+                    z80.regPC = target & 0xffff
+                    return
+                z80.regPC = (address + 1) & 0xffff
+            if hook is not None:
+                hook()
+            original()
+
+        self.cmds[opcode] = trapped
+
+    @staticmethod
+    def _all(hooks: tuple[Callable[[], None], ...]) -> Callable[[], None]:
+        def all_hooks() -> None:
+            for hook in hooks:
+                hook()
+        return all_hooks
+
+    @staticmethod
+    def _hooked(hook: Callable[[], None], original: Callable[[], None]) -> Callable[[], None]:
+        def hooked() -> None:
+            hook()
+            original()
+        return hooked
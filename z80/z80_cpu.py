@@ -1,4 +1,4 @@
-from typing import Callable
+from typing import Callable, Optional
 
 from z80.bus_access import ClockAndBusAccess
 
@@ -23,6 +23,15 @@ FLAG_SZHN_MASK = FLAG_SZ_MASK | HALFCARRY_MASK | ADDSUB_MASK
 FLAG_SZP_MASK = FLAG_SZ_MASK | PARITY_MASK
 FLAG_SZHP_MASK = FLAG_SZP_MASK | HALFCARRY_MASK
 
+# Complete internal state of the processor in order used by get_state/set_state
+STATE_ATTRIBUTES = (
+    "regA", "regB", "regC", "regD", "regE", "regH", "regL", "_sz5h3pnFlags", "carryFlag", "_flagQ", "_lastFlagQ",
+    "regAx", "regFx", "regBx", "regCx", "regDx", "regEx", "regHx", "regLx",
+    "regPC", "regIX", "regIY", "regSP", "regI", "regR", "regRbit7",
+    "ffIFF1", "ffIFF2", "pendingEI", "activeNMI", "activeINT", "modeINT", "halted", "pinReset", "memptr",
+    "_prefixOpcode"
+)
+
 
 # This implementation is more or less transcription of JSpeccy's Java implementation
 # from https://github.com/jsanchezv/JSpeccy/blob/master/src/main/java/z80core/Z80.java
@@ -30,7 +39,10 @@ class Z80CPU:
     def __init__(self, bus_access: ClockAndBusAccess) -> None:
         self.bus_access = bus_access
 
-        self.show_debug_info = False
+        # Called with True for NMI, False for INT when interrupt is accepted, before PC is pushed
+        self.interrupt_listener: Optional[Callable[[bool], None]] = None
+        # Called after every opcode fetch while halted, as no opcode handler runs then
+        self.halted_listener: Optional[Callable[[], None]] = None
 
         self.bus_access.tstates = 0
 
@@ -80,8 +92,6 @@ class Z80CPU:
         self._sz53n_subTable = [0] * 256
         self._sz53pn_subTable = [0] * 256
 
-        self.breakpointAt = [False] * 65536
-
         for idx in range(256):
             if idx > 0x7f:
                 self._sz53n_addTable[idx] |= SIGN_MASK
@@ -144,6 +154,9 @@ class Z80CPU:
             0xc7: self._rst0, 0xcf: self._rst8, 0xd7: self._rst16, 0xdf: self._rst24, 0xe7: self._rst32, 0xef: self._rst40, 0xf7: self._rst48, 0xff: self._rst56,
             0xcd: self._callnn, 0xdd: self._ix, 0xed: self._ed, 0xfd: self._iy,
         }
+        # Opcodes following DD/FD which are not IX/IY instructions run from here, so PCTraps,
+        # which patches _main_cmds, can keep them apart from unprefixed ones
+        self._unprefixed_cmds = self._main_cmds
 
         self._cbdict = {
             0x00: self._rlcb, 0x01: self._rlcc, 0x02: self._rlcd, 0x03: self._rlce, 0x04: self._rlch, 0x05: self._rlcl, 0x06: self._rlcfromhl, 0x07: self._rlc_a,
@@ -255,6 +268,8 @@ class Z80CPU:
         }
 
     def interruption(self) -> None:
+        if self.interrupt_listener is not None:
+            self.interrupt_listener(False)
         self._lastFlagQ = False
         self.halted = False
 
@@ -269,6 +284,8 @@ class Z80CPU:
         self.memptr = self.regPC
 
     def nmi(self) -> None:
+        if self.interrupt_listener is not None:
+            self.interrupt_listener(True)
         self._lastFlagQ = False
         self.halted = False
 
@@ -306,15 +323,9 @@ class Z80CPU:
             self.execute_one_cycle()
 
     def execute_one_cycle(self) -> None:
-        if self.show_debug_info:
-            self.show_registers()
-
         opcode = self.bus_access.fetch_opcode(self.regPC)
         self.regR += 1
 
-        # if self.prefixOpcode == 0 && breakpointAt.get(regPC):
-        #     opCode = NotifyImpl.breakpoint(regPC, opCode);
-
         if not self.halted:
             self.regPC = (self.regPC + 1) & 0xffff
 
@@ -326,7 +337,7 @@ class Z80CPU:
 
                 code = self._ixiydict.get(opcode)
                 if code is None:
-                    self._main_cmds[opcode]()
+                    self._unprefixed_cmds[opcode]()
                 else:
                     self.regIX = code(self.regIX)
 
@@ -340,7 +351,7 @@ class Z80CPU:
 
                 code = self._ixiydict.get(opcode)
                 if code is None:
-                    self._main_cmds[opcode]()
+                    self._unprefixed_cmds[opcode]()
                 else:
                     self.regIY = code(self.regIY)
             else:
@@ -354,6 +365,8 @@ class Z80CPU:
 
             # if execDone:
             #     NotifyImpl.execDone();
+        elif self.halted_listener is not None:
+            self.halted_listener()
 
         if self.activeNMI:
             self.activeNMI = False
@@ -363,40 +376,6 @@ class Z80CPU:
         if self.ffIFF1 and not self.pendingEI and self.bus_access.is_active_INT():
             self.interruption()
 
-        # if not self.ffIFF1 and not self.pendingEI and self.bus_access.is_active_INT():
-        #     self.show_debug_info = True
-
-    def show_registers(self):
-        print(
-              f"t: {self.bus_access.tstates:06} "
-              f"PC: 0x{self.regPC:04x} "
-              f"SP: 0x{self.regSP:04x} "
-              f"OPCODE: {self.bus_access.memory.peekb(self.regPC):02x}({self.bus_access.memory.peekb(self.regPC):03d}) "
-              f"A:0x{self.regA:02x} "
-              f"HL:0x{self.get_reg_HL():04x} "
-              f"BC:0x{self.get_reg_BC():04x} "
-              f"DE:0x{self.get_reg_DE():04x} "
-              f"F:0x{self.get_flags():02x} "
-              f"C:{(1 if self.carryFlag else 0)} "
-              f"N:{1 if self.is_add_sub_flag() else 0} "
-              f"PV:{1 if self.is_par_over_flag() else 0} "
-              f"3:{1 if self.is_bit3_flag() else 0} "
-              f"H:{1 if self.is_half_carry_flag() else 0} "
-              f"5:{1 if self.is_bit5_flag() else 0} "
-              f"Z:{1 if self.is_zero_flag() else 0} "
-              f"S:{1 if self.is_sign_flag() else 0} "
-              f"IFF1:{1 if self.ffIFF1 else 0} "
-              f"IFF2:{1 if self.ffIFF2 else 0} "
-              f"Mem: 0x{self.regPC:04x}: "
-              f"{self.bus_access.memory.peekb(self.regPC):02x}, "
-              f"{self.bus_access.memory.peekb(self.regPC + 1):02x}, "
-              f"{self.bus_access.memory.peekb(self.regPC + 2):02x}, "
-              f"{self.bus_access.memory.peekb(self.regPC + 3):02x}, "
-              f"{self.bus_access.memory.peekb(self.regPC + 4):02x}, "
-              f"{self.bus_access.memory.peekb(self.regPC + 5):02x}, "
-              f"{self.bus_access.memory.peekb(self.regPC + 6):02x}, "
-              f"{self.bus_access.memory.peekb(self.regPC + 7):02x}")
-
     def reset(self) -> None:
         if self.pinReset:
             self.pinReset = False
@@ -430,6 +409,14 @@ class Z80CPU:
         self._lastFlagQ = False
         self._prefixOpcode = 0x00
 
+    # Returns complete internal state as a tuple - much cheaper than Z80State as nothing is converted
+    def get_state(self) -> tuple:
+        d = self.__dict__
+        return tuple([d[name] for name in STATE_ATTRIBUTES])
+
+    def set_state(self, state: tuple) -> None:
+        self.__dict__.update(zip(STATE_ATTRIBUTES, state))
+
     def set_reg_A(self, value: int) -> None:
         self.regA = value & 0xff
 
@@ -3227,7 +3214,7 @@ class Z80CPU:
         self.regR += 1
         code = self._ixiydict.get(opcode)
         if code is None:
-            self._main_cmds[opcode]()
+            self._unprefixed_cmds[opcode]()
         else:
             self.regIX = code(self.regIX)
 
@@ -3556,7 +3543,7 @@ class Z80CPU:
         self.regR += 1
         code = self._ixiydict.get(opcode)
         if code is None:
-            self._main_cmds[opcode]()
+            self._unprefixed_cmds[opcode]()
         else:
             self.regIY = code(self.regIY)
 